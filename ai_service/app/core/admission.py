@@ -0,0 +1,95 @@
+import logging
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import redis
+from fastapi import HTTPException
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_STANDARD = "standard"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_STANDARD, PRIORITY_BULK)
+
+
+class AdmissionController:
+    """
+    Load shedding for the FastAPI process, per caller class (AIRequest.priority).
+
+    - In-flight: requests served in-process (sync completions, streams) are counted per class;
+      above ADMISSION_LIMITS[cls]["max_in_flight"] new ones are rejected.
+    - Queue depth: before dispatching to Celery, the backlog of the class's own queue on the broker
+      (LLEN, cached briefly) is compared with ADMISSION_LIMITS[cls]["max_queue_depth"].
+
+    Rejections raise HTTP 429 with Retry-After so well-behaved callers back off. A limit of 0 means
+    unlimited; interactive callers get generous limits so they keep being served while bulk work
+    is shed first.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        self._depths: Dict[str, Tuple[float, Optional[int]]] = {}  # queue -> (read at, depth)
+
+    @staticmethod
+    def limits(priority: str) -> Dict[str, float]:
+        return settings.ADMISSION_LIMITS.get(priority) or settings.ADMISSION_LIMITS[PRIORITY_STANDARD]
+
+    def _reject(self, priority: str, reason: str, detail: str):
+        retry_after = int(self.limits(priority).get("retry_after", 10))
+        metrics.ADMISSION_REJECTIONS.labels(priority, reason).inc()
+        logger.warning(f"Admission rejected ({priority}, {reason}): {detail}")
+        raise HTTPException(status_code=429, detail=f"AI service is busy: {detail}",
+                            headers={"Retry-After": str(retry_after)})
+
+    async def queue_depth(self, queue: str) -> Optional[int]:
+        """Backlog of one Celery queue; None when the broker cannot be read (fail open)."""
+        cached = self._depths.get(queue)
+        if cached and time.monotonic() - cached[0] < settings.ADMISSION_QUEUE_DEPTH_CACHE_SECONDS:
+            return cached[1]
+        try:
+            depth = await get_async_redis(settings.CELERY_BROKER_URL).llen(queue)
+        except redis.RedisError as e:
+            logger.warning(f"Queue depth unavailable for admission control: {e}")
+            depth = None
+        self._depths[queue] = (time.monotonic(), depth)
+        return depth
+
+    async def check_dispatch(self, priority: str, queue: str, items: int = 1):
+        """Raises 429 if queuing `items` more Celery jobs on this class's queue would exceed its backlog limit."""
+        max_depth = self.limits(priority).get("max_queue_depth", 0)
+        if not max_depth:
+            return
+        depth = await self.queue_depth(queue)
+        if depth is not None and depth + items > max_depth:
+            self._reject(priority, "queue_depth", f"{depth} tasks queued on {queue}, limit {max_depth:.0f}")
+
+    def acquire(self, priority: str):
+        """Counts an in-process request for its class; raises 429 if the class is at its limit."""
+        max_in_flight = self.limits(priority).get("max_in_flight", 0)
+        if max_in_flight and self._in_flight[priority] >= max_in_flight:
+            self._reject(priority, "in_flight",
+                         f"{self._in_flight[priority]} requests in flight, limit {max_in_flight:.0f} for {priority}")
+        self._in_flight[priority] += 1
+        metrics.ADMISSION_IN_FLIGHT.labels(priority).inc()
+
+    def release(self, priority: str):
+        self._in_flight[priority] -= 1
+        metrics.ADMISSION_IN_FLIGHT.labels(priority).dec()
+
+    @asynccontextmanager
+    async def in_flight(self, priority: str) -> AsyncIterator[None]:
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+
+admission = AdmissionController()
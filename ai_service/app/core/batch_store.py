@@ -0,0 +1,103 @@
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+META_KEY = "ai:batch:{batch_id}:meta"
+ITEMS_KEY = "ai:batch:{batch_id}:items"
+RESULTS_KEY = "ai:batch:{batch_id}:results"
+
+ITEM_QUEUED = "queued"
+ITEM_PROCESSING = "processing"
+ITEM_COMPLETED = "completed"
+ITEM_FAILED = "failed"
+ITEM_CANCELLED = "cancelled"
+ITEM_FINAL_STATES = (ITEM_COMPLETED, ITEM_FAILED, ITEM_CANCELLED)
+
+BATCH_QUEUED = "queued"
+BATCH_RUNNING = "running"
+BATCH_CANCELLING = "cancelling"
+BATCH_CANCELLED = "cancelled"
+BATCH_FINISHED = "finished"
+
+
+class BatchStore:
+    """
+    Redis persistence for batch completion jobs: the submitted items, one result slot per item and
+    a small meta hash (status, cancel flag, concurrency). Written by the Celery batch runner, read by
+    the API status endpoint. All keys expire after BATCH_TTL.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        self._redis = redis_client
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def _expire(self, pipe, batch_id: str):
+        for key in (META_KEY, ITEMS_KEY, RESULTS_KEY):
+            pipe.expire(key.format(batch_id=batch_id), settings.BATCH_TTL)
+
+    def create(self, items: List[Dict[str, Any]], max_concurrency: int,
+               meta: Optional[Dict[str, str]] = None) -> str:
+        batch_id = uuid.uuid4().hex
+        with self.redis.pipeline() as pipe:
+            pipe.hset(META_KEY.format(batch_id=batch_id), mapping={
+                "status": BATCH_QUEUED,
+                "total": len(items),
+                "max_concurrency": max_concurrency,
+                "cancelled": 0,
+                "created_at": time.time(),
+                **(meta or {}),
+            })
+            pipe.rpush(ITEMS_KEY.format(batch_id=batch_id), *[json.dumps(i, ensure_ascii=False) for i in items])
+            pipe.hset(RESULTS_KEY.format(batch_id=batch_id), mapping={
+                str(i): json.dumps({"status": ITEM_QUEUED}) for i in range(len(items))
+            })
+            self._expire(pipe, batch_id)
+            pipe.execute()
+        return batch_id
+
+    def get_meta(self, batch_id: str) -> Dict[str, str]:
+        return self.redis.hgetall(META_KEY.format(batch_id=batch_id))
+
+    def set_status(self, batch_id: str, status: str):
+        self.redis.hset(META_KEY.format(batch_id=batch_id), "status", status)
+
+    def get_items(self, batch_id: str) -> List[Dict[str, Any]]:
+        return [json.loads(raw) for raw in self.redis.lrange(ITEMS_KEY.format(batch_id=batch_id), 0, -1)]
+
+    def set_result(self, batch_id: str, index: int, result: Dict[str, Any]):
+        self.redis.hset(RESULTS_KEY.format(batch_id=batch_id), str(index), json.dumps(result, ensure_ascii=False))
+
+    def get_results(self, batch_id: str) -> Dict[int, Dict[str, Any]]:
+        raw = self.redis.hgetall(RESULTS_KEY.format(batch_id=batch_id))
+        return {int(k): json.loads(v) for k, v in raw.items()}
+
+    def is_cancelled(self, batch_id: str) -> bool:
+        return self.redis.hget(META_KEY.format(batch_id=batch_id), "cancelled") == "1"
+
+    def cancel(self, batch_id: str) -> bool:
+        """Flags the batch as cancelled. Items not yet started will not be sent to any provider."""
+        meta_key = META_KEY.format(batch_id=batch_id)
+        status = self.redis.hget(meta_key, "status")
+        if status is None:
+            return False
+        if status in (BATCH_FINISHED, BATCH_CANCELLED):
+            return True
+        with self.redis.pipeline() as pipe:
+            pipe.hset(meta_key, "cancelled", 1)
+            pipe.hset(meta_key, "status", BATCH_CANCELLING)
+            pipe.execute()
+        return True
+
+
+batch_store = BatchStore()
@@ -0,0 +1,77 @@
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.llm_providers.http_clients import get_sync_http_client
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_TOKEN_HEADER = "X-AI-Callback-Token"
+
+
+def build_callback_body(task_id: str, result: Dict[str, Any], metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Same fields as AIResponse from /api/v1/task_status, plus the caller's metadata echoed back."""
+    return {
+        "task_id": task_id,
+        "success": bool(result.get("content")) and not result.get("error"),
+        "content": result.get("content"),
+        "error": result.get("error"),
+        "provider_name": result.get("provider_name"),
+        "model_used": result.get("model_used"),
+        "metadata": metadata or {},
+    }
+
+
+def _post(url: str, body: Dict[str, Any]) -> bool:
+    headers = {CALLBACK_TOKEN_HEADER: settings.CALLBACK_TOKEN} if settings.CALLBACK_TOKEN else {}
+    for attempt in range(settings.CALLBACK_MAX_ATTEMPTS):
+        try:
+            response = get_sync_http_client().post(url, json=body, headers=headers,
+                                                   timeout=settings.CALLBACK_TIMEOUT)
+            if response.status_code < 400:
+                return True
+            if response.status_code < 500 and response.status_code != 429:
+                # 4xx 重试也不会成功（例如令牌错误或提交已删除）
+                logger.error(f"Callback to {url} rejected with {response.status_code}: {response.text[:200]}")
+                return False
+            logger.warning(f"Callback to {url} failed with {response.status_code} (attempt {attempt + 1}).")
+        except httpx.HTTPError as e:
+            logger.warning(f"Callback to {url} failed (attempt {attempt + 1}): {e}")
+        if attempt < settings.CALLBACK_MAX_ATTEMPTS - 1:
+            time.sleep(settings.CALLBACK_RETRY_DELAY * (2 ** attempt))
+    return False
+
+
+def _publish(channel: str, body: Dict[str, Any]) -> bool:
+    try:
+        get_redis().publish(channel, json.dumps(body, ensure_ascii=False))
+        return True
+    except redis.RedisError as e:
+        logger.warning(f"Publishing callback to channel {channel} failed: {e}")
+        return False
+
+
+def deliver_callback(ai_payload: Dict[str, Any], task_id: str, result: Dict[str, Any]) -> bool:
+    """
+    Pushes a finished task's result to the callback_url and/or callback_channel of its AIRequest.
+    Returns False if a requested delivery failed; callers keep the result in the Celery backend
+    either way, so a missed callback is still picked up by status polling.
+    """
+    url, channel = ai_payload.get("callback_url"), ai_payload.get("callback_channel")
+    if not url and not channel:
+        return True
+    body = build_callback_body(task_id, result, ai_payload.get("callback_metadata"))
+    delivered = True
+    if url:
+        delivered = _post(url, body) and delivered
+    if channel:
+        delivered = _publish(channel, body) and delivered
+    if delivered:
+        logger.info(f"Callback for task {task_id} delivered.")
+    return delivered
@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings  # pydantic v2
-from typing import Optional
+from typing import Dict, Optional
 
 # 项目根目录的 .env 文件
 # 注意：这里的路径假设 ai_service 是 eduSys 的子目录
@@ -10,6 +10,8 @@ from typing import Optional
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 load_dotenv(os.path.join(BASE_DIR, '.env'))
 
+GREEN_POOLS = ("gevent", "eventlet")  # 协程式 Celery worker 池：网络等待时让出，单进程可同时挂起大量请求
+
 
 # print(f"Loading .env from: {os.path.join(BASE_DIR, '.env')}") # 用于调试
 
@@ -37,10 +39,139 @@ class Settings(BaseSettings):
     # Celery
     CELERY_BROKER_URL: str = "redis://localhost:6379/1"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/2"
+    CELERY_WORKER_CONCURRENCY: int = 10  # 每个 worker 进程的并发任务数
+    # Worker 池类型：prefork（默认，每个任务占一个进程）或 gevent / eventlet（协程池，适合几乎全在等网络的 LLM 任务）。
+    # 协程池必须通过命令行 -P 指定才会尽早 monkey-patch，run_worker.sh 会根据 AI_WORKER_POOL 同时设置两者
+    CELERY_WORKER_POOL: str = "prefork"
+    CELERY_IO_WORKER_CONCURRENCY: int = 200  # 协程池下每个 worker 同时执行的任务数
+    # 各优先级使用独立的 Celery 队列，由 run_worker.sh 为每条队列启动独立的 worker 池
+    PRIORITY_QUEUES: Dict[str, str] = {
+        "interactive": "ai_interactive_queue",
+        "standard": "ai_long_running_queue",
+        "bulk": "ai_bulk_queue",
+    }
+    # 各优先级的端到端 SLO（秒，从 API 受理到任务完成），超出时计入 ai_slo_breaches_total
+    PRIORITY_SLO_SECONDS: Dict[str, float] = {"interactive": 30, "standard": 600, "bulk": 3600}
+
+    # 共享状态（路由健康度等），API 与 Celery worker 共用
+    REDIS_URL: str = "redis://localhost:6379/3"
+    REDIS_SOCKET_TIMEOUT: float = 1.0
 
     # AI Router
     DEFAULT_TIMEOUT: int = 120  # 默认超时时间（秒）
     RETRY_ATTEMPTS: int = 2  # 默认重试次数
+    RETRY_BACKOFF_BASE: float = 0.5  # 指数退避基数（秒），实际等待为 [0, base * 2^attempt] 随机
+    RETRY_BACKOFF_MAX: float = 10.0  # 单次退避上限（秒）
+    RETRY_AFTER_MAX: float = 30.0  # 采纳供应商 Retry-After 的上限（秒）
+    ROUTER_EWMA_ALPHA: float = 0.3  # 延迟与错误率 EWMA 平滑系数
+    ROUTER_FAILURE_THRESHOLD: int = 3  # 连续失败多少次后熔断
+    ROUTER_ERROR_RATE_THRESHOLD: float = 0.5  # EWMA 错误率超过该值后熔断
+    ROUTER_MIN_SAMPLES: int = 5  # 错误率熔断所需的最少样本数
+    ROUTER_OPEN_SECONDS: float = 30.0  # 熔断后多久放行探测请求
+    ROUTER_PROBE_TIMEOUT: int = 120  # 探测请求的锁超时（秒）
+    ROUTER_STATE_CACHE_SECONDS: float = 1.0  # 进程内缓存路由状态的时间
+
+    # Provider 限流（所有 API 进程与 Celery worker 共享，0 表示不限制）
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_DEFAULT_RPM: int = 600  # 每个 Provider/模型每分钟请求数
+    RATE_LIMIT_DEFAULT_TPM: int = 0  # 每个 Provider/模型每分钟 token 数（按估算值扣减）
+    PROVIDER_MAX_CONCURRENCY: int = 32  # 每个 Provider 同时进行中的请求数
+    # 覆盖默认值，键为 "<Provider>" 或 "<Provider>:<model>"，
+    # 例如 RATE_LIMITS='{"DeepSeek": {"rpm": 300, "tpm": 500000, "concurrency": 16}}'
+    RATE_LIMITS: Dict[str, Dict[str, int]] = {}
+    RATE_LIMIT_DEFAULT_COMPLETION_TOKENS: int = 1024  # 请求未指定 max_tokens 时按此估算输出 token
+    RATE_LIMIT_MAX_WAIT: float = 120.0  # Celery 任务排队等待限流的最长时间（秒），超时后换下一个 Provider
+    RATE_LIMIT_MAX_WAIT_INTERACTIVE: float = 10.0  # API 同步请求排队等待的最长时间（秒）
+    RATE_LIMIT_SLOT_POLL_INTERVAL: float = 0.2  # 等待并发名额时的轮询间隔（秒）
+
+    # Response cache
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL: int = 7 * 24 * 3600  # 缓存有效期（秒）
+    RESPONSE_CACHE_MAX_ENTRIES: int = 20000  # 超出后按最近访问时间淘汰
+
+    # Single-flight：相同请求并发时只调用一次 Provider
+    SINGLEFLIGHT_ENABLED: bool = True
+    SINGLEFLIGHT_LOCK_TTL: int = 1800  # 跨进程执行锁的过期时间（秒），应不小于最长调用耗时
+    SINGLEFLIGHT_RESULT_TTL: int = 30  # 执行结果为等待者保留的时间（秒）
+    SINGLEFLIGHT_WAIT_TIMEOUT: float = 1800.0  # 等待其他 worker 结果的最长时间（秒）
+    SINGLEFLIGHT_POLL_INTERVAL: float = 0.5  # 等待其他 worker 结果时的轮询间隔（秒）
+    SINGLEFLIGHT_TASK_TTL: int = 1800  # Celery task_id 去重记录的过期时间（秒），与任务 time_limit 对齐
+
+    # Hedged requests（仅对请求中 hedge=true 的短请求生效）
+    HEDGE_PERCENTILE: float = 0.9  # 主 Provider 超过其近期延迟的该分位数仍未返回时，向第二个 Provider 发出对冲请求
+    HEDGE_MIN_DELAY_MS: float = 300.0  # 对冲等待下限
+    HEDGE_MAX_DELAY_MS: float = 10000.0  # 对冲等待上限
+    HEDGE_DEFAULT_DELAY_MS: float = 3000.0  # 延迟样本不足时的对冲等待
+    HEDGE_LATENCY_WINDOW: int = 200  # 每个 Provider 保留的延迟样本数
+    HEDGE_MIN_SAMPLES: int = 20  # 计算分位数所需的最少样本数
+    HEDGE_SAMPLES_CACHE_SECONDS: float = 5.0  # 进程内缓存延迟样本的时间
+
+    # 模型档位（AIRequest.model_tier="auto" 时由 ModelTierPolicy 在快速模型与推理模型间选择）
+    MODEL_TIER_FAST_MAX_PROMPT_TOKENS: int = 6000  # 不超过该 prompt token 数的请求先用快速模型
+    MODEL_TIER_ESCALATE: bool = True  # 快速模型的回答未通过校验（空 / 非 JSON / 缺少 required_keys）时改用推理模型重试
+    MODEL_TIER_LATENCY_PERCENTILE: float = 0.9  # 与 latency_budget 比较时使用的档位延迟分位数
+    MODEL_TIER_LATENCY_WINDOW: int = 200  # 每个档位保留的延迟样本数
+    MODEL_TIER_MIN_SAMPLES: int = 10  # 样本不足时使用下面的默认延迟
+    MODEL_TIER_DEFAULT_LATENCY_MS: Dict[str, float] = {"fast": 5000.0, "reasoning": 60000.0}
+
+    # 准入控制（按 AIRequest.priority 分级，0 表示不限制）
+    # max_in_flight: API 进程内同步/流式请求的并发上限；max_queue_depth: 分发到 Celery 前允许的队列积压上限；
+    # retry_after: 拒绝时返回给调用方的 Retry-After（秒）
+    ADMISSION_LIMITS: Dict[str, Dict[str, float]] = {
+        "interactive": {"max_in_flight": 200, "max_queue_depth": 0, "retry_after": 2},
+        "standard": {"max_in_flight": 100, "max_queue_depth": 2000, "retry_after": 15},
+        "bulk": {"max_in_flight": 20, "max_queue_depth": 500, "retry_after": 60},
+    }
+    ADMISSION_QUEUE_DEPTH_CACHE_SECONDS: float = 1.0  # 队列积压读数的缓存时间
+
+    # 任务完成回调（AIRequest.callback_url / callback_channel）
+    CALLBACK_TOKEN: Optional[str] = None  # 回调请求头 X-AI-Callback-Token 的值，需与接收方配置一致
+    CALLBACK_TIMEOUT: float = 10.0  # 单次回调请求超时（秒）
+    CALLBACK_MAX_ATTEMPTS: int = 3  # 回调失败（5xx/网络错误）时的最多尝试次数
+    CALLBACK_RETRY_DELAY: float = 1.0  # 回调重试的初始等待（秒），按指数增长
+
+    # 幂等键（AIRequest.idempotency_key）与其 Celery task_id 的保留时间（秒），覆盖调用方的最长重试窗口
+    IDEMPOTENCY_TTL: int = 24 * 3600
+
+    # 批量查询任务状态
+    TASK_STATUS_BATCH_MAX: int = 500  # /api/v1/task_status/batch 单次最多查询的 task_id 数
+
+    # Batch completions
+    BATCH_MAX_ITEMS: int = 500  # 单个批次最多包含的请求数
+    BATCH_DEFAULT_CONCURRENCY: int = 8  # 批次内默认并发数
+    BATCH_MAX_CONCURRENCY: int = 32  # 批次内允许的最大并发数
+    BATCH_PROVIDER_CONCURRENCY: int = 4  # 单个批次对同一 Provider 的最大并发数
+    BATCH_TTL: int = 2 * 24 * 3600  # 批次状态与结果在 Redis 中的保留时间（秒）
+    BATCH_TIME_LIMIT: int = 3 * 3600  # 批次任务的硬超时（秒）
+
+    # HTTP 连接池（所有 Provider 共享，按进程维度）
+    HTTP_MAX_CONNECTIONS: int = 200  # 单进程到所有 Provider 的最大并发连接数（协程池下不低于 CELERY_IO_WORKER_CONCURRENCY）
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 50  # 保持活跃的空闲连接数
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # 空闲连接保留时间（秒）
+    HTTP_CONNECT_TIMEOUT: float = 10.0  # 建立连接的超时时间（秒）
+
+    # Mock Provider（离线压测 / 本地开发），开启后只注册 MockProvider，见 benchmarks/loadtest.py
+    MOCK_LLM_MODE: bool = False
+    MOCK_LLM_LATENCY_MEDIAN: float = 1.0  # 普通模型耗时中位数（秒），按对数正态分布抽样
+    MOCK_LLM_REASONING_LATENCY_MEDIAN: float = 20.0  # 推理模型耗时中位数（秒）
+    MOCK_LLM_LATENCY_SIGMA: float = 0.5  # 对数正态分布的 sigma，0 表示固定耗时
+    MOCK_LLM_ERROR_RATE: float = 0.0  # 返回 500 错误的概率
+    MOCK_LLM_THROTTLE_RATE: float = 0.0  # 返回 429（带 Retry-After）的概率
+    MOCK_LLM_COMPLETION_TOKENS: int = 200  # 每次生成的 token 数（max_tokens 更小时以其为准）
+    MOCK_LLM_SEED: Optional[int] = None  # 固定随机种子以便复现
+
+    # Streaming
+    STREAM_METRICS_WINDOW: int = 500  # 统计首 token 延迟时保留的最近样本数
+
+    # 日志（经有界队列由后台线程写出，见 app/core/logging_setup.py）
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"  # text | json（每行一个 JSON 对象）
+    LOG_QUEUE_SIZE: int = 10000  # 日志队列上限，写出跟不上时丢弃新记录而不阻塞请求
+    LOG_PROMPT_MODE: str = "truncate"  # 普通日志中的提示词：truncate（截断预览）| hash（仅长度与摘要）| full（完整，仅调试）
+    LOG_PROMPT_MAX_CHARS: int = 200  # truncate 模式下每条消息保留的字符数
+    LOG_PROMPT_SAMPLE_RATE: float = 1.0  # truncate 模式下输出预览的比例，其余只记录长度与摘要
+    AUDIT_LOG_PATH: Optional[str] = None  # 完整请求/结果的 JSONL 审计日志路径，支持 {pid} 占位符；为空则关闭
+    AUDIT_LOG_SAMPLE_RATE: float = 1.0  # 写入审计日志的请求比例
 
     class Config:
         env_file = os.path.join(BASE_DIR, '.env')
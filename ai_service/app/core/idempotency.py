@@ -0,0 +1,64 @@
+import logging
+from typing import Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY = "ai:idempotency:{key}"  # 调用方提供的幂等键 -> 为其创建的 Celery task_id
+
+
+class IdempotencyStore:
+    """
+    Maps a caller supplied idempotency key to the Celery task created for it, so a client that
+    retries a dispatch (e.g. after a timeout, without knowing whether the first POST went through)
+    gets the original task_id back instead of a second task. Unlike single-flight task dedup the
+    mapping outlives the task for IDEMPOTENCY_TTL. Redis errors fail open: the request is dispatched.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        self._redis = redis_client
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            return self.redis.get(IDEMPOTENCY_KEY.format(key=key))
+        except redis.RedisError as e:
+            logger.warning(f"Idempotency lookup unavailable: {e}")
+            return None
+
+    def claim(self, key: str, task_id: str) -> Optional[str]:
+        """Registers task_id for key. Returns the task id a concurrent request registered first, else None."""
+        redis_key = IDEMPOTENCY_KEY.format(key=key)
+        try:
+            if self.redis.set(redis_key, task_id, nx=True, ex=settings.IDEMPOTENCY_TTL):
+                return None
+            return self.redis.get(redis_key)
+        except redis.RedisError as e:
+            logger.warning(f"Idempotency claim unavailable: {e}")
+            return None
+
+    def repoint(self, key: str, task_id: str):
+        """Points an existing claim at another task (the in-flight identical task the request was merged into)."""
+        try:
+            self.redis.set(IDEMPOTENCY_KEY.format(key=key), task_id, xx=True, ex=settings.IDEMPOTENCY_TTL)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to update idempotency key: {e}")
+
+    def release(self, key: str):
+        """Forgets a claim whose task could not be dispatched, so the client's retry dispatches again."""
+        try:
+            self.redis.delete(IDEMPOTENCY_KEY.format(key=key))
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release idempotency key: {e}")
+
+
+idempotency_store = IdempotencyStore()
@@ -1,9 +1,19 @@
+import asyncio
 import random
+import threading
 import time  # MODIFIED: Import time for sleep
-from typing import List, Optional
+from collections import deque
+from contextlib import nullcontext
+from typing import List, Optional, AsyncIterator, Dict, Any
 from app.llm_providers.base_provider import BaseLLMProvider, LLMRequest, LLMResponse
 from app.llm_providers import get_provider_instances
 from app.core.config import settings
+from app.core.provider_health import provider_health, compute_backoff
+from app.core.rate_limiter import rate_limiter
+from app.core import metrics
+from app.core.model_tiers import model_tier_policy
+from app.core.response_cache import response_cache, request_cache_key
+from app.core.singleflight import singleflight
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,64 +24,388 @@ class LLMRouter:
         self.providers: List[BaseLLMProvider] = get_provider_instances()
         if not self.providers:
             logger.error("No LLM providers initialized. AI service will not function.")
-        self.current_provider_index = 0  # For round-robin
+        self.health = provider_health
+        self.cache = response_cache
+        self.singleflight = singleflight
+        self.limiter = rate_limiter
+        self.tiers = model_tier_policy
+        # 最近若干次流式请求的首 token 延迟（毫秒），用于 /api/v1/chat/completions/stream/metrics
+        self.ttft_samples_ms = deque(maxlen=settings.STREAM_METRICS_WINDOW)
+
+    @staticmethod
+    def _name(provider: BaseLLMProvider) -> str:
+        return getattr(provider, 'provider_name', 'UnknownProvider')
+
+    def _select_providers(self, provider_name: Optional[str] = None) -> List[BaseLLMProvider]:
+        """
+        An explicitly requested provider is always used as-is (its circuit state is ignored).
+        Otherwise healthy providers are ordered by weighted latency/error score, see ProviderHealthTracker.
+        """
+        if provider_name:
+            for p in self.providers:
+                if self._name(p).lower() == provider_name.lower():
+                    return [p]
+            return []
+        by_name = {self._name(p): p for p in self.providers}
+        return [by_name[n] for n in self.health.order_providers(list(by_name))]
+
+    def _record(self, provider: BaseLLMProvider, request: LLMRequest, response: LLMResponse,
+                latency_ms: float) -> bool:
+        ok = bool(response.content and not response.error)
+        metrics.record_provider_call(self._name(provider), response.model_used, "success" if ok else "error",
+                                     latency_ms / 1000, response.prompt_tokens, response.completion_tokens)
+        if ok:
+            self.health.record_success(self._name(provider), latency_ms)
+            self.tiers.record_latency(request, latency_ms)
+        else:
+            self.health.record_failure(self._name(provider), latency_ms)
+        return ok
+
+    def _model(self, provider: BaseLLMProvider, request: LLMRequest) -> str:
+        return request.model or provider.get_model_name(request.use_reasoning_model)
+
+    def _throttled(self, provider: BaseLLMProvider, request: LLMRequest, max_wait: float) -> LLMResponse:
+        # 本地限流不是 Provider 的故障，不计入健康度
+        metrics.record_provider_call(self._name(provider), self._model(provider, request), "throttled", 0)
+        return LLMResponse(error=f"Rate limit for {self._name(provider)} not available within {max_wait:.0f}s.",
+                           provider_name=self._name(provider), model_used=self._model(provider, request))
+
+    def _call_provider(self, provider: BaseLLMProvider, request: LLMRequest,
+                       provider_slots: Optional[Dict[str, threading.Semaphore]] = None) -> LLMResponse:
+        slot = provider_slots.get(self._name(provider)) if provider_slots else None
+        max_wait = settings.RATE_LIMIT_MAX_WAIT
+        with slot or nullcontext(), \
+                self.limiter.limit(self._name(provider), self._model(provider, request), request, max_wait) as allowed:
+            if not allowed:
+                return self._throttled(provider, request, max_wait)
+            started = time.monotonic()
+            try:
+                response = provider.generate_response(request)
+            except Exception as e:
+                logger.error(f"Exception with provider {self._name(provider)}: {e}", exc_info=True)
+                response = LLMResponse(error=str(e), provider_name=self._name(provider))
+        self._record(provider, request, response, (time.monotonic() - started) * 1000)
+        return response
+
+    async def _acall_provider(self, provider: BaseLLMProvider, request: LLMRequest) -> LLMResponse:
+        max_wait = settings.RATE_LIMIT_MAX_WAIT_INTERACTIVE
+        async with self.limiter.alimit(self._name(provider), self._model(provider, request), request,
+                                       max_wait) as allowed:
+            if not allowed:
+                return self._throttled(provider, request, max_wait)
+            started = time.monotonic()
+            try:
+                response = await provider.agenerate_response(request)
+            except Exception as e:
+                logger.error(f"Exception with provider {self._name(provider)}: {e}", exc_info=True)
+                response = LLMResponse(error=str(e), provider_name=self._name(provider))
+        # Redis 读写放到线程池，避免阻塞事件循环
+        await asyncio.to_thread(self._record, provider, request, response, (time.monotonic() - started) * 1000)
+        return response
+
+    def _cache_key(self, request: LLMRequest, provider_name: Optional[str] = None) -> Optional[str]:
+        return request_cache_key(request, provider_name) if self.cache.is_cacheable(request) else None
+
+    @staticmethod
+    def coalesce_key(request: LLMRequest, provider_name: Optional[str] = None) -> Optional[str]:
+        """Key for single-flight deduplication; identical to the cache key. None when the caller opted out."""
+        if not settings.SINGLEFLIGHT_ENABLED or request.cache is False:
+            return None
+        return request_cache_key(request, provider_name)
+
+    def get_cached_response(self, request: LLMRequest, provider_name: Optional[str] = None) -> Optional[LLMResponse]:
+        planned, _ = self.tiers.plan(request)
+        key = self._cache_key(planned, provider_name)
+        cached = self.cache.get(key) if key else None
+        # 缓存中快速模型的回答未通过校验时交给完整路径（会升级到推理模型）
+        if cached and self.tiers.escalation(request, planned, cached, time.monotonic()):
+            return None
+        return cached
+
+    def _plan(self, request: LLMRequest) -> LLMRequest:
+        planned, reason = self.tiers.plan(request)
+        if request.model_tier:
+            metrics.MODEL_TIER_DECISIONS.labels(planned.model_tier or "explicit", reason).inc()
+        return planned
+
+    def _escalation(self, request: LLMRequest, planned: LLMRequest, response: LLMResponse,
+                    started: float) -> Optional[LLMRequest]:
+        escalated = self.tiers.escalation(request, planned, response, started)
+        if escalated:
+            logger.info(f"Fast-tier answer from {response.provider_name} failed validation; "
+                        f"escalating to the reasoning model.")
+            metrics.MODEL_TIER_ESCALATIONS.inc()
+        return escalated
 
     # MODIFIED: Changed from async def to def
-    def get_llm_response(self, request: LLMRequest, provider_name: Optional[str] = None) -> LLMResponse:
+    def get_llm_response(self, request: LLMRequest, provider_name: Optional[str] = None,
+                         provider_slots: Optional[Dict[str, threading.Semaphore]] = None) -> LLMResponse:
+        """
+        Blocking routing path, used by Celery workers. Served from the response cache when possible.
+        provider_slots optionally caps how many calls this process sends to each provider at once
+        (used by the batch runner's fan-out).
+        model_tier="auto" requests are resolved to a tier by ModelTierPolicy and, when the fast
+        model's answer fails validation, sent once more on the reasoning tier.
+        """
+        started = time.monotonic()
+        planned = self._plan(request)
+        response = self._get_llm_response(planned, provider_name, provider_slots)
+        escalated = self._escalation(request, planned, response, started)
+        return self._get_llm_response(escalated, provider_name, provider_slots) if escalated else response
+
+    def _get_llm_response(self, request: LLMRequest, provider_name: Optional[str] = None,
+                          provider_slots: Optional[Dict[str, threading.Semaphore]] = None) -> LLMResponse:
+        key = self._cache_key(request, provider_name)
+        cached = self.cache.get(key) if key else None
+        if cached:
+            metrics.LLM_CACHE_HITS.labels("sync").inc()
+            return cached
+
+        def route() -> LLMResponse:
+            response = self._route(request, provider_name, provider_slots)
+            if key:
+                self.cache.set(key, response)
+            return response
+
+        flight_key = self.coalesce_key(request, provider_name)
+        return self.singleflight.do(flight_key, route) if flight_key else route()
+
+    async def aget_llm_response(self, request: LLMRequest, provider_name: Optional[str] = None) -> LLMResponse:
+        """
+        Non-blocking routing path for the FastAPI endpoints. Same selection and retry rules as
+        get_llm_response, but awaits the providers' async clients so one slow provider call
+        does not stall the event loop for every other caller.
+        """
+        return await self._atiered(request, lambda req: self._acached(req, provider_name,
+                                                                      lambda: self._aroute(req, provider_name)))
+
+    async def ahedged_llm_response(self, request: LLMRequest) -> LLMResponse:
+        return await self._atiered(request, lambda req: self._acached(req, None, lambda: self._ahedged_route(req)))
+
+    async def _atiered(self, request: LLMRequest, call) -> LLMResponse:
+        started = time.monotonic()
+        # 档位决策会读取 Redis 中的延迟样本，放到线程池
+        planned = await asyncio.to_thread(self._plan, request)
+        response = await call(planned)
+        escalated = await asyncio.to_thread(self._escalation, request, planned, response, started)
+        return await call(escalated) if escalated else response
+
+    async def _acached(self, request: LLMRequest, provider_name: Optional[str], route) -> LLMResponse:
+        key = self._cache_key(request, provider_name)
+        cached = await asyncio.to_thread(self.cache.get, key) if key else None
+        if cached:
+            metrics.LLM_CACHE_HITS.labels("async").inc()
+            return cached
+
+        async def route_and_store() -> LLMResponse:
+            response = await route()
+            if key:
+                await asyncio.to_thread(self.cache.set, key, response)
+            return response
+
+        flight_key = self.coalesce_key(request, provider_name)
+        # 对冲与普通请求结果等价，共用同一个去重键
+        return await self.singleflight.ado(flight_key, route_and_store) if flight_key else await route_and_store()
+
+    def _route(self, request: LLMRequest, provider_name: Optional[str] = None,
+               provider_slots: Optional[Dict[str, threading.Semaphore]] = None) -> LLMResponse:
         if not self.providers:
             return LLMResponse(error="No LLM providers available.")
 
-        selected_providers: List[BaseLLMProvider] = []
+        last_error = "No providers attempted."
+        for attempt in range(settings.RETRY_ATTEMPTS + 1):
+            selected_providers = self._select_providers(provider_name)
+            if not selected_providers:
+                if provider_name:
+                    return LLMResponse(error=f"Provider '{provider_name}' not found or not initialized.")
+                # 全部熔断且仍在冷却期内，退避等待也等不到冷却结束，直接失败
+                metrics.LLM_ROUTE_FAILURES.labels("sync").inc()
+                return LLMResponse(error="All provider circuits are open.")
+            retry_after = None
+            for provider_to_try in selected_providers:
+                logger.info(
+                    f"Attempt {attempt + 1}/{settings.RETRY_ATTEMPTS + 1} using provider: {self._name(provider_to_try)}")
+                response = self._call_provider(provider_to_try, request, provider_slots)
+                if response.content and not response.error:
+                    return response
+                last_error = response.error or "Provider returned empty content."
+                retry_after = max(retry_after or 0, response.retry_after or 0) or None
+                logger.warning(f"Provider {self._name(provider_to_try)} failed: {last_error}")
+                if provider_to_try is not selected_providers[-1]:
+                    metrics.LLM_FALLBACKS.labels(self._name(provider_to_try)).inc()
+
+            if attempt < settings.RETRY_ATTEMPTS:
+                delay = compute_backoff(attempt, retry_after)
+                logger.info(f"All providers in current selection failed. Retrying in {delay:.2f}s "
+                            f"(attempt {attempt + 2})...")
+                metrics.LLM_RETRIES.labels("sync").inc()
+                time.sleep(delay)
 
+        metrics.LLM_ROUTE_FAILURES.labels("sync").inc()
         if provider_name:
-            for p in self.providers:
-                if hasattr(p, 'provider_name') and p.provider_name.lower() == provider_name.lower():
-                    selected_providers = [p]
-                    break
-            if not selected_providers:
-                return LLMResponse(error=f"Provider '{provider_name}' not found or not initialized.")
-        else:
-            start_index = self.current_provider_index
-            for i in range(len(self.providers)):
-                idx = (start_index + i) % len(self.providers)
-                selected_providers.append(self.providers[idx])
-            self.current_provider_index = (start_index + 1) % len(self.providers)
+            return LLMResponse(
+                error=f"Provider {provider_name} failed after {settings.RETRY_ATTEMPTS + 1} attempts: {last_error}")
+        return LLMResponse(error=f"All attempts failed. Last error: {last_error}")
+
+    async def _aroute(self, request: LLMRequest, provider_name: Optional[str] = None) -> LLMResponse:
+        if not self.providers:
+            return LLMResponse(error="No LLM providers available.")
 
         last_error = "No providers attempted."
         for attempt in range(settings.RETRY_ATTEMPTS + 1):
+            selected_providers = await asyncio.to_thread(self._select_providers, provider_name)
+            if not selected_providers:
+                if provider_name:
+                    return LLMResponse(error=f"Provider '{provider_name}' not found or not initialized.")
+                # 全部熔断且仍在冷却期内，退避等待也等不到冷却结束，直接失败
+                metrics.LLM_ROUTE_FAILURES.labels("async").inc()
+                return LLMResponse(error="All provider circuits are open.")
+            retry_after = None
             for provider_to_try in selected_providers:
                 logger.info(
-                    f"Attempt {attempt + 1}/{settings.RETRY_ATTEMPTS + 1} using provider: {getattr(provider_to_try, 'provider_name', 'UnknownProvider')}")
-                try:
-                    # MODIFIED: Removed await as provider's generate_response is now synchronous
-                    response = provider_to_try.generate_response(request)
+                    f"Attempt {attempt + 1}/{settings.RETRY_ATTEMPTS + 1} using provider: {self._name(provider_to_try)}")
+                response = await self._acall_provider(provider_to_try, request)
+                if response.content and not response.error:
+                    return response
+                last_error = response.error or "Provider returned empty content."
+                retry_after = max(retry_after or 0, response.retry_after or 0) or None
+                logger.warning(f"Provider {self._name(provider_to_try)} failed: {last_error}")
+                if provider_to_try is not selected_providers[-1]:
+                    metrics.LLM_FALLBACKS.labels(self._name(provider_to_try)).inc()
+
+            if attempt < settings.RETRY_ATTEMPTS:
+                delay = compute_backoff(attempt, retry_after)
+                logger.info(f"All providers in current selection failed. Retrying in {delay:.2f}s "
+                            f"(attempt {attempt + 2})...")
+                metrics.LLM_RETRIES.labels("async").inc()
+                await asyncio.sleep(delay)
+
+        metrics.LLM_ROUTE_FAILURES.labels("async").inc()
+        if provider_name:
+            return LLMResponse(
+                error=f"Provider {provider_name} failed after {settings.RETRY_ATTEMPTS + 1} attempts: {last_error}")
+        return LLMResponse(error=f"All attempts failed. Last error: {last_error}")
+
+    def hedge_delay_seconds(self, provider: BaseLLMProvider) -> float:
+        observed = self.health.latency_percentile(self._name(provider), settings.HEDGE_PERCENTILE)
+        delay_ms = observed if observed is not None else settings.HEDGE_DEFAULT_DELAY_MS
+        return min(max(delay_ms, settings.HEDGE_MIN_DELAY_MS), settings.HEDGE_MAX_DELAY_MS) / 1000
+
+    async def _ahedged_route(self, request: LLMRequest) -> LLMResponse:
+        """
+        Hedged variant of aget_llm_response for short interactive calls. The request goes to the best
+        provider; if it has not answered within HEDGE_PERCENTILE of its recent latency, the same request
+        is also sent to the next provider. The first successful answer wins and the other call is
+        cancelled. If neither succeeds, the regular retry path takes over.
+        """
+        candidates = await asyncio.to_thread(self._select_providers, None)
+        if len(candidates) < 2:
+            return await self._aroute(request)
+
+        primary, secondary = candidates[0], candidates[1]
+        delay = await asyncio.to_thread(self.hedge_delay_seconds, primary)
+        pending = {asyncio.create_task(self._acall_provider(primary, request))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                logger.info(f"Hedging: {self._name(primary)} slower than {delay * 1000:.0f} ms, "
+                            f"also sending request to {self._name(secondary)}")
+                pending.add(asyncio.create_task(self._acall_provider(secondary, request)))
+            while True:
+                for task in done:
+                    response = task.result()
                     if response.content and not response.error:
                         return response
-                    else:
-                        last_error = response.error or "Provider returned empty content."
-                        logger.warning(
-                            f"Provider {getattr(provider_to_try, 'provider_name', 'UnknownProvider')} failed: {last_error}")
+                    logger.warning(f"Hedged call to {response.provider_name} failed: {response.error}")
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # 取消落败的一方，释放其上游连接
+            for task in pending:
+                task.cancel()
+
+        return await self._aroute(request)
+
+    async def astream_llm_response(self, request: LLMRequest,
+                                   provider_name: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streams a completion as events: {"type": "delta", ...} for each content piece, then a final
+        {"type": "done", ...} carrying timing metrics, or {"type": "error", ...}.
+        Falls back to the next provider only while nothing has been emitted yet; once the first
+        token is out, a failure ends the stream with an error event.
+        """
+        if not self.providers:
+            yield {"type": "error", "error": "No LLM providers available."}
+            return
+        # 流式输出一旦开始便无法撤回，auto 档位只做首次选择，不升级
+        request = await asyncio.to_thread(self._plan, request)
+
+        selected_providers = await asyncio.to_thread(self._select_providers, provider_name)
+        if not selected_providers:
+            error = f"Provider '{provider_name}' not found or not initialized." if provider_name \
+                else "All provider circuits are open."
+            yield {"type": "error", "error": error}
+            return
+
+        last_error = "No providers attempted."
+        for provider_to_try in selected_providers:
+            name = getattr(provider_to_try, 'provider_name', 'UnknownProvider')
+            model_used = self._model(provider_to_try, request)
+            ttft_ms = None
+            max_wait = settings.RATE_LIMIT_MAX_WAIT_INTERACTIVE
+            async with self.limiter.alimit(name, model_used, request, max_wait) as allowed:
+                if not allowed:
+                    last_error = self._throttled(provider_to_try, request, max_wait).error
+                    continue
+                started = time.monotonic()
+                try:
+                    async for delta in provider_to_try.astream_response(request):
+                        if ttft_ms is None:
+                            ttft_ms = (time.monotonic() - started) * 1000
+                            self.ttft_samples_ms.append(ttft_ms)
+                            logger.info(f"[{name}] First token after {ttft_ms:.0f} ms (model {model_used})")
+                        yield {"type": "delta", "content": delta}
                 except Exception as e:
                     last_error = str(e)
-                    logger.error(
-                        f"Exception with provider {getattr(provider_to_try, 'provider_name', 'UnknownProvider')}: {last_error}",
-                        exc_info=True)  # Added exc_info for better debugging
-
-                if provider_name and getattr(provider_to_try, 'provider_name', '').lower() == provider_name.lower():
-                    if attempt < settings.RETRY_ATTEMPTS:
-                        time.sleep(1)  # MODIFIED: Replaced asyncio.sleep with time.sleep
-                        continue
-                    else:
-                        return LLMResponse(
-                            error=f"Provider {provider_name} failed after {settings.RETRY_ATTEMPTS + 1} attempts: {last_error}")
-
-            if not provider_name and attempt < settings.RETRY_ATTEMPTS:
-                logger.info(f"All providers in current selection failed. Retrying (attempt {attempt + 2})...")
-                time.sleep(1)  # MODIFIED: Replaced asyncio.sleep with time.sleep
-            elif not provider_name:
-                break
+                    metrics.LLM_REQUESTS.labels(name, model_used, "error").inc()
+                    await asyncio.to_thread(self.health.record_failure, name)
+                    if ttft_ms is not None:
+                        logger.error(f"Stream from provider {name} broke after first token: {last_error}")
+                        yield {"type": "error", "error": last_error, "provider_name": name, "model_used": model_used}
+                        return
+                    logger.warning(f"Provider {name} failed before first token: {last_error}")
+                    continue
 
-        return LLMResponse(error=f"All attempts failed. Last error: {last_error}")
+            if ttft_ms is None:
+                last_error = "Provider returned empty content."
+                logger.warning(f"Provider {name} failed: {last_error}")
+                continue
+
+            total_ms = (time.monotonic() - started) * 1000
+            # 流式请求只记录成功与否；其耗时取决于输出长度，不计入 EWMA 延迟和延迟直方图
+            metrics.LLM_REQUESTS.labels(name, model_used, "success").inc()
+            await asyncio.to_thread(self.health.record_success, name)
+            yield {"type": "done", "provider_name": name, "model_used": model_used,
+                   "ttft_ms": round(ttft_ms, 1), "total_ms": round(total_ms, 1)}
+            return
+
+        yield {"type": "error", "error": f"All attempts failed. Last error: {last_error}"}
+
+    def provider_status(self) -> Dict[str, Dict[str, Any]]:
+        names = [self._name(p) for p in self.providers]
+        return self.health.snapshot(names)
+
+    def stream_metrics(self) -> Dict[str, Any]:
+        samples = sorted(self.ttft_samples_ms)
+        if not samples:
+            return {"count": 0, "ttft_ms_p50": None, "ttft_ms_p95": None, "ttft_ms_max": None}
+
+        def pct(q: float) -> float:
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))], 1)
+
+        return {"count": len(samples), "ttft_ms_p50": pct(0.5), "ttft_ms_p95": pct(0.95),
+                "ttft_ms_max": round(samples[-1], 1)}
 
 
 llm_router_instance = LLMRouter()
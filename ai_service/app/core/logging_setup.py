@@ -0,0 +1,187 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+from typing import Any, Dict, Iterable, Optional
+
+from app.core.config import settings
+
+AUDIT_LOGGER_NAME = "ai_service.audit"
+
+# LogRecord 自带的属性，其余（通过 extra= 传入的）字段在 JSON 格式下原样输出
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, plus any fields passed via extra=."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _AuditFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({"ts": round(record.created, 3), "pid": record.process, **record.audit},
+                          ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to the background writer without ever blocking the caller: when the bounded
+    queue is full (the writer cannot keep up) the record is dropped and counted instead.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Pipeline:
+    """Queue handler + listener pair; restarted in each forked worker child (threads do not survive fork)."""
+
+    def __init__(self, logger: logging.Logger, handlers: Iterable[logging.Handler], queue_size: int):
+        self.logger = logger
+        self.handlers = list(handlers)
+        self.queue_size = queue_size
+        self.queue_handler: Optional[DroppingQueueHandler] = None
+        self.listener: Optional[QueueListener] = None
+
+    def start(self):
+        if self.queue_handler is not None:
+            self.logger.removeHandler(self.queue_handler)
+        log_queue = queue.Queue(maxsize=self.queue_size)
+        self.queue_handler = DroppingQueueHandler(log_queue)
+        self.logger.addHandler(self.queue_handler)
+        self.listener = QueueListener(log_queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()  # 写完队列中剩余的记录
+            self.listener = None
+
+
+_pipelines: Dict[str, _Pipeline] = {}
+
+
+def setup_logging():
+    """
+    Routes the root logger (and the optional audit logger) through bounded in-memory queues drained
+    by background threads, so request handlers and tasks never wait on log I/O. Safe to call twice.
+    """
+    if _pipelines:
+        return
+    root = logging.getLogger()
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for handler in list(root.handlers):  # 替换 basicConfig / Celery 默认安装的同步 handler
+        root.removeHandler(handler)
+    console = logging.StreamHandler()
+    console.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json"
+                         else logging.Formatter("%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"))
+    _pipelines["root"] = _Pipeline(root, [console], settings.LOG_QUEUE_SIZE)
+
+    if settings.AUDIT_LOG_PATH:
+        audit_logger = logging.getLogger(AUDIT_LOGGER_NAME)
+        audit_logger.setLevel(logging.INFO)
+        audit_logger.propagate = False  # 审计记录只写 JSONL 文件，不进入普通日志
+        # 多进程各写各的文件（路径中的 {pid}），WatchedFileHandler 兼容外部 logrotate
+        audit_file = WatchedFileHandler(settings.AUDIT_LOG_PATH.format(pid=os.getpid()), encoding="utf-8")
+        audit_file.setFormatter(_AuditFormatter())
+        _pipelines["audit"] = _Pipeline(audit_logger, [audit_file], settings.LOG_QUEUE_SIZE)
+
+    for pipeline in _pipelines.values():
+        pipeline.start()
+    atexit.register(stop_logging)
+
+
+def restart_logging_after_fork():
+    """Celery prefork children inherit the queue handler but not the writer thread; start fresh ones."""
+    if not _pipelines:
+        return
+    audit = _pipelines.get("audit")
+    if audit is not None:
+        audit_file = WatchedFileHandler(settings.AUDIT_LOG_PATH.format(pid=os.getpid()), encoding="utf-8")
+        audit_file.setFormatter(_AuditFormatter())
+        audit.handlers = [audit_file]
+    for pipeline in _pipelines.values():
+        pipeline.listener = None
+        pipeline.start()
+
+
+def stop_logging():
+    for pipeline in _pipelines.values():
+        pipeline.stop()
+
+
+def dropped_log_records() -> int:
+    return sum(p.queue_handler.dropped for p in _pipelines.values() if p.queue_handler is not None)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def describe_messages(messages: Iterable[Any]) -> str:
+    """
+    Size-bounded rendering of a message list for regular logs, per LOG_PROMPT_MODE:
+    truncate - role, length, hash and the first LOG_PROMPT_MAX_CHARS characters (for a
+               LOG_PROMPT_SAMPLE_RATE share of calls, the rest fall back to hash);
+    hash     - role, length and hash only;
+    full     - the complete messages (debugging only).
+    The hash lets a log line be matched with its full record in the audit log.
+    """
+    items = [m if isinstance(m, dict) else m.model_dump() for m in messages]
+    mode = settings.LOG_PROMPT_MODE
+    if mode == "full":
+        return str(items)
+    if mode == "truncate" and random.random() >= settings.LOG_PROMPT_SAMPLE_RATE:
+        mode = "hash"
+    parts = []
+    for m in items:
+        content = m.get("content") or ""
+        part = f"{m.get('role')}(len={len(content)}, sha={_digest(content)})"
+        if mode == "truncate":
+            preview = content[:settings.LOG_PROMPT_MAX_CHARS].replace("\n", " ")
+            part += f" {preview!r}{'…' if len(content) > settings.LOG_PROMPT_MAX_CHARS else ''}"
+        parts.append(part)
+    return "[" + ", ".join(parts) + "]"
+
+
+def describe_payload(payload: Dict[str, Any]) -> str:
+    """An AIRequest dict for logging: every field as-is except messages, which go through describe_messages."""
+    fields = {k: v for k, v in payload.items() if k != "messages"}
+    return f"{fields} messages={describe_messages(payload.get('messages') or [])}"
+
+
+def audit(event: str, **fields):
+    """Full-fidelity JSONL record in AUDIT_LOG_PATH (sampled by AUDIT_LOG_SAMPLE_RATE); a no-op when disabled."""
+    if "audit" not in _pipelines or random.random() >= settings.AUDIT_LOG_SAMPLE_RATE:
+        return
+    logging.getLogger(AUDIT_LOGGER_NAME).info(event, extra={"audit": {"event": event, **fields}})
+
+
+def elapsed_ms(started: float) -> int:
+    return int((time.monotonic() - started) * 1000)
@@ -0,0 +1,128 @@
+import logging
+import os
+import time
+from typing import Iterable, Optional, Tuple
+
+import redis
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+                               generate_latest)
+from prometheus_client.core import GaugeMetricFamily
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# API 进程与 Celery worker 是不同进程：设置 PROMETHEUS_MULTIPROC_DIR（同一主机共享目录）后，
+# /metrics 会汇总所有进程写入的样本；未设置时只包含 API 进程自身的样本。
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, float("inf"))
+
+LLM_REQUEST_LATENCY = Histogram(
+    "ai_llm_request_duration_seconds", "Latency of a single provider call.",
+    ["provider", "model", "outcome"], buckets=LATENCY_BUCKETS)
+LLM_REQUESTS = Counter(
+    "ai_llm_requests_total", "Provider calls by outcome (success / error / throttled).",
+    ["provider", "model", "outcome"])
+LLM_TOKENS = Counter(
+    "ai_llm_tokens_total", "Tokens reported by the provider's usage field.",
+    ["provider", "model", "kind"])
+LLM_RETRIES = Counter(
+    "ai_llm_retries_total", "Router retry rounds after every selected provider failed.", ["path"])
+LLM_FALLBACKS = Counter(
+    "ai_llm_fallbacks_total", "Requests moved on to another provider after one failed.", ["from_provider"])
+LLM_ROUTE_FAILURES = Counter(
+    "ai_llm_route_failures_total", "Requests that failed on every provider and attempt.", ["path"])
+LLM_CACHE_HITS = Counter("ai_llm_cache_hits_total", "Requests served from the response cache.", ["path"])
+MODEL_TIER_DECISIONS = Counter(
+    "ai_model_tier_decisions_total", "Model tier chosen for requests that set model_tier, by reason.",
+    ["tier", "reason"])
+MODEL_TIER_ESCALATIONS = Counter(
+    "ai_model_tier_escalations_total", "Auto-tier requests retried on the reasoning model after the fast answer "
+                                       "failed validation.")
+
+TASKS = Counter("ai_celery_tasks_total", "Finished Celery tasks by outcome.", ["task", "priority", "outcome"])
+TASK_DURATION = Histogram(
+    "ai_celery_task_duration_seconds", "Wall time of Celery tasks.", ["task", "priority"], buckets=LATENCY_BUCKETS)
+TASK_QUEUE_WAIT = Histogram(
+    "ai_celery_queue_wait_seconds", "Time from API dispatch until a worker picked the task up.", ["priority"],
+    buckets=LATENCY_BUCKETS)
+TASK_END_TO_END = Histogram(
+    "ai_request_end_to_end_seconds", "Time from API dispatch until the task finished.", ["priority"],
+    buckets=LATENCY_BUCKETS)
+SLO_BREACHES = Counter(
+    "ai_slo_breaches_total", "Dispatched requests that finished later than PRIORITY_SLO_SECONDS.", ["priority"])
+
+ADMISSION_REJECTIONS = Counter(
+    "ai_admission_rejections_total", "Requests rejected with 429 by admission control.", ["priority", "reason"])
+ADMISSION_IN_FLIGHT = Gauge(
+    "ai_admission_in_flight", "Requests currently served in-process by the API.", ["priority"],
+    multiprocess_mode="livesum")
+
+QUEUES = ("ai_default_queue", *dict.fromkeys(settings.PRIORITY_QUEUES.values()))
+
+
+def observe_task(task: str, priority: str, outcome: str, started: float, enqueued_at: Optional[float]):
+    """Task duration plus, for tasks dispatched by the API, queue wait, end-to-end latency and SLO breaches."""
+    TASKS.labels(task, priority, outcome).inc()
+    TASK_DURATION.labels(task, priority).observe(time.monotonic() - started)
+    if enqueued_at:
+        end_to_end = time.time() - enqueued_at
+        TASK_END_TO_END.labels(priority).observe(end_to_end)
+        if end_to_end > settings.PRIORITY_SLO_SECONDS.get(priority, float("inf")):
+            SLO_BREACHES.labels(priority).inc()
+
+
+class QueueDepthCollector:
+    """Celery queue backlog read from the Redis broker (LLEN per queue) at scrape time."""
+
+    def __init__(self, queues: Iterable[str] = QUEUES):
+        self.queues = tuple(queues)
+
+    def collect(self):
+        gauge = GaugeMetricFamily("ai_celery_queue_depth", "Messages waiting in a Celery queue.", labels=["queue"])
+        try:
+            broker = get_redis(settings.CELERY_BROKER_URL)
+            with broker.pipeline(transaction=False) as pipe:
+                for queue in self.queues:
+                    pipe.llen(queue)
+                depths = pipe.execute()
+            for queue, depth in zip(self.queues, depths):
+                gauge.add_metric([queue], depth)
+        except redis.RedisError as e:
+            logger.warning(f"Queue depth unavailable: {e}")
+        yield gauge
+
+
+def record_provider_call(provider: str, model: str, outcome: str, latency_s: float,
+                         prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None):
+    model = model or "unknown"
+    LLM_REQUESTS.labels(provider, model, outcome).inc()
+    if outcome != "throttled":
+        LLM_REQUEST_LATENCY.labels(provider, model, outcome).observe(latency_s)
+    if prompt_tokens:
+        LLM_TOKENS.labels(provider, model, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(provider, model, "completion").inc(completion_tokens)
+
+
+_registry = None
+
+
+def _metrics_registry() -> CollectorRegistry:
+    global _registry
+    if _registry is None:
+        if MULTIPROCESS:
+            from prometheus_client import multiprocess
+            _registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(_registry)
+        else:
+            _registry = REGISTRY
+        _registry.register(QueueDepthCollector())
+    return _registry
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Body and content type for the /metrics endpoint."""
+    return generate_latest(_metrics_registry()), CONTENT_TYPE_LATEST
@@ -0,0 +1,143 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+from app.core.config import settings
+from app.core.rate_limiter import estimate_prompt_tokens
+from app.core.redis_client import get_redis
+from app.llm_providers.base_provider import LLMRequest, LLMResponse
+
+logger = logging.getLogger(__name__)
+
+TIER_FAST = "fast"  # Provider 的 default_model
+TIER_REASONING = "reasoning"  # Provider 的 reasoning_model
+TIER_AUTO = "auto"
+
+TIER_LATENCY_KEY = "ai:router:tier_latency:{tier}"  # 各档位最近成功调用的延迟样本（毫秒），跨 Provider 汇总
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def _parse_json_object(content: str) -> Optional[dict]:
+    text = _FENCE_RE.sub("", content.strip())
+    try:
+        value = json.loads(text)
+    except ValueError:
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end <= start:
+            return None
+        try:
+            value = json.loads(text[start:end + 1])
+        except ValueError:
+            return None
+    return value if isinstance(value, dict) else None
+
+
+class ModelTierPolicy:
+    """
+    Chooses between a provider's fast (default) and reasoning model for requests with model_tier="auto".
+
+    Prompts up to MODEL_TIER_FAST_MAX_PROMPT_TOKENS go to the fast model first and are escalated to the
+    reasoning model only when the answer fails validation (empty, not a JSON object in JSON mode, or
+    missing one of required_keys). Larger prompts go straight to the reasoning model. A latency budget
+    overrides both: when the reasoning tier's recent latency does not fit in it, the fast model is used,
+    and an escalation is only attempted while the remaining budget still covers a reasoning call.
+    Tier latencies are shared through Redis like the provider health state, with a per-process fallback.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        self._redis = redis_client
+        self._local: Dict[str, deque] = {}
+        self._local_lock = threading.Lock()
+        self._cache: Dict[str, Tuple[float, List[float]]] = {}  # tier -> (fetched_at, sorted samples)
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    # ---------- latency samples ----------
+    def record_latency(self, request: LLMRequest, latency_ms: float):
+        if request.model:  # 显式指定的模型不属于任何档位
+            return
+        tier = TIER_REASONING if request.use_reasoning_model else TIER_FAST
+        key = TIER_LATENCY_KEY.format(tier=tier)
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                pipe.lpush(key, round(latency_ms, 1))
+                pipe.ltrim(key, 0, settings.MODEL_TIER_LATENCY_WINDOW - 1)
+                pipe.execute()
+        except redis.RedisError:
+            with self._local_lock:
+                self._local.setdefault(tier, deque(maxlen=settings.MODEL_TIER_LATENCY_WINDOW)).appendleft(latency_ms)
+
+    def expected_latency_ms(self, tier: str) -> float:
+        """MODEL_TIER_LATENCY_PERCENTILE of the tier's recent latencies, or its configured default without samples."""
+        cached = self._cache.get(tier)
+        if cached and time.monotonic() - cached[0] < settings.HEDGE_SAMPLES_CACHE_SECONDS:
+            samples = cached[1]
+        else:
+            try:
+                samples = sorted(float(v) for v in self.redis.lrange(TIER_LATENCY_KEY.format(tier=tier), 0, -1))
+            except redis.RedisError:
+                with self._local_lock:
+                    samples = sorted(self._local.get(tier) or ())
+            self._cache[tier] = (time.monotonic(), samples)
+        if len(samples) < settings.MODEL_TIER_MIN_SAMPLES:
+            return settings.MODEL_TIER_DEFAULT_LATENCY_MS[tier]
+        return samples[min(len(samples) - 1, int(settings.MODEL_TIER_LATENCY_PERCENTILE * len(samples)))]
+
+    # ---------- decisions ----------
+    @staticmethod
+    def for_tier(request: LLMRequest, tier: str) -> LLMRequest:
+        return request.model_copy(update={"use_reasoning_model": tier == TIER_REASONING, "model_tier": tier})
+
+    def plan(self, request: LLMRequest) -> Tuple[LLMRequest, str]:
+        """The request to send first (tier resolved into use_reasoning_model) and the reason for the choice."""
+        if request.model or request.model_tier is None:
+            return request, "explicit"
+        if request.model_tier != TIER_AUTO:
+            return self.for_tier(request, request.model_tier), "explicit"
+        budget_ms = request.latency_budget * 1000 if request.latency_budget else None
+        if budget_ms and self.expected_latency_ms(TIER_REASONING) > budget_ms:
+            return self.for_tier(request, TIER_FAST), "latency_budget"
+        if estimate_prompt_tokens(request) > settings.MODEL_TIER_FAST_MAX_PROMPT_TOKENS:
+            return self.for_tier(request, TIER_REASONING), "prompt_size"
+        return self.for_tier(request, TIER_FAST), "small_prompt"
+
+    @staticmethod
+    def acceptable(request: LLMRequest, response: LLMResponse) -> bool:
+        if response.error or not (response.content or "").strip():
+            return False
+        if (request.response_format or {}).get("type") != "json_object" and not request.required_keys:
+            return True
+        parsed = _parse_json_object(response.content)
+        return parsed is not None and all(k in parsed for k in request.required_keys or ())
+
+    def escalation(self, original: LLMRequest, sent: LLMRequest, response: LLMResponse,
+                   started: float) -> Optional[LLMRequest]:
+        """
+        The reasoning-tier retry for an auto request whose fast answer failed validation, or None.
+        Provider failures are not escalated: the router has already retried and fallen back for them.
+        """
+        if not settings.MODEL_TIER_ESCALATE or original.model_tier != TIER_AUTO or sent.model_tier != TIER_FAST:
+            return None
+        if response.error or self.acceptable(sent, response):
+            return None
+        if original.latency_budget:
+            remaining_ms = original.latency_budget * 1000 - (time.monotonic() - started) * 1000
+            if self.expected_latency_ms(TIER_REASONING) > remaining_ms:
+                logger.info(f"Fast-tier answer failed validation but only {remaining_ms:.0f} ms of the latency "
+                            f"budget remain; keeping it.")
+                return None
+        return self.for_tier(original, TIER_REASONING)
+
+
+model_tier_policy = ModelTierPolicy()
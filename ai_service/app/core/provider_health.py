@@ -0,0 +1,220 @@
+import logging
+import math
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"  # 正常接收流量
+STATE_OPEN = "open"  # 熔断中，不参与路由
+STATE_HALF_OPEN = "half_open"  # 冷却结束，仅放行一个探测请求
+
+HEALTH_KEY = "ai:router:health:{name}"
+PROBE_KEY = "ai:router:probe:{name}"
+LATENCY_KEY = "ai:router:latency:{name}"  # 最近成功请求的延迟样本（毫秒），用于对冲阈值
+
+
+def compute_backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Exponential backoff with full jitter. A provider supplied Retry-After is honoured as a floor
+    (capped by RETRY_AFTER_MAX so one bad header cannot park a request for minutes).
+    """
+    ceiling = min(settings.RETRY_BACKOFF_MAX, settings.RETRY_BACKOFF_BASE * (2 ** attempt))
+    delay = random.uniform(0, ceiling)
+    if retry_after:
+        delay = max(delay, min(retry_after, settings.RETRY_AFTER_MAX))
+    return delay
+
+
+class ProviderHealthTracker:
+    """
+    Per-provider EWMA latency / error rate plus a circuit breaker.
+
+    State lives in one Redis hash per provider so the API process and every Celery worker route
+    on the same picture. Updates use WATCH/MULTI so concurrent writers do not lose samples.
+    When Redis is unreachable the tracker degrades to per-process state instead of failing requests.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        self._redis = redis_client
+        self._local: Dict[str, Dict[str, float]] = {}
+        self._local_lock = threading.Lock()
+        self._cache: Dict[str, Dict[str, float]] = {}
+        self._cache_at = 0.0
+        self._latency_cache: Dict[str, tuple] = {}  # name -> (fetched_at, sorted samples)
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    # ---------- state transitions ----------
+    @staticmethod
+    def _decode(raw: Dict[str, str]) -> Dict[str, float]:
+        state = {
+            "ewma_ms": 0.0, "error_rate": 0.0, "samples": 0.0,
+            "consecutive_failures": 0.0, "opened_at": 0.0,
+        }
+        for key, value in (raw or {}).items():
+            if key == "state":
+                continue
+            try:
+                state[key] = float(value)
+            except (TypeError, ValueError):
+                pass
+        state["state"] = (raw or {}).get("state", STATE_CLOSED)
+        return state
+
+    @staticmethod
+    def _apply(state: Dict, success: bool, latency_ms: Optional[float], now: float) -> Dict:
+        alpha = settings.ROUTER_EWMA_ALPHA
+        if latency_ms is not None:
+            state["ewma_ms"] = latency_ms if not state["ewma_ms"] else \
+                alpha * latency_ms + (1 - alpha) * state["ewma_ms"]
+        state["error_rate"] = alpha * (0.0 if success else 1.0) + (1 - alpha) * state["error_rate"]
+        state["samples"] += 1
+
+        if success:
+            state["consecutive_failures"] = 0
+            state["state"] = STATE_CLOSED
+        else:
+            state["consecutive_failures"] += 1
+            tripped = (
+                state["state"] == STATE_HALF_OPEN
+                or state["consecutive_failures"] >= settings.ROUTER_FAILURE_THRESHOLD
+                or (state["samples"] >= settings.ROUTER_MIN_SAMPLES
+                    and state["error_rate"] >= settings.ROUTER_ERROR_RATE_THRESHOLD)
+            )
+            if tripped:
+                state["state"] = STATE_OPEN
+                state["opened_at"] = now
+        return state
+
+    def _update(self, name: str, success: bool, latency_ms: Optional[float]):
+        now = time.time()
+        key = HEALTH_KEY.format(name=name)
+        previous = self._cache.get(name, {}).get("state", STATE_CLOSED)
+        state = None
+        try:
+            with self.redis.pipeline() as pipe:
+                for _ in range(5):
+                    try:
+                        pipe.watch(key)
+                        state = self._apply(self._decode(pipe.hgetall(key)), success, latency_ms, now)
+                        pipe.multi()
+                        pipe.hset(key, mapping={k: str(v) for k, v in state.items()})
+                        pipe.execute()
+                        break
+                    except redis.WatchError:
+                        continue
+            if state is None:
+                return
+            if not success and state["state"] == STATE_OPEN:
+                self.redis.delete(PROBE_KEY.format(name=name))
+            if success and latency_ms is not None:
+                latency_key = LATENCY_KEY.format(name=name)
+                with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.lpush(latency_key, round(latency_ms, 1))
+                    pipe.ltrim(latency_key, 0, settings.HEDGE_LATENCY_WINDOW - 1)
+                    pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Router state in Redis unavailable ({e}); using process-local health for {name}.")
+            with self._local_lock:
+                state = self._apply(self._local.get(name) or self._decode({}), success, latency_ms, now)
+                self._local[name] = state
+        if success and previous != STATE_CLOSED:
+            logger.info(f"Circuit closed for provider {name} after successful request.")
+        if not success and state["state"] == STATE_OPEN:
+            logger.warning(f"Circuit open for provider {name}: error_rate={state['error_rate']:.2f}, "
+                           f"consecutive_failures={int(state['consecutive_failures'])}")
+        self._cache[name] = state
+
+    def record_success(self, name: str, latency_ms: Optional[float] = None):
+        self._update(name, True, latency_ms)
+
+    def record_failure(self, name: str, latency_ms: Optional[float] = None):
+        self._update(name, False, latency_ms)
+
+    # ---------- reads ----------
+    def snapshot(self, names: Sequence[str]) -> Dict[str, Dict]:
+        now = time.monotonic()
+        if now - self._cache_at < settings.ROUTER_STATE_CACHE_SECONDS and all(n in self._cache for n in names):
+            return {n: self._cache[n] for n in names}
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                for n in names:
+                    pipe.hgetall(HEALTH_KEY.format(name=n))
+                raws = pipe.execute()
+            states = {n: self._decode(raw) for n, raw in zip(names, raws)}
+        except redis.RedisError:
+            with self._local_lock:
+                states = {n: dict(self._local.get(n) or self._decode({})) for n in names}
+        self._cache.update(states)
+        self._cache_at = now
+        return states
+
+    def latency_percentile(self, name: str, q: float) -> Optional[float]:
+        """q-th percentile (0..1) of the provider's recent successful latencies in ms, None without samples."""
+        cached = self._latency_cache.get(name)
+        if cached and time.monotonic() - cached[0] < settings.HEDGE_SAMPLES_CACHE_SECONDS:
+            samples = cached[1]
+        else:
+            try:
+                samples = sorted(float(v) for v in self.redis.lrange(LATENCY_KEY.format(name=name), 0, -1))
+            except redis.RedisError:
+                samples = []
+            self._latency_cache[name] = (time.monotonic(), samples)
+        if len(samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def allow_request(self, name: str, state: Dict) -> bool:
+        """Closed circuits pass; an open circuit past its cool-down lets exactly one probe through."""
+        if state["state"] == STATE_CLOSED:
+            return True
+        if time.time() - state["opened_at"] < settings.ROUTER_OPEN_SECONDS:
+            return False
+        try:
+            acquired = self.redis.set(PROBE_KEY.format(name=name), "1", nx=True, ex=settings.ROUTER_PROBE_TIMEOUT)
+            if acquired:
+                self.redis.hset(HEALTH_KEY.format(name=name), "state", STATE_HALF_OPEN)
+        except redis.RedisError:
+            acquired = True
+        if acquired:
+            logger.info(f"Circuit half-open for provider {name}, sending probe request.")
+            state["state"] = STATE_HALF_OPEN
+        return bool(acquired)
+
+    def order_providers(self, names: Sequence[str]) -> List[str]:
+        """
+        Healthy providers in a weighted random order favouring low latency and low error rate
+        (weight = success ratio / EWMA latency). Providers whose circuit is open are left out until their
+        cool-down ends and they win the half-open probe; if none is allowed the result is empty.
+        """
+        states = self.snapshot(names)
+        allowed = [n for n in names if self.allow_request(n, states[n])]
+        if not allowed:
+            return []
+
+        known = [states[n]["ewma_ms"] for n in allowed if states[n]["ewma_ms"]]
+        # 没有样本的 Provider 按已知最快的延迟估计，保证新 Provider 能被探索到
+        default_ms = min(known) if known else settings.DEFAULT_TIMEOUT * 1000
+
+        def sort_key(n: str) -> float:
+            latency = max(states[n]["ewma_ms"] or default_ms, 1.0)
+            weight = max(1.0 - states[n]["error_rate"], 0.01) / latency
+            # Efraimidis-Spirakis weighted sampling without replacement, in log space to avoid underflow
+            return math.log(random.random() or 1e-12) / weight
+
+        return sorted(allowed, key=sort_key, reverse=True)
+
+
+provider_health = ProviderHealthTracker()
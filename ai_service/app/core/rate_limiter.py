@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.llm_providers.base_provider import LLMRequest
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY = "ai:rl:bucket:{name}:{model}:{kind}"  # kind: req / tok
+CONCURRENCY_KEY = "ai:rl:conc:{name}"  # ZSET: 持有者 token -> 获取时间，过期的租约会被清理
+
+# 同时检查请求数与 token 两个令牌桶，两者都足够时才一起扣减；否则返回需要等待的秒数。
+# 时间取 Redis 服务器时间，避免各 worker 主机时钟不一致。
+_TOKEN_BUCKET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local limits = {tonumber(ARGV[1]), tonumber(ARGV[2])}
+local costs = {1, tonumber(ARGV[3])}
+local levels = {}
+local wait = 0
+for i = 1, 2 do
+    local limit = limits[i]
+    if limit > 0 then
+        local rate = limit / 60.0
+        local bucket = redis.call('HMGET', KEYS[i], 'level', 'ts')
+        local level = tonumber(bucket[1]) or limit
+        local ts = tonumber(bucket[2]) or now
+        level = math.min(limit, level + math.max(0, now - ts) * rate)
+        costs[i] = math.min(costs[i], limit)
+        levels[i] = level
+        if level < costs[i] then
+            wait = math.max(wait, (costs[i] - level) / rate)
+        end
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i = 1, 2 do
+    if limits[i] > 0 then
+        redis.call('HSET', KEYS[i], 'level', tostring(levels[i] - costs[i]), 'ts', tostring(now))
+        redis.call('EXPIRE', KEYS[i], 120)
+    end
+end
+return '0'
+"""
+
+_ACQUIRE_SLOT_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local lease = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - lease)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now, ARGV[2])
+    redis.call('EXPIRE', KEYS[1], math.ceil(lease))
+    return 1
+end
+return 0
+"""
+
+
+def estimate_prompt_tokens(request: LLMRequest) -> int:
+    """The caller's tokenizer count when supplied, else about two characters per token."""
+    if request.prompt_tokens is not None:
+        return request.prompt_tokens
+    return sum(len(m.content) for m in request.messages) // 2
+
+
+def estimate_request_tokens(request: LLMRequest) -> int:
+    """
+    Rough prompt + completion token estimate used to charge the TPM bucket before the call.
+    About two characters per token covers mixed Chinese/English prompts; the completion is
+    charged at max_tokens, or RATE_LIMIT_DEFAULT_COMPLETION_TOKENS when the request leaves it open.
+    A prompt_tokens count supplied by the caller (tokenizer based) replaces the character estimate.
+    """
+    completion = request.max_tokens or settings.RATE_LIMIT_DEFAULT_COMPLETION_TOKENS
+    return estimate_prompt_tokens(request) + completion
+
+
+class ProviderRateLimiter:
+    """
+    Cross-worker limits on what reaches each provider: a requests-per-minute and a tokens-per-minute
+    token bucket per provider/model, and a cap on concurrent in-flight calls per provider.
+
+    State lives in Redis so the API process and every Celery worker share one budget. Callers over the
+    limit wait (queue) up to max_wait seconds instead of failing; only then does the router move on to
+    the next provider. Redis errors fail open so the limiter cannot take the service down.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        self._redis = redis_client
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    @staticmethod
+    def limits_for(name: str, model: str) -> Dict[str, int]:
+        """Defaults overlaid by RATE_LIMITS["<provider>"] and then RATE_LIMITS["<provider>:<model>"]."""
+        limits = {
+            "rpm": settings.RATE_LIMIT_DEFAULT_RPM,
+            "tpm": settings.RATE_LIMIT_DEFAULT_TPM,
+            "concurrency": settings.PROVIDER_MAX_CONCURRENCY,
+        }
+        limits.update(settings.RATE_LIMITS.get(name, {}))
+        limits.update(settings.RATE_LIMITS.get(f"{name}:{model}", {}))
+        return limits
+
+    def _take(self, name: str, model: str, tokens: int, limits: Dict[str, int]) -> float:
+        """Tries to take one request and `tokens` tokens. Returns 0 on success, else seconds to wait."""
+        if limits["rpm"] <= 0 and limits["tpm"] <= 0:
+            return 0.0
+        keys = [BUCKET_KEY.format(name=name, model=model, kind=kind) for kind in ("req", "tok")]
+        return float(self.redis.eval(_TOKEN_BUCKET_SCRIPT, 2, *keys, limits["rpm"], limits["tpm"], tokens))
+
+    def _acquire_slot(self, name: str, token: str, limits: Dict[str, int], lease: float) -> bool:
+        if limits["concurrency"] <= 0:
+            return True
+        return bool(self.redis.eval(_ACQUIRE_SLOT_SCRIPT, 1, CONCURRENCY_KEY.format(name=name),
+                                    limits["concurrency"], token, lease))
+
+    def _release_slot(self, name: str, token: str):
+        try:
+            self.redis.zrem(CONCURRENCY_KEY.format(name=name), token)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release concurrency slot for {name}: {e}")
+
+    def _try_acquire(self, name: str, model: str, tokens: int, token: str, lease: float,
+                     state: Dict[str, bool]) -> float:
+        """One non-blocking acquisition step. Returns 0 once both the budget and a slot are held."""
+        limits = self.limits_for(name, model)
+        try:
+            if not state["budget"]:
+                wait = self._take(name, model, tokens, limits)
+                if wait > 0:
+                    return wait
+                state["budget"] = True
+            if self._acquire_slot(name, token, limits, lease):
+                return 0.0
+            return settings.RATE_LIMIT_SLOT_POLL_INTERVAL
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter unavailable ({e}); letting request to {name} through.")
+            return 0.0
+
+    @staticmethod
+    def _lease(request: LLMRequest) -> float:
+        # 租约略长于请求超时，worker 崩溃后占用的并发名额会自动回收
+        return float(request.timeout or settings.DEFAULT_TIMEOUT) + 60
+
+    @staticmethod
+    def _sleep_for(wait: float, deadline: float) -> float:
+        # 加少量抖动，避免大量等待者同时醒来再次争抢
+        return min(wait + random.uniform(0, 0.05), max(deadline - time.monotonic(), 0))
+
+    @contextmanager
+    def limit(self, name: str, model: str, request: LLMRequest, max_wait: float) -> Iterator[bool]:
+        """
+        Blocks until the call to provider `name` fits its RPM/TPM budget and concurrency cap,
+        for at most max_wait seconds. Yields False if the wait ran out; the slot is released on exit.
+        """
+        if not settings.RATE_LIMIT_ENABLED:
+            yield True
+            return
+        token, lease = uuid.uuid4().hex, self._lease(request)
+        tokens, state = estimate_request_tokens(request), {"budget": False}
+        deadline = time.monotonic() + max_wait
+        started = time.monotonic()
+        while True:
+            wait = self._try_acquire(name, model, tokens, token, lease, state)
+            if wait <= 0:
+                break
+            if time.monotonic() + wait > deadline:
+                logger.warning(f"Rate limit for {name}/{model} not available within {max_wait:.0f}s.")
+                yield False
+                return
+            time.sleep(self._sleep_for(wait, deadline))
+        waited = time.monotonic() - started
+        if waited > 0.5:
+            logger.info(f"Request to {name}/{model} queued {waited:.1f}s by rate limiter.")
+        try:
+            yield True
+        finally:
+            self._release_slot(name, token)
+
+    @asynccontextmanager
+    async def alimit(self, name: str, model: str, request: LLMRequest, max_wait: float) -> AsyncIterator[bool]:
+        """Event-loop friendly variant of limit(): Redis calls run in a thread and waiting uses asyncio.sleep."""
+        if not settings.RATE_LIMIT_ENABLED:
+            yield True
+            return
+        token, lease = uuid.uuid4().hex, self._lease(request)
+        tokens, state = estimate_request_tokens(request), {"budget": False}
+        deadline = time.monotonic() + max_wait
+        started = time.monotonic()
+        while True:
+            wait = await asyncio.to_thread(self._try_acquire, name, model, tokens, token, lease, state)
+            if wait <= 0:
+                break
+            if time.monotonic() + wait > deadline:
+                logger.warning(f"Rate limit for {name}/{model} not available within {max_wait:.0f}s.")
+                yield False
+                return
+            await asyncio.sleep(self._sleep_for(wait, deadline))
+        waited = time.monotonic() - started
+        if waited > 0.5:
+            logger.info(f"Request to {name}/{model} queued {waited:.1f}s by rate limiter.")
+        try:
+            yield True
+        finally:
+            await asyncio.to_thread(self._release_slot, name, token)
+
+
+rate_limiter = ProviderRateLimiter()
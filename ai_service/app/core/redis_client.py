@@ -0,0 +1,46 @@
+from typing import Dict, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+# 按 URL 缓存连接池，API 进程和 Celery worker 进程各自持有一份
+_sync_clients: Dict[str, redis.Redis] = {}
+_async_clients: Dict[str, aioredis.Redis] = {}
+
+
+def get_redis(url: Optional[str] = None) -> redis.Redis:
+    """Blocking Redis client for shared router/cache state. Defaults to settings.REDIS_URL."""
+    url = url or settings.REDIS_URL
+    client = _sync_clients.get(url)
+    if client is None:
+        client = redis.Redis.from_url(
+            url,
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+        _sync_clients[url] = client
+    return client
+
+
+def get_async_redis(url: Optional[str] = None) -> aioredis.Redis:
+    """Event-loop friendly Redis client for the FastAPI handlers."""
+    url = url or settings.REDIS_URL
+    client = _async_clients.get(url)
+    if client is None:
+        client = aioredis.Redis.from_url(
+            url,
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+        _async_clients[url] = client
+    return client
+
+
+async def close_async_redis():
+    for client in _async_clients.values():
+        await client.aclose()
+    _async_clients.clear()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Optional, Dict, Any
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.llm_providers.base_provider import LLMRequest, LLMResponse
+
+logger = logging.getLogger(__name__)
+
+ENTRY_KEY = "ai:cache:entry:{key}"
+INDEX_KEY = "ai:cache:index"  # ZSET: cache key -> last access time, used for size-bounded eviction
+HITS_KEY = "ai:cache:stats:hits"
+MISSES_KEY = "ai:cache:stats:misses"
+
+
+def _normalize_content(content: str) -> str:
+    # 统一换行并去掉行尾空白，避免仅格式差异导致缓存未命中
+    lines = content.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def request_cache_key(request: LLMRequest, provider_name: Optional[str] = None) -> str:
+    """Stable hash over everything that can change the completion: messages, model, sampling and format."""
+    payload = {
+        "messages": [[m.role, _normalize_content(m.content)] for m in request.messages],
+        "model": request.model or ("reasoning" if request.use_reasoning_model else "default"),
+        "provider": (provider_name or "").lower(),
+        "temperature": request.temperature,
+        "max_tokens": request.max_tokens,
+        "response_format": request.response_format,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Redis-backed cache of successful completions, shared by the API and Celery workers.
+
+    Entries expire after RESPONSE_CACHE_TTL seconds; a ZSET of last-access times keeps the cache
+    under RESPONSE_CACHE_MAX_ENTRIES by evicting the least recently used keys. Any Redis error is
+    treated as a miss so the cache can never take the AI service down.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        self._redis = redis_client
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    @staticmethod
+    def is_cacheable(request: LLMRequest) -> bool:
+        """Explicit request.cache wins; by default only deterministic calls (temperature 0 or JSON mode) are cached."""
+        if not settings.RESPONSE_CACHE_ENABLED or request.cache is False:
+            return False
+        if request.cache:
+            return True
+        json_mode = bool(request.response_format and request.response_format.get("type") == "json_object")
+        return request.temperature == 0 or json_mode
+
+    def get(self, key: str) -> Optional[LLMResponse]:
+        try:
+            raw = self.redis.get(ENTRY_KEY.format(key=key))
+            with self.redis.pipeline(transaction=False) as pipe:
+                if raw is None:
+                    pipe.incr(MISSES_KEY)
+                    pipe.zrem(INDEX_KEY, key)
+                else:
+                    pipe.incr(HITS_KEY)
+                    pipe.zadd(INDEX_KEY, {key: time.time()})
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Response cache read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        response = LLMResponse.model_validate_json(raw)
+        response.cached = True
+        return response
+
+    def set(self, key: str, response: LLMResponse):
+        if not response.content or response.error:
+            return
+        data = response.model_dump_json(exclude={"cached", "retry_after"})
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(ENTRY_KEY.format(key=key), data, ex=settings.RESPONSE_CACHE_TTL)
+                pipe.zadd(INDEX_KEY, {key: time.time()})
+                pipe.zcard(INDEX_KEY)
+                size = pipe.execute()[-1]
+            overflow = size - settings.RESPONSE_CACHE_MAX_ENTRIES
+            if overflow > 0:
+                evicted = [k for k, _ in self.redis.zpopmin(INDEX_KEY, overflow)]
+                if evicted:
+                    self.redis.delete(*[ENTRY_KEY.format(key=k) for k in evicted])
+        except redis.RedisError as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(HITS_KEY)
+                pipe.get(MISSES_KEY)
+                pipe.zcard(INDEX_KEY)
+                hits, misses, entries = pipe.execute()
+        except redis.RedisError as e:
+            return {"enabled": settings.RESPONSE_CACHE_ENABLED, "error": str(e)}
+        hits, misses = int(hits or 0), int(misses or 0)
+        total = hits + misses
+        return {
+            "enabled": settings.RESPONSE_CACHE_ENABLED,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else None,
+            "entries": entries,
+            "max_entries": settings.RESPONSE_CACHE_MAX_ENTRIES,
+            "ttl_seconds": settings.RESPONSE_CACHE_TTL,
+        }
+
+
+response_cache = ResponseCache()
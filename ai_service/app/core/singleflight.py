@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.llm_providers.base_provider import LLMResponse
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "ai:sf:lock:{key}"  # 跨进程：正在执行某个请求的进程持有此锁
+RESULT_KEY = "ai:sf:result:{key}"  # 跨进程：执行者完成后短暂保存结果，供等待者读取
+TASK_KEY = "ai:sf:task:{key}"  # Celery 分发去重：相同请求复用同一个 task_id
+
+# 仅当锁仍属于自己时才删除，避免误删其他进程在锁过期后重新获取的锁
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[LLMResponse] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical LLM requests (keyed like the response cache) onto one provider call.
+
+    - ado():  in-process for the FastAPI event loop; followers await the leader's task.
+    - do():   in-process across threads, and across Celery worker processes through a Redis lock;
+              followers in other processes poll for the leader's result.
+    - claim_task()/release_task(): lets the API hand out an already dispatched Celery task id
+              instead of queuing a duplicate task.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        self._redis = redis_client
+        self._async_calls: Dict[str, asyncio.Task] = {}
+        self._sync_calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    # ---------- asyncio, in-process ----------
+    async def ado(self, key: str, fn: Callable[[], Awaitable[LLMResponse]]) -> LLMResponse:
+        task = self._async_calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._async_calls[key] = task
+            task.add_done_callback(lambda _t: self._async_calls.pop(key, None))
+        else:
+            logger.info(f"Coalescing request {key[:12]} onto in-flight call.")
+        # shield: 某个调用方断开连接时不取消其他调用方共享的请求
+        return await asyncio.shield(task)
+
+    # ---------- blocking, in-process + cross-process ----------
+    def do(self, key: str, fn: Callable[[], LLMResponse]) -> LLMResponse:
+        with self._lock:
+            call = self._sync_calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._sync_calls[key] = call
+        if not leader:
+            logger.info(f"Coalescing request {key[:12]} onto in-flight call in this process.")
+            call.event.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._sync_calls.pop(key, None)
+            call.event.set()
+
+    def _do_shared(self, key: str, fn: Callable[[], LLMResponse]) -> LLMResponse:
+        lock_key, result_key = LOCK_KEY.format(key=key), RESULT_KEY.format(key=key)
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis.set(lock_key, token, nx=True, ex=settings.SINGLEFLIGHT_LOCK_TTL)
+        except redis.RedisError as e:
+            logger.warning(f"Single-flight lock unavailable ({e}); calling provider directly.")
+            return fn()
+
+        if acquired:
+            try:
+                result = fn()
+                try:
+                    self.redis.set(result_key, result.model_dump_json(), ex=settings.SINGLEFLIGHT_RESULT_TTL)
+                except redis.RedisError:
+                    pass
+                return result
+            finally:
+                try:
+                    self.redis.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+                except redis.RedisError:
+                    pass
+
+        logger.info(f"Request {key[:12]} already in flight in another worker, waiting for its result.")
+        deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT_TIMEOUT
+        try:
+            while time.monotonic() < deadline:
+                raw = self.redis.get(result_key)
+                if raw:
+                    return LLMResponse.model_validate_json(raw)
+                if not self.redis.exists(lock_key):
+                    break  # 执行者已结束但未留下结果（或已崩溃），自行调用
+                time.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+        except redis.RedisError as e:
+            logger.warning(f"Single-flight wait failed ({e}); calling provider directly.")
+        return fn()
+
+    # ---------- Celery dispatch dedup ----------
+    def claim_task(self, key: str, task_id: str) -> Optional[str]:
+        """Registers task_id for key. Returns the id of an identical task already in flight, else None."""
+        task_key = TASK_KEY.format(key=key)
+        try:
+            if self.redis.set(task_key, task_id, nx=True, ex=settings.SINGLEFLIGHT_TASK_TTL):
+                return None
+            return self.redis.get(task_key)
+        except redis.RedisError as e:
+            logger.warning(f"Task dedup unavailable: {e}")
+            return None
+
+    def release_task(self, key: str, task_id: str):
+        try:
+            self.redis.eval(_RELEASE_SCRIPT, 1, TASK_KEY.format(key=key), task_id)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release task dedup key: {e}")
+
+
+singleflight = SingleFlight()
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.redis_client import get_async_redis
+from celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+# Celery Redis 结果后端的键格式（celery.backends.base.KeyValueStoreBackend.task_keyprefix）
+TASK_META_KEY = "celery-task-meta-{task_id}"
+
+
+def _uses_redis_backend() -> bool:
+    return (settings.CELERY_RESULT_BACKEND or "").startswith(("redis://", "rediss://"))
+
+
+def _meta_from_async_result(task_id: str) -> Optional[Dict[str, Any]]:
+    # 非 Redis 结果后端时的兜底：逐个查询（在线程池中执行）
+    task_result = celery_app.AsyncResult(task_id)
+    status = task_result.status
+    if status == "PENDING":
+        return None
+    result = task_result.result
+    if isinstance(result, BaseException):
+        result = {"exc_type": type(result).__name__, "exc_message": [str(a) for a in result.args]}
+    return {"status": status, "result": result, "traceback": task_result.traceback}
+
+
+async def fetch_task_metas(task_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Raw Celery task meta ({"status", "result", "traceback", ...}) per task id, None while the task is
+    pending or unknown. With a Redis result backend all ids are read with one MGET on the event loop.
+    """
+    if not task_ids:
+        return {}
+    if not _uses_redis_backend():
+        metas = await asyncio.gather(*[asyncio.to_thread(_meta_from_async_result, t) for t in task_ids])
+        return dict(zip(task_ids, metas))
+
+    client = get_async_redis(settings.CELERY_RESULT_BACKEND)
+    raws = await client.mget([TASK_META_KEY.format(task_id=t) for t in task_ids])
+    metas = {}
+    for task_id, raw in zip(task_ids, raws):
+        try:
+            metas[task_id] = json.loads(raw) if raw else None
+        except (TypeError, ValueError):
+            logger.error(f"Unreadable result meta for task {task_id}: {raw!r:.200}")
+            metas[task_id] = None
+    return metas
+
+
+def task_status_fields(task_id: str, meta: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Maps a Celery task meta onto the AIResponse fields returned by /api/v1/task_status."""
+    status = (meta or {}).get("status", "PENDING")
+    result = (meta or {}).get("result")
+    if status == "SUCCESS":
+        result = result if isinstance(result, dict) else {}
+        return {
+            "success": True,
+            "content": result.get("content"),
+            "error": result.get("error"),
+            "provider_name": result.get("provider_name"),
+            "model_used": result.get("model_used"),
+            "task_id": task_id,
+        }
+    if status in ("FAILURE", "REVOKED"):
+        failure_details = result if isinstance(result, dict) else {}
+        error_info = failure_details.get("error")
+        if not error_info:
+            exc_message = failure_details.get("exc_message")
+            if isinstance(exc_message, (list, tuple)) and exc_message:
+                exc_message = exc_message[0]
+            error_info = str(exc_message or result or "Task failed with no specific error.")
+        logger.error(f"Celery Task {task_id} failed. Result: {result}, Traceback: {(meta or {}).get('traceback')}")
+        return {
+            "success": False,
+            "error": f"Task failed: {error_info}",
+            "provider_name": failure_details.get("provider_name"),
+            "model_used": failure_details.get("model_used"),
+            "task_id": task_id,
+        }
+    return {"success": False, "error": "Task not ready or does not exist.", "content": f"Status: {status}",
+            "task_id": task_id}
+
+
+async def get_task_statuses(task_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    metas = await fetch_task_metas(task_ids)
+    return {task_id: task_status_fields(task_id, metas.get(task_id)) for task_id in task_ids}
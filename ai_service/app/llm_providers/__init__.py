@@ -1,4 +1,6 @@
+from app.core.config import settings
 from app.llm_providers.deepseek_provider import DeepSeekProvider
+from app.llm_providers.mock_provider import MockProvider
 from app.llm_providers.siliconflow_provider import SiliconFlowProvider
 from app.llm_providers.volcengine_provider import VolcEngineProvider
 
@@ -10,6 +12,10 @@ PROVIDER_CLASSES = [
     VolcEngineProvider,
 ]
 
+if settings.MOCK_LLM_MODE:
+    # 离线压测 / 本地开发：只使用模拟 Provider，不访问任何真实 API
+    PROVIDER_CLASSES = [MockProvider]
+
 
 def get_provider_instances():
     instances = []
@@ -1,6 +1,16 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Optional, Union, Literal
+from typing import List, Dict, Optional, Union, Literal, Any, AsyncIterator
 from pydantic import BaseModel
+import logging
+
+from openai import OpenAI, AsyncOpenAI
+
+from app.core.config import settings
+from app.core.logging_setup import describe_messages
+from app.llm_providers.http_clients import get_sync_http_client, get_async_http_client
+from app.llm_providers.text_utils import html_to_text
+
+logger = logging.getLogger(__name__)
 
 
 class Message(BaseModel):
@@ -15,8 +25,13 @@ class LLMRequest(BaseModel):
     stream: bool = False
     timeout: Optional[int] = None  # 请求超时时间
     max_tokens: Optional[int] = None
+    prompt_tokens: Optional[int] = None  # 调用方用分词器算出的 prompt token 数，限流时优先于字符估算
     temperature: Optional[float] = None
     response_format: Optional[Dict[str, str]] = None  # e.g. {"type": "json_object"}
+    cache: Optional[bool] = None  # None: 仅缓存确定性请求; True: 强制缓存; False: 不读也不写缓存
+    model_tier: Optional[Literal["auto", "fast", "reasoning"]] = None  # 设置后取代 use_reasoning_model，见 ModelTierPolicy
+    latency_budget: Optional[float] = None  # 期望的完成时间（秒），auto 档位据此决定是否使用 / 升级到推理模型
+    required_keys: Optional[List[str]] = None  # JSON 输出必须包含的字段，auto 档位下快速模型的回答不满足时升级
 
 
 class LLMResponse(BaseModel):
@@ -24,6 +39,23 @@ class LLMResponse(BaseModel):
     error: Optional[str] = None
     provider_name: Optional[str] = None
     model_used: Optional[str] = None
+    retry_after: Optional[float] = None  # 供应商返回的 Retry-After（秒），路由退避时参考
+    cached: bool = False  # 是否来自响应缓存
+    prompt_tokens: Optional[int] = None  # 供应商返回的 usage
+    completion_tokens: Optional[int] = None
+
+
+def retry_after_from_exception(e: Exception) -> Optional[float]:
+    """Reads a Retry-After header (seconds form) off an openai APIStatusError, if present."""
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after')
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
 
 
 class BaseLLMProvider(ABC):
@@ -37,5 +69,114 @@ class BaseLLMProvider(ABC):
     def generate_response(self, request: LLMRequest) -> LLMResponse: # MODIFIED
         pass
 
+    @abstractmethod
+    async def agenerate_response(self, request: LLMRequest) -> LLMResponse:
+        """Non-blocking counterpart of generate_response, used by the FastAPI event loop."""
+        pass
+
+    async def astream_response(self, request: LLMRequest) -> AsyncIterator[str]:
+        """
+        Yields content deltas as the provider produces them. Raises on failure so the router can
+        fall back to another provider before anything has been sent to the client.
+        Providers without native streaming emit the full completion as a single delta.
+        """
+        response = await self.agenerate_response(request)
+        if response.error:
+            raise RuntimeError(response.error)
+        if response.content:
+            yield response.content
+
     def get_model_name(self, use_reasoning_model: bool) -> str:
-        return self.reasoning_model if use_reasoning_model else self.default_model
\ No newline at end of file
+        return self.reasoning_model if use_reasoning_model else self.default_model
+
+
+class OpenAICompatibleProvider(BaseLLMProvider):
+    """
+    Shared implementation for providers exposing an OpenAI compatible chat completions API.
+    Holds one sync client (Celery path) and one async client (FastAPI path); both ride on
+    process-wide httpx pools so connections are kept alive across requests and providers.
+    """
+    provider_name = "UnknownProvider"
+    supports_response_format = True
+    strip_html_in_json_mode = True  # JSON 模式（作业批改等）下把富文本 HTML 转为纯文本再发送
+
+    def __init__(self, api_key: str, base_url: str, default_model: str, reasoning_model: str):
+        super().__init__(api_key=api_key, base_url=base_url, default_model=default_model,
+                         reasoning_model=reasoning_model)
+        # 重试与退避由 LLMRouter 统一负责，关闭 SDK 内置重试以免重试次数叠加
+        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0,
+                             http_client=get_sync_http_client())
+        self.async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0,
+                                        http_client=get_async_http_client())
+
+    def prepare_messages(self, request: LLMRequest) -> List[Dict[str, str]]:
+        json_mode = self.strip_html_in_json_mode and (request.response_format or {}).get("type") == "json_object"
+        messages = []
+        for msg in request.messages:
+            content = msg.content
+            if json_mode and msg.role in ("system", "user"):
+                content = html_to_text(content)
+            messages.append({"role": msg.role, "content": content})
+        return messages
+
+    def build_completion_kwargs(self, request: LLMRequest, model_to_use: str, stream: bool = False) -> Dict[str, Any]:
+        messages = self.prepare_messages(request)
+        logger.info(f"[{self.provider_name}] Requesting model: {model_to_use} with messages: {describe_messages(messages)}")
+        kwargs = dict(
+            model=model_to_use,
+            messages=messages,
+            stream=stream,
+            timeout=request.timeout or settings.DEFAULT_TIMEOUT,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+        )
+        if self.supports_response_format:
+            kwargs["response_format"] = request.response_format
+        return kwargs
+
+    def format_error(self, e: Exception) -> str:
+        return str(e)
+
+    def build_response(self, completion, model_to_use: str) -> LLMResponse:
+        content = completion.choices[0].message.content
+        logger.info(f"[{self.provider_name}] Response: {describe_messages([{'role': 'assistant', 'content': content}])}")
+        usage = getattr(completion, 'usage', None)
+        return LLMResponse(content=content, provider_name=self.provider_name, model_used=model_to_use,
+                           prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                           completion_tokens=getattr(usage, 'completion_tokens', None))
+
+    def generate_response(self, request: LLMRequest) -> LLMResponse:
+        model_to_use = request.model or self.get_model_name(request.use_reasoning_model)
+        try:
+            completion = self.client.chat.completions.create(**self.build_completion_kwargs(request, model_to_use))
+            return self.build_response(completion, model_to_use)
+        except Exception as e:
+            logger.error(f"[{self.provider_name}] Error generating response: {e}")
+            return LLMResponse(error=self.format_error(e), provider_name=self.provider_name, model_used=model_to_use,
+                               retry_after=retry_after_from_exception(e))
+
+    async def agenerate_response(self, request: LLMRequest) -> LLMResponse:
+        model_to_use = request.model or self.get_model_name(request.use_reasoning_model)
+        try:
+            completion = await self.async_client.chat.completions.create(
+                **self.build_completion_kwargs(request, model_to_use))
+            return self.build_response(completion, model_to_use)
+        except Exception as e:
+            logger.error(f"[{self.provider_name}] Error generating response: {e}")
+            return LLMResponse(error=self.format_error(e), provider_name=self.provider_name, model_used=model_to_use,
+                               retry_after=retry_after_from_exception(e))
+
+    async def astream_response(self, request: LLMRequest) -> AsyncIterator[str]:
+        model_to_use = request.model or self.get_model_name(request.use_reasoning_model)
+        stream = await self.async_client.chat.completions.create(
+            **self.build_completion_kwargs(request, model_to_use, stream=True))
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            # 客户端断开时尽早释放上游连接
+            await stream.close()
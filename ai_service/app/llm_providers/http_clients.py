@@ -0,0 +1,52 @@
+from typing import Optional
+
+import httpx
+
+from app.core.config import GREEN_POOLS, settings
+
+# Process-wide HTTP connection pools shared by every provider client.
+# Keeping them module level means TLS handshakes to the provider endpoints are paid once
+# per process instead of once per request.
+_sync_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _pool_limits() -> httpx.Limits:
+    max_connections = settings.HTTP_MAX_CONNECTIONS
+    if settings.CELERY_WORKER_POOL in GREEN_POOLS:
+        # 协程池下每个在途任务各占一条连接，连接池小于并发数时多出的任务只能排队等连接
+        max_connections = max(max_connections, settings.CELERY_IO_WORKER_CONCURRENCY)
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    # 单次请求的总超时由 OpenAI SDK 的 timeout 参数控制，这里只约束建立连接的时间
+    return httpx.Timeout(settings.DEFAULT_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+
+
+def get_sync_http_client() -> httpx.Client:
+    global _sync_http_client
+    if _sync_http_client is None or _sync_http_client.is_closed:
+        _sync_http_client = httpx.Client(limits=_pool_limits(), timeout=_timeout())
+    return _sync_http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    global _async_http_client
+    if _async_http_client is None or _async_http_client.is_closed:
+        _async_http_client = httpx.AsyncClient(limits=_pool_limits(), timeout=_timeout())
+    return _async_http_client
+
+
+async def close_http_clients():
+    global _sync_http_client, _async_http_client
+    if _async_http_client is not None and not _async_http_client.is_closed:
+        await _async_http_client.aclose()
+    if _sync_http_client is not None and not _sync_http_client.is_closed:
+        _sync_http_client.close()
+    _sync_http_client = None
+    _async_http_client = None
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from typing import AsyncIterator
+
+from app.core.config import settings
+from app.llm_providers.base_provider import BaseLLMProvider, LLMRequest, LLMResponse
+
+logger = logging.getLogger(__name__)
+
+_FILLER = "这是离线压测用的模拟回复。The quick brown fox jumps over the lazy dog. "
+
+
+class MockProvider(BaseLLMProvider):
+    """
+    Offline provider for load tests and local development (MOCK_LLM_MODE=true).
+
+    Never touches the network: each call sleeps for a latency drawn from a log-normal distribution
+    (MOCK_LLM_LATENCY_MEDIAN / MOCK_LLM_REASONING_LATENCY_MEDIAN, MOCK_LLM_LATENCY_SIGMA), then fails
+    with probability MOCK_LLM_ERROR_RATE / MOCK_LLM_THROTTLE_RATE or returns a canned completion.
+    JSON-mode requests get a grading-shaped JSON object so the backend's parsing path is exercised too.
+    """
+    provider_name = "Mock"
+
+    def __init__(self):
+        super().__init__(api_key="mock", base_url="mock://", default_model="mock-chat",
+                         reasoning_model="mock-reasoner")
+        self._random = random.Random(settings.MOCK_LLM_SEED)
+
+    def _latency(self, request: LLMRequest) -> float:
+        median = (settings.MOCK_LLM_REASONING_LATENCY_MEDIAN if request.use_reasoning_model
+                  else settings.MOCK_LLM_LATENCY_MEDIAN)
+        if settings.MOCK_LLM_LATENCY_SIGMA <= 0:
+            return median
+        return self._random.lognormvariate(math.log(median), settings.MOCK_LLM_LATENCY_SIGMA)
+
+    def _completion_tokens(self, request: LLMRequest) -> int:
+        return min(settings.MOCK_LLM_COMPLETION_TOKENS, request.max_tokens or settings.MOCK_LLM_COMPLETION_TOKENS)
+
+    def _content(self, request: LLMRequest, completion_tokens: int) -> str:
+        if (request.response_format or {}).get("type") == "json_object":
+            return json.dumps({
+                "score": self._random.randint(60, 100),
+                "comment": "模拟批改意见：结构清晰，论证基本完整。",
+                "AI生成疑似度": round(self._random.random(), 2),
+            }, ensure_ascii=False)
+        # 约两个字符一个 token，与 rate_limiter 的估算口径一致
+        chars = completion_tokens * 2
+        return (_FILLER * (chars // len(_FILLER) + 1))[:chars]
+
+    def _outcome(self, request: LLMRequest) -> LLMResponse:
+        model_to_use = request.model or self.get_model_name(request.use_reasoning_model)
+        roll = self._random.random()
+        if roll < settings.MOCK_LLM_THROTTLE_RATE:
+            return LLMResponse(error="Error code: 429 - mock rate limit", provider_name=self.provider_name,
+                               model_used=model_to_use, retry_after=1.0)
+        if roll < settings.MOCK_LLM_THROTTLE_RATE + settings.MOCK_LLM_ERROR_RATE:
+            return LLMResponse(error="Error code: 500 - mock provider error", provider_name=self.provider_name,
+                               model_used=model_to_use)
+        completion_tokens = self._completion_tokens(request)
+        return LLMResponse(content=self._content(request, completion_tokens), provider_name=self.provider_name,
+                           model_used=model_to_use,
+                           prompt_tokens=request.prompt_tokens or sum(len(m.content) for m in request.messages) // 2,
+                           completion_tokens=completion_tokens)
+
+    def generate_response(self, request: LLMRequest) -> LLMResponse:
+        time.sleep(self._latency(request))
+        return self._outcome(request)
+
+    async def agenerate_response(self, request: LLMRequest) -> LLMResponse:
+        await asyncio.sleep(self._latency(request))
+        return self._outcome(request)
+
+    async def astream_response(self, request: LLMRequest) -> AsyncIterator[str]:
+        latency = self._latency(request)
+        response = self._outcome(request)
+        # 首 token 约占总耗时的 20%，其余内容分 20 段均匀输出
+        await asyncio.sleep(latency * 0.2)
+        if response.error:
+            raise RuntimeError(response.error)
+        content = response.content or ""
+        step = max(1, len(content) // 20)
+        for i in range(0, len(content), step):
+            yield content[i:i + step]
+            await asyncio.sleep(latency * 0.8 / 20)
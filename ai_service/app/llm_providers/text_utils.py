@@ -0,0 +1,75 @@
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+
+# 只有看起来含标签的内容才需要解析，纯文本（包括大多数代码附件）直接原样返回
+_TAG_RE = re.compile(r"<[A-Za-z!/]")
+# 换行及其两侧空白合并为一个换行，其余连续空格 / 制表符合并为一个空格
+_WHITESPACE_RE = re.compile(r"\s*\n\s*|[ \t\r\f\v]+")
+
+# 结束时需要换行的块级元素（<br> 单独处理）
+_BLOCK_TAGS = frozenset({
+    "p", "div", "li", "ul", "ol", "tr", "table", "pre", "blockquote", "section", "article",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr",
+})
+_SKIP_TAGS = frozenset({"script", "style", "head", "title"})
+
+# 系统提示会在每个请求中重复出现，缓存其转换结果；过长的内容（学生提交正文）几乎不会重复，不进缓存
+HTML_TEXT_CACHE_MAX_CHARS = 16 * 1024
+
+
+class _TextExtractor(HTMLParser):
+    """Collects text nodes in one streaming pass; block boundaries and <br> become newlines."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "br":
+            self.parts.append("\n")
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in ("br", "hr"):
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+def _collapse_whitespace(match: re.Match) -> str:
+    return "\n" if "\n" in match.group() else " "
+
+
+def _convert(html_content: str) -> str:
+    parser = _TextExtractor()
+    parser.feed(html_content)
+    parser.close()
+    return _WHITESPACE_RE.sub(_collapse_whitespace, "".join(parser.parts)).strip()
+
+
+_convert_cached = lru_cache(maxsize=512)(_convert)
+
+
+def html_to_text(html_content: str) -> str:
+    """
+    Rich-text HTML to plain text for prompts: tags dropped, entities decoded, paragraphs and <br>
+    kept as line breaks, runs of whitespace collapsed. Content without tags is returned unchanged.
+    """
+    if not html_content or not _TAG_RE.search(html_content):
+        return html_content or ""
+    if len(html_content) <= HTML_TEXT_CACHE_MAX_CHARS:
+        return _convert_cached(html_content)
+    return _convert(html_content)
@@ -1,5 +1,4 @@
-from openai import OpenAI  # MODIFIED: Import synchronous OpenAI client
-from app.llm_providers.base_provider import BaseLLMProvider, LLMRequest, LLMResponse, Message
+from app.llm_providers.base_provider import OpenAICompatibleProvider, LLMRequest, Message
 from app.core.config import settings
 import os
 import logging
@@ -7,7 +6,10 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-class VolcEngineProvider(BaseLLMProvider):
+class VolcEngineProvider(OpenAICompatibleProvider):
+    provider_name = "VolcEngine"
+    supports_response_format = False  # ARK 接口不接收 response_format 参数
+
     def __init__(self):
         if not os.getenv("ARK_API_KEY") and settings.VC_API_KEY:
             os.environ["ARK_API_KEY"] = settings.VC_API_KEY
@@ -18,29 +20,6 @@ class VolcEngineProvider(BaseLLMProvider):
             default_model=settings.VC_MODEL,
             reasoning_model=settings.VC_MODEL_R
         )
-        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)  # MODIFIED: Use synchronous client
-        self.provider_name = "VolcEngine"
-
-    def generate_response(self, request: LLMRequest) -> LLMResponse:  # MODIFIED: Removed async
-        model_to_use = request.model or self.get_model_name(request.use_reasoning_model)
-        messages_dict = [msg.model_dump() for msg in request.messages]
-
-        try:
-            logger.info(f"[{self.provider_name}] Requesting model: {model_to_use} with messages: {messages_dict}")
-            completion = self.client.chat.completions.create(  # MODIFIED: Removed await
-                model=model_to_use,
-                messages=messages_dict,  # type: ignore
-                stream=request.stream,
-                timeout=request.timeout or settings.DEFAULT_TIMEOUT,
-                max_tokens=request.max_tokens,
-                temperature=request.temperature
-            )
-            content = completion.choices[0].message.content
-            logger.info(f"[{self.provider_name}] Response: {content[:200]}...")
-            return LLMResponse(content=content, provider_name=self.provider_name, model_used=model_to_use)
-        except Exception as e:
-            logger.error(f"[{self.provider_name}] Error generating response: {e}")
-            return LLMResponse(error=str(e), provider_name=self.provider_name, model_used=model_to_use)
 
 
 if __name__ == "__main__":
@@ -1,16 +1,32 @@
 from fastapi import FastAPI, HTTPException, Body, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+import json
 import logging
+import redis
+import time
+import uuid
+from typing import Callable
 import uvicorn
 
 from app.core.config import settings
 from app.core.llm_router import llm_router_instance
-from app.schemas import AIRequest, AIResponse, MessageInput, HealthCheckResponse
+from app.core.logging_setup import audit, describe_payload, elapsed_ms, setup_logging
+from app.schemas import AIRequest, AIResponse, MessageInput, HealthCheckResponse, StreamMetricsResponse, \
+    CacheStatsResponse, AIBatchRequest, AIBatchResponse, AIBatchItemResult, TaskStatusBatchRequest, \
+    TaskStatusBatchResponse
+from app.core import batch_store as batch
+from app.core.batch_store import batch_store
+from app.core.idempotency import idempotency_store
+from app.core.admission import admission, PRIORITY_INTERACTIVE, PRIORITY_STANDARD
+from app.core.metrics import render_metrics
+from app.core.response_cache import response_cache
+from app.core.task_results import get_task_statuses
 from app.llm_providers.base_provider import LLMRequest as InternalLLMRequest, Message as InternalMessage
-from app.tasks import generate_ai_response_task
-from celery_app import celery_app
+from app.llm_providers.http_clients import close_http_clients
+from app.tasks import generate_ai_response_task, process_batch_task
 
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="AI Auxiliary Service", version="0.1.0")
@@ -29,36 +45,107 @@ async def startup_event():  # This can remain async, not directly calling the mo
                         f"- Default: {provider.default_model}, Reasoning: {provider.reasoning_model}")
 
 
-@app.post("/api/v1/chat/completions", response_model=AIResponse)
-async def chat_completions(request: AIRequest = Body(...)):  # Endpoint can remain async
-    logger.info(f"Received API request: {request.model_dump(exclude_none=True)}")
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 释放共享的 HTTP 连接池
+    await close_http_clients()
 
+
+def build_internal_request(request: AIRequest) -> InternalLLMRequest:
     internal_messages = [InternalMessage(**msg.model_dump()) for msg in request.messages]
-    llm_req = InternalLLMRequest(
+    return InternalLLMRequest(
         messages=internal_messages,
         model=request.model,
         use_reasoning_model=request.use_reasoning_model,
         stream=request.stream,
-        timeout=request.timeout or (30 if not request.use_reasoning_model else settings.DEFAULT_TIMEOUT),
+        # auto 档位可能升级到推理模型，按推理模型的默认超时
+        timeout=request.timeout or (settings.DEFAULT_TIMEOUT
+                                    if request.use_reasoning_model or request.model_tier in ("auto", "reasoning")
+                                    else 30),
         max_tokens=request.max_tokens,
+        prompt_tokens=request.prompt_tokens,
         temperature=request.temperature,
-        response_format=request.response_format
+        response_format=request.response_format,
+        cache=request.cache,
+        model_tier=request.model_tier,
+        latency_budget=request.latency_budget,
+        required_keys=request.required_keys
     )
 
+
+def dispatched_response(task_id: str) -> AIResponse:
+    return AIResponse(
+        success=True,
+        task_id=task_id,
+        content="Task dispatched for long processing. Check status with task_id."
+    )
+
+
+@app.post("/api/v1/chat/completions", response_model=AIResponse)
+async def chat_completions(request: AIRequest = Body(...)):  # Endpoint can remain async
+    logger.info(f"Received API request: {describe_payload(request.model_dump(exclude_none=True))}")
+
+    llm_req = build_internal_request(request)
+
     if request.use_reasoning_model or (request.timeout and request.timeout > 60):
-        task = generate_ai_response_task.apply_async(
-            args=[request.model_dump(exclude_none=True)],
-            queue='ai_long_running_queue'
-        )
-        logger.info(f"Dispatched to Celery task ID: {task.id}")
-        return AIResponse(
-            success=True,
-            task_id=task.id,
-            content="Task dispatched for long processing. Check status with task_id."
-        )
+        # 命中缓存的长任务直接同步返回，无需占用 Celery worker
+        cached = await run_in_threadpool(llm_router_instance.get_cached_response, llm_req, request.provider)
+        if cached:
+            logger.info("Long-running request served from response cache.")
+            return AIResponse(success=True, content=cached.content, provider_name=cached.provider_name,
+                              model_used=cached.model_used, cached=True)
+        # 调用方重试（如分发超时后不确定是否已受理）时返回原任务，不再重复分发；放在准入检查之前，已受理的请求重试时不会收到 429
+        if request.idempotency_key:
+            existing_task_id = await run_in_threadpool(idempotency_store.get, request.idempotency_key)
+            if existing_task_id:
+                logger.info(f"Idempotency key already dispatched as Celery task ID: {existing_task_id}")
+                return dispatched_response(existing_task_id)
+        # 按优先级进入各自的队列，批量批改不会挡住交互请求；积压超过该级别上限时直接返回 429
+        priority = request.priority or PRIORITY_STANDARD
+        queue = settings.PRIORITY_QUEUES[priority]
+        await admission.check_dispatch(priority, queue)
+        # 相同请求已有任务在执行时，复用其 task_id，而不是再排一个重复任务。
+        # 带回调的请求各自需要收到回调，不复用（worker 内的 single-flight 仍会合并 Provider 调用）
+        has_callback = bool(request.callback_url or request.callback_channel)
+        dedup_key = None if has_callback else llm_router_instance.coalesce_key(llm_req, request.provider)
+        task_id = str(uuid.uuid4())
+        if request.idempotency_key:
+            existing_task_id = await run_in_threadpool(idempotency_store.claim, request.idempotency_key, task_id)
+            if existing_task_id:  # 并发的重试已先分发
+                return dispatched_response(existing_task_id)
+        if dedup_key:
+            existing_task_id = await run_in_threadpool(llm_router_instance.singleflight.claim_task, dedup_key, task_id)
+            if existing_task_id:
+                logger.info(f"Identical request already in flight, reusing Celery task ID: {existing_task_id}")
+                if request.idempotency_key:  # 幂等键随之指向被复用的任务
+                    await run_in_threadpool(idempotency_store.repoint, request.idempotency_key, existing_task_id)
+                return dispatched_response(existing_task_id)
+        try:
+            task = generate_ai_response_task.apply_async(
+                args=[request.model_dump(exclude_none=True)],
+                kwargs={"dedup_key": dedup_key, "enqueued_at": time.time()},
+                task_id=task_id,
+                queue=queue
+            )
+        except Exception:
+            # 任务未能入队，释放指向它的幂等键和去重键，否则相同请求会一直拿到这个不存在的任务
+            if request.idempotency_key:
+                await run_in_threadpool(idempotency_store.release, request.idempotency_key)
+            if dedup_key:
+                await run_in_threadpool(llm_router_instance.singleflight.release_task, dedup_key, task_id)
+            raise
+        logger.info(f"Dispatched to Celery task ID: {task.id} (queue {queue})")
+        return dispatched_response(task.id)
     else:
-        # MODIFIED: Removed await for the synchronous call
-        response = llm_router_instance.get_llm_response(llm_req, provider_name=request.provider)
+        # 使用异步路由，避免阻塞事件循环
+        started = time.monotonic()
+        async with admission.in_flight(request.priority or PRIORITY_INTERACTIVE):
+            if request.hedge and not request.provider:
+                response = await llm_router_instance.ahedged_llm_response(llm_req)
+            else:
+                response = await llm_router_instance.aget_llm_response(llm_req, provider_name=request.provider)
+        audit("completion", request=request.model_dump(exclude_none=True), response=response.model_dump(),
+              duration_ms=elapsed_ms(started))
         if response.error:
             logger.error(f"Error from LLM router: {response.error}")
             # Return 500 for internal LLM errors for clearer client-side handling
@@ -76,41 +163,168 @@ async def chat_completions(request: AIRequest = Body(...)):  # Endpoint can rema
             success=True,
             content=response.content,
             provider_name=response.provider_name,
-            model_used=response.model_used
+            model_used=response.model_used,
+            cached=response.cached
         )
 
 
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that gives its admission slot back when the response ends, however it ends.
+    Releasing in the generator's finally is not enough: if the client disconnects before Starlette
+    starts iterating, the generator body never runs and the in-flight count would leak.
+    """
+
+    def __init__(self, content, release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/v1/chat/completions/stream")
+async def chat_completions_stream(request: AIRequest = Body(...)):
+    """
+    Server-sent events stream of the completion. Emits `delta` events with content pieces and
+    ends with a `done` event (provider, model, ttft_ms, total_ms) or an `error` event.
+    Always served in-process, never dispatched to Celery.
+    """
+    logger.info(f"Received streaming API request: {describe_payload(request.model_dump(exclude_none=True))}")
+    llm_req = build_internal_request(request)
+    if not request.timeout:
+        llm_req.timeout = settings.DEFAULT_TIMEOUT
+
+    # 在返回响应头之前完成准入检查，被拒绝时客户端收到的是 429 而不是中断的事件流
+    priority = request.priority or PRIORITY_INTERACTIVE
+    admission.acquire(priority)
+
+    async def event_source():
+        async for event in llm_router_instance.astream_llm_response(llm_req, provider_name=request.provider):
+            yield format_sse(event)
+
+    return AdmittedStreamingResponse(
+        event_source(),
+        release=lambda: admission.release(priority),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # 防止 nginx 缓冲整段输出
+    )
+
+
+@app.get("/api/v1/chat/completions/stream/metrics", response_model=StreamMetricsResponse)
+async def chat_completions_stream_metrics():
+    return StreamMetricsResponse(**llm_router_instance.stream_metrics())
+
+
+@app.post("/api/v1/chat/completions/batch", response_model=AIBatchResponse)
+async def chat_completions_batch(batch_request: AIBatchRequest = Body(...)):
+    """
+    Runs a list of completion requests as one Celery job with bounded parallelism.
+    Returns a batch_id for /api/v1/chat/completions/batch/{batch_id} (status and partial results)
+    and /api/v1/chat/completions/batch/{batch_id}/cancel.
+    """
+    total = len(batch_request.requests)
+    if total > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {total} > {settings.BATCH_MAX_ITEMS} requests.")
+    max_concurrency = min(batch_request.max_concurrency or settings.BATCH_DEFAULT_CONCURRENCY,
+                          settings.BATCH_MAX_CONCURRENCY)
+    queue = settings.PRIORITY_QUEUES[batch_request.priority]
+    await admission.check_dispatch(batch_request.priority, queue)
+    items = [r.model_dump(exclude_none=True) for r in batch_request.requests]
+    batch_id = await run_in_threadpool(batch_store.create, items, max_concurrency,
+                                       {"priority": batch_request.priority})
+    process_batch_task.apply_async(args=[batch_id], kwargs={"enqueued_at": time.time()},
+                                   task_id=f"batch-{batch_id}", queue=queue)
+    logger.info(f"Dispatched batch {batch_id} with {total} requests, max_concurrency={max_concurrency}")
+    return AIBatchResponse(batch_id=batch_id, status=batch.BATCH_QUEUED, total=total, pending=total)
+
+
+def build_batch_response(batch_id: str, meta: dict, results: dict, include_results: bool) -> AIBatchResponse:
+    items = [AIBatchItemResult(index=i, **results.get(i, {"status": batch.ITEM_QUEUED}))
+             for i in range(int(meta.get("total", 0)))]
+    counts = {s: sum(1 for item in items if item.status == s)
+              for s in (batch.ITEM_COMPLETED, batch.ITEM_FAILED, batch.ITEM_CANCELLED)}
+    return AIBatchResponse(
+        batch_id=batch_id,
+        status=meta.get("status", batch.BATCH_QUEUED),
+        total=len(items),
+        completed=counts[batch.ITEM_COMPLETED],
+        failed=counts[batch.ITEM_FAILED],
+        cancelled=counts[batch.ITEM_CANCELLED],
+        pending=len(items) - sum(counts.values()),
+        results=items if include_results else None
+    )
+
+
+@app.get("/api/v1/chat/completions/batch/{batch_id}", response_model=AIBatchResponse)
+async def get_batch_status(batch_id: str, include_results: bool = True):
+    """Batch progress; results holds every item, finished or not, in submission order."""
+    meta = await run_in_threadpool(batch_store.get_meta, batch_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Batch not found or expired.")
+    # include_results=false 时仍需读取结果以统计各状态数量，只是不返回明细
+    results = await run_in_threadpool(batch_store.get_results, batch_id)
+    return build_batch_response(batch_id, meta, results, include_results)
+
+
+@app.post("/api/v1/chat/completions/batch/{batch_id}/cancel", response_model=AIBatchResponse)
+async def cancel_batch(batch_id: str):
+    """Stops dispatching the batch's remaining items; items already sent to a provider still complete."""
+    if not await run_in_threadpool(batch_store.cancel, batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found or expired.")
+    meta = await run_in_threadpool(batch_store.get_meta, batch_id)
+    results = await run_in_threadpool(batch_store.get_results, batch_id)
+    return build_batch_response(batch_id, meta, results, include_results=False)
+
+
+@app.post("/api/v1/task_status/batch", response_model=TaskStatusBatchResponse)
+async def get_task_status_batch(batch_request: TaskStatusBatchRequest = Body(...)):
+    """Status of up to TASK_STATUS_BATCH_MAX tasks, read from the result backend in one round trip."""
+    task_ids = list(dict.fromkeys(batch_request.task_ids))
+    if len(task_ids) > settings.TASK_STATUS_BATCH_MAX:
+        raise HTTPException(status_code=413,
+                            detail=f"Too many task ids: {len(task_ids)} > {settings.TASK_STATUS_BATCH_MAX}.")
+    try:
+        statuses = await get_task_statuses(task_ids)
+    except redis.RedisError as e:
+        logger.error(f"Reading task results failed: {e}")
+        raise HTTPException(status_code=503, detail="Task result backend unavailable.")
+    return TaskStatusBatchResponse(results={t: AIResponse(**fields) for t, fields in statuses.items()})
+
+
 @app.get("/api/v1/task_status/{task_id}", response_model=AIResponse)
 async def get_task_status(task_id: str):  # This can remain async
-    task_result = celery_app.AsyncResult(task_id)
-    if task_result.ready():
-        if task_result.successful():
-            result_data = task_result.result
-            return AIResponse(
-                success=True,
-                content=result_data.get("content"),
-                error=result_data.get("error"),
-                provider_name=result_data.get("provider_name"),
-                model_used=result_data.get("model_used"),
-                task_id=task_id
-            )
-        else:
-            error_info = str(task_result.result) if task_result.result else "Task failed with no specific error."
-            failure_details = {}
-            if isinstance(task_result.result, dict):
-                failure_details = task_result.result
-            elif hasattr(task_result.result, 'args') and task_result.result.args:  # type: ignore
-                error_info = str(task_result.result.args[0])  # type: ignore
-
-            final_error_message = failure_details.get("error", error_info)
-            logger.error(
-                f"Celery Task {task_id} failed. Result: {task_result.result}, Traceback: {task_result.traceback}")
-            return AIResponse(success=False, error=f"Task failed: {final_error_message}", task_id=task_id,
-                              provider_name=failure_details.get("provider_name"),
-                              model_used=failure_details.get("model_used"))
-    else:
-        return AIResponse(success=False, error="Task not ready or does not exist.",
-                          content=f"Status: {task_result.status}", task_id=task_id)
+    try:
+        statuses = await get_task_statuses([task_id])
+    except redis.RedisError as e:
+        logger.error(f"Reading task result for {task_id} failed: {e}")
+        raise HTTPException(status_code=503, detail="Task result backend unavailable.")
+    return AIResponse(**statuses[task_id])
+
+
+@app.get("/api/v1/router/status")
+async def router_status():
+    """Per-provider EWMA latency, error rate and circuit state as seen by the shared router state."""
+    return await run_in_threadpool(llm_router_instance.provider_status)
+
+
+@app.get("/api/v1/cache/stats", response_model=CacheStatsResponse)
+async def cache_stats():
+    return CacheStatsResponse(**await run_in_threadpool(response_cache.stats))
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus exposition: provider latency/outcomes, tokens, retries, fallbacks, task and queue metrics."""
+    body, content_type = await run_in_threadpool(render_metrics)
+    return Response(content=body, media_type=content_type)
 
 
 @app.get("/health", response_model=HealthCheckResponse)
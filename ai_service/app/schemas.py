@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Literal, Dict
+from typing import List, Optional, Literal, Dict, Any
 
 
 class MessageInput(BaseModel):
@@ -17,12 +17,34 @@ class AIRequest(BaseModel):
     use_reasoning_model: bool = Field(False,
                                       description="Set to true to use the provider's designated reasoning model (MODEL_R).")
     stream: bool = Field(False,
-                         description="Whether to use streaming response. (Currently placeholder for Celery, FastAPI synchronous calls won't stream)")
+                         description="Ignored by /api/v1/chat/completions; use /api/v1/chat/completions/stream for SSE token streaming.")
     timeout: Optional[int] = Field(None, description="Request timeout in seconds.")
     max_tokens: Optional[int] = Field(None, description="Max tokens to generate.")
+    prompt_tokens: Optional[int] = Field(None, ge=0,
+                                         description="Caller's tokenizer count for messages. Charged against the provider's tokens-per-minute limit instead of the character estimate.")
     temperature: Optional[float] = Field(None, ge=0.0, le=2.0, description="Sampling temperature.")
     response_format: Optional[Dict[str, str]] = Field(None,
                                                       description="OpenAI style response_format, e.g. {\"type\": \"json_object\"}")
+    cache: Optional[bool] = Field(None,
+                                  description="Response cache policy. None: cache deterministic calls (temperature 0 or JSON mode); true: always cache; false: bypass the cache.")
+    model_tier: Optional[Literal["auto", "fast", "reasoning"]] = Field(None,
+                                                                      description="Model tier; overrides use_reasoning_model for the model choice. auto: the router picks the fast model for small prompts (escalating to the reasoning model when the answer fails validation) and the reasoning model for large ones, within latency_budget. use_reasoning_model still decides whether the request is dispatched to Celery.")
+    latency_budget: Optional[float] = Field(None, gt=0,
+                                            description="For model_tier=auto: seconds the caller is prepared to wait. The reasoning model is skipped when its recent latency does not fit.")
+    required_keys: Optional[List[str]] = Field(None,
+                                               description="For model_tier=auto with JSON output: keys the answer must contain; a fast-model answer without them is retried on the reasoning model.")
+    hedge: bool = Field(False,
+                        description="Opt-in for short synchronous requests: if the first provider is slow, send the same request to a second provider and keep the first answer.")
+    priority: Optional[Literal["interactive", "standard", "bulk"]] = Field(None,
+                                                                        description="Caller class for admission control. Defaults to interactive for synchronous requests and standard for Celery dispatched ones; use bulk for batch grading.")
+    idempotency_key: Optional[str] = Field(None, max_length=128,
+                                           description="For requests dispatched to Celery: retries carrying the same key within IDEMPOTENCY_TTL get the original task_id back instead of dispatching again.")
+    callback_url: Optional[str] = Field(None,
+                                        description="For requests dispatched to Celery: URL that receives a POST with the task result when it finishes.")
+    callback_channel: Optional[str] = Field(None,
+                                            description="For requests dispatched to Celery: Redis pub/sub channel the task result is published to when it finishes.")
+    callback_metadata: Optional[Dict[str, Any]] = Field(None,
+                                                        description="Opaque data echoed back in the callback body, e.g. {\"submission_id\": 42}.")
 
 
 class AIResponse(BaseModel):
@@ -32,8 +54,65 @@ class AIResponse(BaseModel):
     provider_name: Optional[str] = None
     model_used: Optional[str] = None
     task_id: Optional[str] = None  # For Celery tasks
+    cached: bool = False  # Served from the response cache
+
+
+class AIBatchRequest(BaseModel):
+    requests: List[AIRequest] = Field(..., min_length=1,
+                                      description="Completion requests to run as one batch. Results keep the same order.")
+    priority: Literal["interactive", "standard", "bulk"] = Field("bulk",
+                                                                description="Caller class for admission control of the whole batch.")
+    max_concurrency: Optional[int] = Field(None, ge=1,
+                                           description="Max requests in flight for this batch. Defaults to BATCH_DEFAULT_CONCURRENCY; capped at BATCH_MAX_CONCURRENCY.")
+
+
+class AIBatchItemResult(BaseModel):
+    index: int
+    status: str  # queued / processing / completed / failed / cancelled
+    content: Optional[str] = None
+    error: Optional[str] = None
+    provider_name: Optional[str] = None
+    model_used: Optional[str] = None
+    cached: bool = False
+
+
+class AIBatchResponse(BaseModel):
+    batch_id: str
+    status: str  # queued / running / cancelling / cancelled / finished
+    total: int
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    pending: int = 0
+    results: Optional[List[AIBatchItemResult]] = None
+
+
+class TaskStatusBatchRequest(BaseModel):
+    task_ids: List[str] = Field(..., min_length=1, description="Celery task ids returned by /api/v1/chat/completions.")
+
+
+class TaskStatusBatchResponse(BaseModel):
+    results: Dict[str, AIResponse]  # task_id -> same body as /api/v1/task_status/{task_id}
 
 
 class HealthCheckResponse(BaseModel):
     status: str = "healthy"
     active_providers: List[str]
+
+
+class StreamMetricsResponse(BaseModel):
+    count: int
+    ttft_ms_p50: Optional[float] = None
+    ttft_ms_p95: Optional[float] = None
+    ttft_ms_max: Optional[float] = None
+
+
+class CacheStatsResponse(BaseModel):
+    enabled: bool
+    hits: int = 0
+    misses: int = 0
+    hit_ratio: Optional[float] = None
+    entries: int = 0
+    max_entries: Optional[int] = None
+    ttl_seconds: Optional[int] = None
+    error: Optional[str] = None
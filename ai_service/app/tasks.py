@@ -1,42 +1,68 @@
 # ai_service/app/tasks.py
 # import asyncio # MODIFIED: Removed asyncio import
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
+from app.core import batch_store as batch
+from app.core.batch_store import batch_store
+from app.core.callbacks import deliver_callback
+from app.core import metrics
 from app.core.config import settings
 from app.core.llm_router import llm_router_instance
+from app.core.logging_setup import audit, describe_payload, elapsed_ms
 from app.llm_providers.base_provider import LLMRequest, Message as LLMMessage
 from celery_app import celery_app
 
 logger = logging.getLogger(__name__)
 
 
+def _llm_request_from_payload(ai_payload: dict) -> LLMRequest:
+    messages_data = ai_payload.get("messages", [])
+    if not isinstance(messages_data, list):
+        raise ValueError("Payload 'messages' field must be a list.")
+
+    messages = [LLMMessage(**msg) for msg in messages_data]
+
+    return LLMRequest(
+        messages=messages,
+        model=ai_payload.get("model"),
+        use_reasoning_model=ai_payload.get("use_reasoning_model", True),
+        stream=ai_payload.get("stream", False),
+        timeout=ai_payload.get("timeout", 1500),
+        max_tokens=ai_payload.get("max_tokens"),
+        prompt_tokens=ai_payload.get("prompt_tokens"),
+        temperature=ai_payload.get("temperature"),
+        response_format=ai_payload.get("response_format"),
+        cache=ai_payload.get("cache"),
+        model_tier=ai_payload.get("model_tier"),
+        latency_budget=ai_payload.get("latency_budget"),
+        required_keys=ai_payload.get("required_keys")
+    )
+
+
 @celery_app.task(bind=True, name="ai_service.generate_long_response",
                  default_retry_delay=60, max_retries=2,
                  time_limit=1800, soft_time_limit=1700)
-def generate_ai_response_task(self, ai_payload: dict):
+def generate_ai_response_task(self, ai_payload: dict, dedup_key: Optional[str] = None,
+                              enqueued_at: Optional[float] = None):
     """
     Celery task to generate AI response.
     ai_payload is a dictionary representation of an AIRequest model.
+    dedup_key, when set, is the single-flight key the API registered this task id under; it is
+    released once the task finishes so later identical requests dispatch (or hit the cache) normally.
+    enqueued_at is the API's dispatch timestamp, used for the per-priority queue wait / SLO metrics.
     """
-    logger.info(f"Celery task received with payload: {ai_payload}")
+    logger.info(f"Celery task {self.request.id} received with payload: {describe_payload(ai_payload)}")
+    started = time.monotonic()
+    priority = ai_payload.get("priority") or "standard"
+    if enqueued_at:
+        metrics.TASK_QUEUE_WAIT.labels(priority).observe(max(time.time() - enqueued_at, 0))
 
     try:
-        messages_data = ai_payload.get("messages", [])
-        if not isinstance(messages_data, list):
-            raise ValueError("Payload 'messages' field must be a list.")
-
-        messages = [LLMMessage(**msg) for msg in messages_data]
-
-        llm_req = LLMRequest(
-            messages=messages,
-            model=ai_payload.get("model"),
-            use_reasoning_model=ai_payload.get("use_reasoning_model", True),
-            stream=ai_payload.get("stream", False),
-            timeout=ai_payload.get("timeout", 1500),
-            max_tokens=ai_payload.get("max_tokens"),
-            temperature=ai_payload.get("temperature"),
-            response_format=ai_payload.get("response_format")
-        )
+        llm_req = _llm_request_from_payload(ai_payload)
 
         provider_name = ai_payload.get("provider")
 
@@ -48,13 +74,12 @@ def generate_ai_response_task(self, ai_payload: dict):
         logger.info(f"LLM响应已获取，准备返回结果")
         result_dict = result_model_instance.model_dump()
         logger.info(f"结果已序列化为字典")
-        return result_dict
 
     except ValueError as ve:
         logger.error(f"Celery task failed due to ValueError: {ve}", exc_info=True)
         # Ensure the returned dict structure matches LLMResponse for consistency if possible
         # or a defined error structure for Celery tasks.
-        return {
+        result_dict = {
             "content": None,
             "error": f"Task input data error: {str(ve)}",
             "provider_name": ai_payload.get("provider"),
@@ -63,10 +88,86 @@ def generate_ai_response_task(self, ai_payload: dict):
         }
     except Exception as e:
         logger.error(f"Celery task failed: {e}", exc_info=True)
-        return {
+        result_dict = {
             "content": None,
             "error": f"Task execution failed: {str(e)}",
             "provider_name": ai_payload.get("provider"),
             "model_used": ai_payload.get("model") or (
                 settings.DS_MODEL_R if ai_payload.get("use_reasoning_model") else settings.DS_MODEL)  # Example default
         }
+    finally:
+        if dedup_key:
+            llm_router_instance.singleflight.release_task(dedup_key, self.request.id)
+
+    metrics.observe_task("generate_long_response", priority, "error" if result_dict.get("error") else "success",
+                         started, enqueued_at)
+    audit("task_completion", task_id=self.request.id, request=ai_payload, response=result_dict,
+          duration_ms=elapsed_ms(started))
+    # 主动推送结果；推送失败时调用方仍可通过 task_status 轮询拿到结果
+    deliver_callback(ai_payload, self.request.id, result_dict)
+    return result_dict
+
+
+@celery_app.task(bind=True, name="ai_service.process_batch",
+                 time_limit=settings.BATCH_TIME_LIMIT, soft_time_limit=settings.BATCH_TIME_LIMIT - 100)
+def process_batch_task(self, batch_id: str, enqueued_at: Optional[float] = None):
+    """
+    Runs every item of a batch created by /api/v1/chat/completions/batch.
+    Items fan out over a thread pool of the batch's max_concurrency, and calls to any single
+    provider are additionally capped at BATCH_PROVIDER_CONCURRENCY. Each item's result is written
+    as soon as it finishes so the status endpoint can return partial results; items that have not
+    started when the batch is cancelled are marked cancelled without calling a provider.
+    """
+    meta = batch_store.get_meta(batch_id)
+    if not meta:
+        logger.error(f"Batch {batch_id} not found or expired.")
+        return {"batch_id": batch_id, "status": "missing"}
+    started = time.monotonic()
+    priority = meta.get("priority") or "bulk"
+    if enqueued_at:
+        metrics.TASK_QUEUE_WAIT.labels(priority).observe(max(time.time() - enqueued_at, 0))
+    items = batch_store.get_items(batch_id)
+    if batch_store.is_cancelled(batch_id):
+        for index in range(len(items)):
+            batch_store.set_result(batch_id, index, {"status": batch.ITEM_CANCELLED})
+        batch_store.set_status(batch_id, batch.BATCH_CANCELLED)
+        return {"batch_id": batch_id, "status": batch.BATCH_CANCELLED}
+
+    max_concurrency = max(1, min(int(meta.get("max_concurrency") or settings.BATCH_DEFAULT_CONCURRENCY),
+                                 settings.BATCH_MAX_CONCURRENCY))
+    provider_slots = {
+        getattr(p, 'provider_name', 'UnknownProvider'): threading.BoundedSemaphore(settings.BATCH_PROVIDER_CONCURRENCY)
+        for p in llm_router_instance.providers
+    }
+    batch_store.set_status(batch_id, batch.BATCH_RUNNING)
+    logger.info(f"Batch {batch_id}: {len(items)} items, max_concurrency={max_concurrency}, "
+                f"per-provider limit={settings.BATCH_PROVIDER_CONCURRENCY}")
+
+    def run_item(index: int, ai_payload: dict):
+        if batch_store.is_cancelled(batch_id):
+            batch_store.set_result(batch_id, index, {"status": batch.ITEM_CANCELLED})
+            return
+        batch_store.set_result(batch_id, index, {"status": batch.ITEM_PROCESSING})
+        try:
+            response = llm_router_instance.get_llm_response(
+                _llm_request_from_payload(ai_payload),
+                provider_name=ai_payload.get("provider"),
+                provider_slots=provider_slots
+            )
+            result = response.model_dump(include={"content", "error", "provider_name", "model_used", "cached"})
+            result["status"] = batch.ITEM_FAILED if response.error else batch.ITEM_COMPLETED
+        except Exception as e:
+            logger.error(f"Batch {batch_id} item {index} failed: {e}", exc_info=True)
+            result = {"status": batch.ITEM_FAILED, "error": f"Task execution failed: {str(e)}"}
+        batch_store.set_result(batch_id, index, result)
+        deliver_callback(ai_payload, f"{batch_id}:{index}", result)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"batch-{batch_id[:8]}") as pool:
+        for future in [pool.submit(run_item, i, item) for i, item in enumerate(items)]:
+            future.result()
+
+    status = batch.BATCH_CANCELLED if batch_store.is_cancelled(batch_id) else batch.BATCH_FINISHED
+    batch_store.set_status(batch_id, status)
+    metrics.observe_task("process_batch", priority, status, started, enqueued_at)
+    logger.info(f"Batch {batch_id} {status}.")
+    return {"batch_id": batch_id, "status": status}
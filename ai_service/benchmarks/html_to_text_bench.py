@@ -0,0 +1,71 @@
+"""
+Micro-benchmark: html_to_text (stdlib HTMLParser, memoized) against the BeautifulSoup based
+strip_html_tags it replaced in the DeepSeek provider. The baseline needs `pip install beautifulsoup4`.
+
+    python benchmarks/html_to_text_bench.py [--repeat 200]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.llm_providers.text_utils import _convert, html_to_text  # noqa: E402
+
+SYSTEM_PROMPT = ("<p>课程《数据结构》的作业《链表实现》，描述：<strong>实现单链表的插入、删除与反转</strong>。满分：100。"
+                 "请批改，并以 JSON 输出 score、comment、AI生成疑似度。</p>")
+PARAGRAPH = ("<p>在本次作业中我实现了<strong>单链表</strong>的插入与删除操作，并使用&nbsp;<code>while</code>&nbsp;循环"
+             "完成反转。<br>时间复杂度为 O(n)，空间复杂度为 O(1)。</p>"
+             "<ul><li>插入：头插法与尾插法</li><li>删除：按值删除第一个匹配节点</li></ul>")
+
+
+def legacy_strip_html_tags(html_content: str) -> str:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, "html.parser")
+    for p_tag in soup.find_all('p'):
+        p_tag.append('\n')
+    for br_tag in soup.find_all('br'):
+        br_tag.replace_with('\n')
+    plain_text = soup.get_text(separator=' ')
+    plain_text = re.sub(r'\s*\n\s*', '\n', plain_text)
+    plain_text = re.sub(r'[ \t]+', ' ', plain_text)
+    return plain_text.strip()
+
+
+def bench(name: str, fn, text: str, repeat: int):
+    seconds = min(timeit.repeat(lambda: fn(text), number=repeat, repeat=3)) / repeat
+    print(f"  {name:<32} {seconds * 1e6:>10.1f} us/call")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    try:
+        import bs4  # noqa: F401
+        has_bs4 = True
+    except ImportError:
+        has_bs4 = False
+        print("beautifulsoup4 not installed: only html_to_text is measured.\n")
+
+    cases = {
+        "system prompt (repeated)": SYSTEM_PROMPT,
+        "submission ~5 KB": PARAGRAPH * 20,
+        "submission ~100 KB": PARAGRAPH * 400,
+        "plain text ~100 KB": "def reverse(head):\n    prev = None\n" * 1500,
+    }
+    for case, text in cases.items():
+        print(f"{case} ({len(text)} chars)")
+        new = bench("html_to_text", html_to_text, text, args.repeat)
+        bench("html_to_text (no memoization)", _convert, text, args.repeat)
+        if has_bs4:
+            old = bench("BeautifulSoup strip_html_tags", legacy_strip_html_tags, text, max(1, args.repeat // 10))
+            print(f"  speedup x{old / new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Open-loop load test for the ai_service API and Celery path, runnable entirely offline.
+
+Start Redis, then the API and a worker with the mock provider (keys only need to be non-empty):
+
+    export MOCK_LLM_MODE=true DS_API_KEY=x SF_API_KEY=x VC_API_KEY=x
+    export PROMETHEUS_MULTIPROC_DIR=/tmp/ai_metrics   # lets the API report worker queue wait
+    export RATE_LIMIT_ENABLED=false                   # measure the service, not the provider quotas
+    uvicorn app.main:app --port 8000 &
+    ./run_worker.sh &
+
+Then drive it:
+
+    python benchmarks/loadtest.py --mode sync --rate 50 --duration 60
+    python benchmarks/loadtest.py --mode celery --rate 20 --duration 60 --priority bulk
+
+Requests are sent at a fixed arrival rate regardless of how fast the service answers, so queueing
+shows up as latency instead of a lower request rate. Every prompt carries a nonce so the response
+cache and single-flight do not collapse the load.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+QUEUE_WAIT_METRIC = "ai_celery_queue_wait_seconds"
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def fmt(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.0f} ms"
+
+
+def build_payload(args) -> dict:
+    payload = {
+        "messages": [{"role": "user", "content": f"[{uuid.uuid4()}] {args.prompt}"}],
+        "cache": False,
+        "max_tokens": args.max_tokens,
+    }
+    if args.mode == "celery":
+        payload["use_reasoning_model"] = True
+        payload["priority"] = args.priority
+    elif args.priority:
+        payload["priority"] = args.priority
+    if args.json:
+        payload["response_format"] = {"type": "json_object"}
+    return payload
+
+
+async def queue_wait_buckets(client: httpx.AsyncClient, base_url: str) -> Dict[float, float]:
+    """Cumulative bucket counts of the queue wait histogram summed over priorities; empty if unavailable."""
+    try:
+        response = await client.get(f"{base_url}/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+    buckets: Dict[float, float] = Counter()
+    for family in text_string_to_metric_families(response.text):
+        if family.name != QUEUE_WAIT_METRIC:
+            continue
+        for sample in family.samples:
+            if sample.name.endswith("_bucket"):
+                buckets[float(sample.labels["le"])] += sample.value
+    return buckets
+
+
+def bucket_percentile(before: Dict[float, float], after: Dict[float, float], q: float) -> Optional[float]:
+    """Upper bound of the histogram bucket holding the q-th percentile of observations made during the run."""
+    delta = {le: after.get(le, 0) - before.get(le, 0) for le in after}
+    total = delta.get(float("inf"), 0)
+    if not total:
+        return None
+    for le in sorted(delta):
+        if delta[le] >= total * q / 100:
+            return le
+    return None
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.base_url = args.url.rstrip("/")
+        self.outcomes: Counter = Counter()
+        self.latencies: List[float] = []  # sync: 请求耗时；celery: 受理到轮询发现完成的端到端耗时
+        self.dispatch_latencies: List[float] = []
+        self.pending: Dict[str, float] = {}  # celery: task_id -> sent at
+        self.in_flight = asyncio.Semaphore(args.max_in_flight)
+
+    async def send_one(self, client: httpx.AsyncClient):
+        async with self.in_flight:
+            sent = time.monotonic()
+            try:
+                response = await client.post(f"{self.base_url}/api/v1/chat/completions", json=build_payload(self.args))
+            except httpx.HTTPError as e:
+                self.outcomes[f"transport:{type(e).__name__}"] += 1
+                return
+            elapsed = time.monotonic() - sent
+            data = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+            if response.status_code != 200:
+                self.outcomes[f"http_{response.status_code}"] += 1
+            elif self.args.mode == "celery" and data.get("task_id"):
+                self.dispatch_latencies.append(elapsed)
+                self.pending[data["task_id"]] = sent
+            elif data.get("success"):
+                self.outcomes["ok"] += 1
+                self.latencies.append(elapsed)
+            else:
+                self.outcomes["error"] += 1
+
+    async def poll_tasks(self, client: httpx.AsyncClient, stop: asyncio.Event):
+        while not (stop.is_set() and not self.pending):
+            await asyncio.sleep(self.args.poll_interval)
+            task_ids = list(self.pending)[:500]
+            if not task_ids:
+                continue
+            try:
+                response = await client.post(f"{self.base_url}/api/v1/task_status/batch", json={"task_ids": task_ids})
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                print(f"status poll failed: {e}")
+                continue
+            now = time.monotonic()
+            for task_id, status in response.json()["results"].items():
+                if "Task not ready" in (status.get("error") or ""):
+                    continue
+                sent = self.pending.pop(task_id)
+                self.outcomes["ok" if status.get("success") else "task_failed"] += 1
+                self.latencies.append(now - sent)
+            if stop.is_set() and time.monotonic() > self.drain_deadline:
+                self.outcomes["unfinished"] += len(self.pending)
+                self.pending.clear()
+
+    async def run(self):
+        args = self.args
+        limits = httpx.Limits(max_connections=args.max_in_flight + 10)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            wait_before = await queue_wait_buckets(client, self.base_url)
+            stop = asyncio.Event()
+            poller = asyncio.create_task(self.poll_tasks(client, stop)) if args.mode == "celery" else None
+
+            started = time.monotonic()
+            total = int(args.rate * args.duration)
+            requests = []
+            for i in range(total):
+                # 开环：按固定到达率发送，不等待前一个请求完成
+                await asyncio.sleep(max(0.0, started + i / args.rate - time.monotonic()))
+                requests.append(asyncio.create_task(self.send_one(client)))
+            send_elapsed = time.monotonic() - started
+            await asyncio.gather(*requests)
+            self.drain_deadline = time.monotonic() + args.drain_timeout
+            stop.set()
+            if poller:
+                await poller
+            elapsed = time.monotonic() - started
+            wait_after = await queue_wait_buckets(client, self.base_url)
+
+        self.report(total, send_elapsed, elapsed, wait_before, wait_after)
+
+    def report(self, total: int, send_elapsed: float, elapsed: float, wait_before, wait_after):
+        ok = self.outcomes["ok"]
+        print(f"mode={self.args.mode} target_rate={self.args.rate}/s duration={self.args.duration}s")
+        print(f"sent {total} in {send_elapsed:.1f}s (offered {total / send_elapsed:.1f}/s), "
+              f"finished in {elapsed:.1f}s")
+        print(f"throughput: {ok / elapsed:.1f} ok/s; outcomes: {dict(self.outcomes)}")
+        print(f"latency p50={fmt(percentile(self.latencies, 50))} p95={fmt(percentile(self.latencies, 95))} "
+              f"p99={fmt(percentile(self.latencies, 99))} max={fmt(max(self.latencies, default=None))}")
+        if self.args.mode == "celery":
+            print(f"  (end-to-end, resolution {self.args.poll_interval * 1000:.0f} ms poll interval)")
+            print(f"dispatch p50={fmt(percentile(self.dispatch_latencies, 50))} "
+                  f"p99={fmt(percentile(self.dispatch_latencies, 99))}")
+            if wait_after:
+                print("queue wait (histogram bucket upper bounds) "
+                      f"p50<={fmt(bucket_percentile(wait_before, wait_after, 50))} "
+                      f"p95<={fmt(bucket_percentile(wait_before, wait_after, 95))} "
+                      f"p99<={fmt(bucket_percentile(wait_before, wait_after, 99))}")
+            else:
+                print("queue wait: unavailable (/metrics lacks worker samples; set PROMETHEUS_MULTIPROC_DIR)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for ai_service /api/v1/chat/completions")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--mode", choices=["sync", "celery"], default="sync",
+                        help="sync: in-process completions; celery: reasoning requests dispatched to workers")
+    parser.add_argument("--rate", type=float, default=10, help="requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to keep sending")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="cap on concurrent HTTP requests")
+    parser.add_argument("--priority", choices=["interactive", "standard", "bulk"], default=None)
+    parser.add_argument("--json", action="store_true", help="request JSON mode output")
+    parser.add_argument("--max-tokens", type=int, default=200)
+    parser.add_argument("--prompt", default="请用三句话点评这篇作业。")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--drain-timeout", type=float, default=600,
+                        help="celery mode: how long to wait for dispatched tasks after sending stops")
+    args = parser.parse_args()
+    if args.mode == "celery" and not args.priority:
+        args.priority = "standard"
+    asyncio.run(LoadTest(args).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
+import logging
+
 from celery import Celery
+from celery.signals import setup_logging as celery_setup_logging, worker_init, worker_process_init
 from kombu import Queue, Exchange  # For more advanced routing if needed
-from app.core.config import settings
+from app.core.config import GREEN_POOLS, settings
+from app.core.logging_setup import restart_logging_after_fork, setup_logging
 
 # Ensure ARK_API_KEY is set for VolcEngine provider if it's used within Celery tasks
 # This might be redundant if tasks.py imports from llm_router which initializes providers
@@ -22,19 +26,58 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='Asia/Shanghai',
     enable_utc=True,
-    worker_concurrency=10,  # Default 10 concurrent tasks per worker, adjust as needed
+    worker_pool=settings.CELERY_WORKER_POOL,
+    # Provider 侧的并发与速率由 rate_limiter 统一控制；协程池的任务只占一个 greenlet，并发可以开得很高
+    worker_concurrency=(settings.CELERY_IO_WORKER_CONCURRENCY if settings.CELERY_WORKER_POOL in GREEN_POOLS
+                        else settings.CELERY_WORKER_CONCURRENCY),
     worker_prefetch_multiplier=1,  # To ensure fair task distribution for long tasks
     task_acks_late=True,  # Acknowledge task after it's completed/failed
     task_reject_on_worker_lost=True,  # Requeue task if worker dies
     task_queues=(
         Queue('ai_default_queue', Exchange('ai_default_exchange'), routing_key='ai.default'),
+        Queue('ai_interactive_queue', Exchange('ai_interactive_exchange'), routing_key='ai.interactive'),
         Queue('ai_long_running_queue', Exchange('ai_long_running_exchange'), routing_key='ai.long_running'),
+        Queue('ai_bulk_queue', Exchange('ai_bulk_exchange'), routing_key='ai.bulk'),
     ),
     task_default_queue='ai_default_queue',
     task_default_exchange='ai_default_exchange',
     task_default_routing_key='ai.default',
 )
 
+
+def _socket_patched(pool: str) -> bool:
+    if pool == "gevent":
+        from gevent import monkey
+        return monkey.is_module_patched("socket")
+    from eventlet import patcher
+    return patcher.is_monkey_patched("socket")
+
+
+@worker_init.connect
+def _check_green_pool(sender=None, **kwargs):
+    # 协程池依赖 monkey-patch 让同步的 httpx / redis 调用在等待网络时让出；
+    # 只有在命令行用 -P gevent|eventlet 启动时 Celery 才会在导入任何模块之前完成 patch
+    pool = getattr(sender, "pool_cls", None)
+    if not isinstance(pool, str):
+        pool = getattr(pool, "__module__", "").rsplit(".", 1)[-1]
+    if pool in GREEN_POOLS and not _socket_patched(pool):
+        logging.getLogger(__name__).error(
+            f"Worker started with the {pool} pool but sockets are not monkey-patched; "
+            f"provider calls will block the whole process. Start it with `celery worker -P {pool}`.")
+
+
+@celery_setup_logging.connect
+def _setup_logging(**kwargs):
+    # 接管 Celery 的日志配置（有接收者时 Celery 不再安装自己的同步 handler），与 API 进程共用异步日志管道
+    setup_logging()
+
+
+@worker_process_init.connect
+def _restart_logging(**kwargs):
+    # prefork 子进程继承了队列 handler，但后台写线程不会随 fork 复制
+    restart_logging_after_fork()
+
+
 # Optional: Define routes for specific tasks if needed later
 # celery_app.conf.task_routes = {
 # 'app.tasks.generate_ai_response_async': {'queue': 'ai_long_running_queue'},
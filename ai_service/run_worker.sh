@@ -0,0 +1,50 @@
+#!/usr/bin/env bash
+# 为每个优先级启动独立的 Celery worker 池，批量批改的积压不会占用交互请求的 worker。
+# 各池并发数可通过环境变量调整；单独启动某条队列：./run_worker.sh interactive|standard|bulk
+#
+# AI_WORKER_POOL=gevent|eventlet 切换为协程池：LLM 任务几乎全部时间都在等网络，
+# 一个进程即可同时挂起数百个推理模型请求，内存远小于同等数量的 prefork 进程。
+set -euo pipefail
+cd "$(dirname "$0")"
+
+POOL=${AI_WORKER_POOL:-prefork}
+case "$POOL" in
+  prefork)
+    INTERACTIVE_CONCURRENCY=${AI_WORKER_INTERACTIVE_CONCURRENCY:-8}
+    STANDARD_CONCURRENCY=${AI_WORKER_STANDARD_CONCURRENCY:-10}
+    # 批次任务内部还会按 max_concurrency 开线程并发调用，这里的进程数宜小
+    BULK_CONCURRENCY=${AI_WORKER_BULK_CONCURRENCY:-4}
+    ;;
+  gevent|eventlet)
+    INTERACTIVE_CONCURRENCY=${AI_WORKER_INTERACTIVE_CONCURRENCY:-100}
+    STANDARD_CONCURRENCY=${AI_WORKER_STANDARD_CONCURRENCY:-300}
+    BULK_CONCURRENCY=${AI_WORKER_BULK_CONCURRENCY:-20}
+    # 让 celery_app / HTTP 连接池按协程池配置（连接池上限不低于并发数）
+    export CELERY_WORKER_POOL="$POOL"
+    ;;
+  *) echo "AI_WORKER_POOL must be prefork, gevent or eventlet" >&2; exit 1 ;;
+esac
+LOGLEVEL=${AI_WORKER_LOGLEVEL:-info}
+
+start_lane() {
+  local lane=$1 queues=$2 concurrency=$3
+  # 协程池必须用 -P 在命令行指定，Celery 才会在加载任务模块之前 monkey-patch socket/threading
+  CELERY_IO_WORKER_CONCURRENCY="$concurrency" \
+    celery -A celery_app worker -P "$POOL" -Q "$queues" -c "$concurrency" -n "${lane}@%h" --loglevel="$LOGLEVEL" &
+}
+
+case "${1:-all}" in
+  interactive) start_lane interactive ai_interactive_queue "$INTERACTIVE_CONCURRENCY" ;;
+  standard) start_lane standard ai_long_running_queue,ai_default_queue "$STANDARD_CONCURRENCY" ;;
+  bulk) start_lane bulk ai_bulk_queue "$BULK_CONCURRENCY" ;;
+  all)
+    start_lane interactive ai_interactive_queue "$INTERACTIVE_CONCURRENCY"
+    start_lane standard ai_long_running_queue,ai_default_queue "$STANDARD_CONCURRENCY"
+    start_lane bulk ai_bulk_queue "$BULK_CONCURRENCY"
+    ;;
+  *) echo "usage: $0 [interactive|standard|bulk|all]" >&2; exit 1 ;;
+esac
+
+# 任一 worker 退出时停止其余 worker 并结束脚本，交给进程管理器（supervisor/systemd/docker）重启
+trap 'kill $(jobs -p) 2>/dev/null' EXIT
+wait -n
@@ -0,0 +1,103 @@
+"""
+Shared fixtures for the ai_service test suite.
+
+Run from the ai_service directory:  python -m pytest tests
+Redis is replaced by fakeredis (with Lua support for the rate limiter and single-flight scripts),
+so the suite needs no running services; provider calls go through MockProvider.
+"""
+import os
+import sys
+
+# config.Settings 要求三个 Provider 的 API Key，测试中不会访问真实 API
+os.environ.setdefault("DS_API_KEY", "test")
+os.environ.setdefault("SF_API_KEY", "test")
+os.environ.setdefault("VC_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis  # noqa: E402
+import fakeredis.aioredis  # noqa: E402
+import pytest  # noqa: E402
+
+from app.core import redis_client  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.llm_providers.base_provider import LLMRequest, LLMResponse, Message  # noqa: E402
+from app.llm_providers.mock_provider import MockProvider  # noqa: E402
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def fake_redis(redis_server):
+    return fakeredis.FakeRedis(server=redis_server, decode_responses=True)
+
+
+@pytest.fixture
+def down_redis():
+    """A client whose every command raises redis.ConnectionError, for the fail-open paths."""
+    server = fakeredis.FakeServer()
+    server.connected = False
+    return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+
+@pytest.fixture(autouse=True)
+def shared_redis(redis_server, monkeypatch):
+    """Points get_redis()/get_async_redis() and the module-level singletons at a fresh fake server per test."""
+    sync_client = fakeredis.FakeRedis(server=redis_server, decode_responses=True)
+    async_client = fakeredis.aioredis.FakeRedis(server=redis_server, decode_responses=True)
+    urls = {settings.REDIS_URL, settings.CELERY_BROKER_URL, settings.CELERY_RESULT_BACKEND}
+    monkeypatch.setattr(redis_client, "_sync_clients", {url: sync_client for url in urls})
+    monkeypatch.setattr(redis_client, "_async_clients", {url: async_client for url in urls})
+
+    from app.core.batch_store import batch_store
+    from app.core.idempotency import idempotency_store
+    from app.core.model_tiers import model_tier_policy
+    from app.core.provider_health import provider_health
+    from app.core.rate_limiter import rate_limiter
+    from app.core.response_cache import response_cache
+    from app.core.singleflight import singleflight
+    for singleton in (batch_store, idempotency_store, model_tier_policy, provider_health, rate_limiter,
+                      response_cache, singleflight):
+        monkeypatch.setattr(singleton, "_redis", sync_client)
+    monkeypatch.setattr(provider_health, "_cache", {})
+    monkeypatch.setattr(provider_health, "_cache_at", 0.0)
+    monkeypatch.setattr(model_tier_policy, "_cache", {})
+    return sync_client
+
+
+@pytest.fixture(autouse=True)
+def fast_mock_provider(monkeypatch):
+    """MockProvider answers immediately and deterministically unless a test changes these."""
+    monkeypatch.setattr(settings, "MOCK_LLM_LATENCY_MEDIAN", 0.001)
+    monkeypatch.setattr(settings, "MOCK_LLM_REASONING_LATENCY_MEDIAN", 0.001)
+    monkeypatch.setattr(settings, "MOCK_LLM_LATENCY_SIGMA", 0.0)
+    monkeypatch.setattr(settings, "MOCK_LLM_ERROR_RATE", 0.0)
+    monkeypatch.setattr(settings, "MOCK_LLM_THROTTLE_RATE", 0.0)
+    monkeypatch.setattr(settings, "RETRY_BACKOFF_BASE", 0.0)
+
+
+class NamedMockProvider(MockProvider):
+    """MockProvider under its own name; failing=True makes every call return a provider error, latency fixes its delay."""
+
+    def __init__(self, name: str, failing: bool = False, latency: float = None):
+        super().__init__()
+        self.provider_name = name
+        self.failing = failing
+        self.latency = latency
+        self.calls = 0
+
+    def _latency(self, request: LLMRequest) -> float:
+        return super()._latency(request) if self.latency is None else self.latency
+
+    def _outcome(self, request: LLMRequest) -> LLMResponse:
+        self.calls += 1
+        if self.failing:
+            return LLMResponse(error=f"Error code: 500 - {self.provider_name} down", provider_name=self.provider_name,
+                               model_used=request.model or self.get_model_name(request.use_reasoning_model))
+        return super()._outcome(request)
+
+
+def make_request(content: str = "你好", **fields) -> LLMRequest:
+    return LLMRequest(messages=[Message(role="user", content=content)], **fields)
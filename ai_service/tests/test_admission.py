@@ -0,0 +1,78 @@
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from fastapi import HTTPException
+
+from app.core import redis_client
+from app.core.admission import PRIORITY_BULK, PRIORITY_INTERACTIVE, AdmissionController
+from app.core.config import settings
+
+LIMITS = {
+    "interactive": {"max_in_flight": 2, "max_queue_depth": 0, "retry_after": 2},
+    "standard": {"max_in_flight": 0, "max_queue_depth": 0, "retry_after": 15},
+    "bulk": {"max_in_flight": 1, "max_queue_depth": 3, "retry_after": 60},
+}
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_LIMITS", LIMITS)
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_DEPTH_CACHE_SECONDS", 0)
+    return AdmissionController()
+
+
+def test_in_flight_limit_rejects_with_retry_after(admission):
+    admission.acquire(PRIORITY_INTERACTIVE)
+    admission.acquire(PRIORITY_INTERACTIVE)
+    with pytest.raises(HTTPException) as exc:
+        admission.acquire(PRIORITY_INTERACTIVE)
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "2"
+
+    admission.acquire(PRIORITY_BULK)  # 各级别分别计数
+    admission.release(PRIORITY_INTERACTIVE)
+    admission.acquire(PRIORITY_INTERACTIVE)
+
+
+def test_zero_limit_is_unlimited(admission):
+    for _ in range(50):
+        admission.acquire("standard")
+
+
+def test_unknown_priority_uses_standard_limits(admission):
+    assert admission.limits("vip") == LIMITS["standard"]
+
+
+def test_in_flight_context_releases_on_exception(admission):
+    async def main():
+        with pytest.raises(TimeoutError):
+            async with admission.in_flight(PRIORITY_BULK):
+                raise TimeoutError
+        async with admission.in_flight(PRIORITY_BULK):
+            pass
+
+    asyncio.run(main())
+    assert admission._in_flight[PRIORITY_BULK] == 0
+
+
+def test_check_dispatch_against_queue_depth(admission, shared_redis):
+    queue = settings.PRIORITY_QUEUES[PRIORITY_BULK]
+    shared_redis.rpush(queue, "t1", "t2")
+    asyncio.run(admission.check_dispatch(PRIORITY_BULK, queue))
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(admission.check_dispatch(PRIORITY_BULK, queue, items=2))
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "60"
+
+
+def test_check_dispatch_fails_open_without_broker(admission, monkeypatch):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(redis_client, "_async_clients",
+                        {settings.CELERY_BROKER_URL: fakeredis.aioredis.FakeRedis(server=server)})
+    queue = settings.PRIORITY_QUEUES[PRIORITY_BULK]
+    assert asyncio.run(admission.queue_depth(queue)) is None
+    asyncio.run(admission.check_dispatch(PRIORITY_BULK, queue, items=100))
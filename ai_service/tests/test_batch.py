@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, tasks
+from app.core import batch_store as batch
+from app.core.batch_store import batch_store
+from app.core.config import settings
+from conftest import NamedMockProvider
+
+ITEM = {"messages": [{"role": "user", "content": "批改第 1 题"}]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    dispatched = []
+    monkeypatch.setattr(main.process_batch_task, "apply_async", lambda *a, **kw: dispatched.append(kw["args"][0]))
+    monkeypatch.setattr(main.llm_router_instance, "providers", [NamedMockProvider("Mock")])
+    client = TestClient(main.app)
+    client.dispatched = dispatched
+    return client
+
+
+def run_batch(batch_id):
+    return tasks.process_batch_task.apply(args=[batch_id]).get()
+
+
+def test_batch_runs_items_and_reports_results(client):
+    items = [ITEM, {**ITEM, "provider": "Missing"}, ITEM]
+    created = client.post("/api/v1/chat/completions/batch", json={"requests": items}).json()
+    batch_id = created["batch_id"]
+    assert client.dispatched == [batch_id]
+    assert (created["status"], created["total"], created["pending"]) == (batch.BATCH_QUEUED, 3, 3)
+
+    assert run_batch(batch_id) == {"batch_id": batch_id, "status": batch.BATCH_FINISHED}
+
+    status = client.get(f"/api/v1/chat/completions/batch/{batch_id}").json()
+    assert status["status"] == batch.BATCH_FINISHED
+    assert (status["completed"], status["failed"]) == (2, 1)
+    assert status["results"][1]["error"] == "Provider 'Missing' not found or not initialized."
+    assert status["results"][0]["content"]
+
+
+def test_cancel_before_start_skips_every_item(client):
+    batch_id = client.post("/api/v1/chat/completions/batch", json={"requests": [ITEM, ITEM]}).json()["batch_id"]
+    cancelled = client.post(f"/api/v1/chat/completions/batch/{batch_id}/cancel").json()
+    assert cancelled["status"] == batch.BATCH_CANCELLING
+
+    assert run_batch(batch_id)["status"] == batch.BATCH_CANCELLED
+    assert main.llm_router_instance.providers[0].calls == 0
+    assert all(r["status"] == batch.ITEM_CANCELLED for r in batch_store.get_results(batch_id).values())
+
+
+def test_unknown_or_oversized_batch(client, monkeypatch):
+    assert client.get("/api/v1/chat/completions/batch/nope").status_code == 404
+    assert client.post("/api/v1/chat/completions/batch/nope/cancel").status_code == 404
+    assert run_batch("nope")["status"] == "missing"
+
+    monkeypatch.setattr(settings, "BATCH_MAX_ITEMS", 1)
+    response = client.post("/api/v1/chat/completions/batch", json={"requests": [ITEM, ITEM]})
+    assert response.status_code == 413
+
+
+def test_cancel_of_finished_batch_is_a_no_op(client):
+    batch_id = batch_store.create([ITEM], max_concurrency=1)
+    batch_store.set_status(batch_id, batch.BATCH_FINISHED)
+    assert batch_store.cancel(batch_id)
+    assert not batch_store.is_cancelled(batch_id)
@@ -0,0 +1,92 @@
+import json
+
+import httpx
+import pytest
+
+from app.core import callbacks
+from app.core.callbacks import CALLBACK_TOKEN_HEADER, build_callback_body, deliver_callback
+from app.core.config import settings
+
+RESULT = {"content": "88分", "provider_name": "Mock", "model_used": "mock-chat"}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Records callback POSTs; `backend.statuses` is consumed one per request (200 once exhausted)."""
+    class Backend:
+        def __init__(self):
+            self.requests, self.statuses = [], []
+
+        def handle(self, request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            return httpx.Response(self.statuses.pop(0) if self.statuses else 200, text="")
+
+    backend = Backend()
+    client = httpx.Client(transport=httpx.MockTransport(backend.handle))
+    monkeypatch.setattr(callbacks, "get_sync_http_client", lambda: client)
+    monkeypatch.setattr(settings, "CALLBACK_TOKEN", "secret")
+    monkeypatch.setattr(settings, "CALLBACK_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "CALLBACK_RETRY_DELAY", 0)
+    return backend
+
+
+def test_build_callback_body():
+    body = build_callback_body("t1", RESULT, {"submission_id": 7})
+    assert body["success"] is True and body["metadata"] == {"submission_id": 7}
+    assert build_callback_body("t1", {"content": "部分", "error": "timeout"}, None)["success"] is False
+
+
+def test_posts_result_with_token(backend):
+    payload = {"callback_url": "http://backend/cb", "callback_metadata": {"submission_id": 7}}
+    assert deliver_callback(payload, "t1", RESULT)
+
+    (request,) = backend.requests
+    assert request.headers[CALLBACK_TOKEN_HEADER] == "secret"
+    body = json.loads(request.content)
+    assert (body["task_id"], body["content"], body["metadata"]) == ("t1", "88分", {"submission_id": 7})
+
+
+def test_no_token_header_without_configured_token(backend, monkeypatch):
+    monkeypatch.setattr(settings, "CALLBACK_TOKEN", "")
+    deliver_callback({"callback_url": "http://backend/cb"}, "t1", RESULT)
+    assert CALLBACK_TOKEN_HEADER not in backend.requests[0].headers
+
+
+def test_server_errors_are_retried(backend):
+    backend.statuses = [503, 429]
+    assert deliver_callback({"callback_url": "http://backend/cb"}, "t1", RESULT)
+    assert len(backend.requests) == 3
+
+
+def test_gives_up_after_max_attempts(backend):
+    backend.statuses = [500] * 5
+    assert not deliver_callback({"callback_url": "http://backend/cb"}, "t1", RESULT)
+    assert len(backend.requests) == settings.CALLBACK_MAX_ATTEMPTS
+
+
+def test_client_errors_are_not_retried(backend):
+    backend.statuses = [403]
+    assert not deliver_callback({"callback_url": "http://backend/cb"}, "t1", RESULT)
+    assert len(backend.requests) == 1
+
+
+def test_publishes_to_channel(backend, shared_redis):
+    pubsub = shared_redis.pubsub()
+    pubsub.subscribe("grading")
+    assert pubsub.get_message(timeout=1)["type"] == "subscribe"
+    assert deliver_callback({"callback_channel": "grading"}, "t1", RESULT)
+
+    message = pubsub.get_message(timeout=1)
+    assert json.loads(message["data"])["content"] == "88分"
+    assert backend.requests == []
+
+
+def test_channel_publish_failure_is_reported(backend, down_redis, monkeypatch):
+    monkeypatch.setattr(callbacks, "get_redis", lambda: down_redis)
+    assert not deliver_callback({"callback_url": "http://backend/cb", "callback_channel": "grading"}, "t1", RESULT)
+    assert len(backend.requests) == 1
+
+
+def test_nothing_requested(backend):
+    assert deliver_callback({}, "t1", RESULT)
+    assert backend.requests == []
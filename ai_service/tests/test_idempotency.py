@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core.idempotency import IDEMPOTENCY_KEY, IdempotencyStore
+
+LONG_REQUEST = {"messages": [{"role": "user", "content": "批改这篇作文"}], "use_reasoning_model": True}
+
+
+@pytest.fixture
+def store(fake_redis):
+    return IdempotencyStore(fake_redis)
+
+
+def test_claim_returns_first_task(store):
+    assert store.get("k") is None
+    assert store.claim("k", "t1") is None
+    assert store.claim("k", "t2") == "t1"
+    assert store.get("k") == "t1"
+
+
+def test_repoint_only_existing_claims(store):
+    store.repoint("k", "t9")
+    assert store.get("k") is None
+    store.claim("k", "t1")
+    store.repoint("k", "t2")
+    assert store.get("k") == "t2"
+
+
+def test_release_lets_next_claim_win(store):
+    store.claim("k", "t1")
+    store.release("k")
+    assert store.claim("k", "t2") is None
+
+
+def test_redis_outage_fails_open(down_redis):
+    store = IdempotencyStore(down_redis)
+    assert store.get("k") is None
+    assert store.claim("k", "t1") is None
+    store.repoint("k", "t2")
+    store.release("k")
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    task_ids = []
+
+    def apply_async(*args, task_id, **kwargs):
+        task_ids.append(task_id)
+        return SimpleNamespace(id=task_id)
+
+    monkeypatch.setattr(main.generate_ai_response_task, "apply_async", apply_async)
+    return task_ids
+
+
+def test_retry_with_same_key_gets_original_task(dispatched):
+    client = TestClient(main.app)
+    request = {**LONG_REQUEST, "idempotency_key": "sub-1", "callback_url": "http://backend/cb"}
+
+    first = client.post("/api/v1/chat/completions", json=request).json()["task_id"]
+    second = client.post("/api/v1/chat/completions", json=request).json()["task_id"]
+    assert first == second == dispatched[0]
+    assert len(dispatched) == 1
+
+
+def test_key_follows_task_it_was_merged_into(dispatched, shared_redis):
+    client = TestClient(main.app)
+    first = client.post("/api/v1/chat/completions", json=LONG_REQUEST).json()["task_id"]
+    merged = client.post("/api/v1/chat/completions", json={**LONG_REQUEST, "idempotency_key": "sub-2"}).json()
+
+    assert merged["task_id"] == first
+    assert shared_redis.get(IDEMPOTENCY_KEY.format(key="sub-2")) == first
+    assert len(dispatched) == 1
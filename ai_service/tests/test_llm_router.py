@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.llm_router import LLMRouter
+from conftest import NamedMockProvider, make_request
+
+
+@pytest.fixture
+def router():
+    router = LLMRouter()
+    router.providers = [NamedMockProvider("Alpha", failing=True), NamedMockProvider("Beta")]
+    return router
+
+
+def test_falls_back_to_next_provider(router):
+    alpha, beta = router.providers
+    response = router.get_llm_response(make_request(cache=False))
+
+    assert response.error is None
+    assert response.provider_name == "Beta"
+    assert beta.calls == 1
+    assert router.health.snapshot(["Alpha"])["Alpha"]["consecutive_failures"] == alpha.calls
+
+
+def test_all_providers_failing_retries_then_opens_circuits(router, monkeypatch):
+    monkeypatch.setattr(settings, "RETRY_ATTEMPTS", 2)
+    router.providers[1].failing = True
+
+    response = router.get_llm_response(make_request(cache=False))
+    assert response.error.startswith("All attempts failed.")
+    assert [p.calls for p in router.providers] == [3, 3]  # 每次尝试都把两个 Provider 各调用一次
+
+    # 连续失败达到 ROUTER_FAILURE_THRESHOLD 后全部熔断：冷却期内直接失败，不再调用 Provider
+    response = router.get_llm_response(make_request(cache=False))
+    assert response.error == "All provider circuits are open."
+    assert [p.calls for p in router.providers] == [3, 3]
+
+
+def test_unknown_provider(router):
+    response = router.get_llm_response(make_request(cache=False), provider_name="Gamma")
+    assert response.error == "Provider 'Gamma' not found or not initialized."
+
+
+def test_explicit_provider_ignores_circuit_state(router):
+    response = router.get_llm_response(make_request(cache=False), provider_name="alpha")
+    assert response.error.startswith("Provider alpha failed after")
+    assert router.providers[0].calls == settings.RETRY_ATTEMPTS + 1
+
+
+def test_deterministic_request_served_from_cache(router):
+    request = make_request(response_format={"type": "json_object"})
+    first = router.get_llm_response(request)
+    second = router.get_llm_response(request)
+
+    assert not first.cached and second.cached
+    assert second.content == first.content
+    assert router.providers[1].calls == 1
+
+
+def test_async_route_falls_back(router):
+    response = asyncio.run(router.aget_llm_response(make_request(cache=False)))
+    assert response.provider_name == "Beta"
+
+
+def test_stream_falls_back_before_first_token(router):
+    async def collect():
+        return [event async for event in router.astream_llm_response(make_request(cache=False))]
+
+    events = asyncio.run(collect())
+    assert events[-1]["type"] == "done"
+    assert events[-1]["provider_name"] == "Beta"
+    assert all(e["type"] == "delta" for e in events[:-1])
+    assert "".join(e["content"] for e in events[:-1])
+
+
+def test_stream_error_when_all_circuits_open(router):
+    for provider in router.providers:
+        for _ in range(settings.ROUTER_FAILURE_THRESHOLD):
+            router.health.record_failure(provider.provider_name)
+
+    async def collect():
+        return [event async for event in router.astream_llm_response(make_request(cache=False))]
+
+    assert asyncio.run(collect()) == [{"type": "error", "error": "All provider circuits are open."}]
+
+
+def test_hedge_answers_from_second_provider_when_first_is_slow(router, monkeypatch):
+    slow, fast = NamedMockProvider("Slow", latency=5), NamedMockProvider("Fast")
+    router.providers = [slow, fast]
+    monkeypatch.setattr(router, "_select_providers", lambda name: [slow, fast])
+    monkeypatch.setattr(settings, "HEDGE_DEFAULT_DELAY_MS", 10)
+    monkeypatch.setattr(settings, "HEDGE_MIN_DELAY_MS", 10)
+
+    started = time.monotonic()
+    response = asyncio.run(router.ahedged_llm_response(make_request(cache=False)))
+    assert response.provider_name == "Fast"
+    assert time.monotonic() - started < 2  # 落败的慢请求被取消，不等它返回
+
+
+def test_hedge_not_sent_when_primary_is_fast(router, monkeypatch):
+    primary, secondary = NamedMockProvider("Primary"), NamedMockProvider("Secondary")
+    router.providers = [primary, secondary]
+    monkeypatch.setattr(router, "_select_providers", lambda name: [primary, secondary])
+
+    response = asyncio.run(router.ahedged_llm_response(make_request(cache=False)))
+    assert response.provider_name == "Primary"
+    assert secondary.calls == 0
+
+
+def test_hedge_delay_from_latency_percentile(router, monkeypatch):
+    monkeypatch.setattr(settings, "HEDGE_MIN_SAMPLES", 3)
+    provider = router.providers[1]
+    assert router.hedge_delay_seconds(provider) == settings.HEDGE_DEFAULT_DELAY_MS / 1000
+    for ms in (800, 900, 1000):
+        router.health.record_success(provider.provider_name, latency_ms=ms)
+    router.health._latency_cache.clear()
+    assert router.hedge_delay_seconds(provider) == 1.0
+
+
+class BreaksMidStream(NamedMockProvider):
+    async def astream_response(self, request):
+        self.calls += 1
+        yield "开头"
+        raise RuntimeError("connection reset")
+
+
+def test_stream_does_not_fall_back_after_first_token(router, monkeypatch):
+    broken, healthy = BreaksMidStream("Broken"), NamedMockProvider("Healthy")
+    router.providers = [broken, healthy]
+    monkeypatch.setattr(router, "_select_providers", lambda name: [broken, healthy])
+
+    async def collect():
+        return [event async for event in router.astream_llm_response(make_request(cache=False))]
+
+    events = asyncio.run(collect())
+    assert events == [{"type": "delta", "content": "开头"},
+                      {"type": "error", "error": "connection reset", "provider_name": "Broken",
+                       "model_used": "mock-chat"}]
+    assert healthy.calls == 0
+    assert router.stream_metrics()["count"] == 1
@@ -0,0 +1,110 @@
+import json
+import logging
+import queue
+import sys
+
+import pytest
+
+from app.core import logging_setup
+from app.core.config import settings
+from app.core.logging_setup import (
+    AUDIT_LOGGER_NAME, DroppingQueueHandler, JsonFormatter, _AuditFormatter, _Pipeline, audit, describe_messages,
+    describe_payload,
+)
+
+MESSAGES = [{"role": "system", "content": "你是老师"}, {"role": "user", "content": "第一行\n" + "长" * 50}]
+
+
+def make_record(msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord("ai.test", logging.WARNING, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extra_fields():
+    entry = json.loads(JsonFormatter().format(make_record(task_id="t1", latency_ms=12)))
+    assert entry["msg"] == "hello world"
+    assert (entry["level"], entry["logger"]) == ("WARNING", "ai.test")
+    assert (entry["task_id"], entry["latency_ms"]) == ("t1", 12)
+    assert "args" not in entry and "levelno" not in entry
+
+
+def test_json_formatter_renders_exception():
+    try:
+        raise ValueError("坏了")
+    except ValueError:
+        record = make_record()
+        record.exc_info = sys.exc_info()
+    assert "ValueError: 坏了" in json.loads(JsonFormatter().format(record))["exc"]
+
+
+def test_dropping_queue_handler_never_blocks():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    for _ in range(5):
+        handler.handle(make_record())
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+@pytest.mark.parametrize("mode", ["hash", "truncate", "full"])
+def test_describe_messages_modes(mode, monkeypatch):
+    monkeypatch.setattr(settings, "LOG_PROMPT_MODE", mode)
+    monkeypatch.setattr(settings, "LOG_PROMPT_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(settings, "LOG_PROMPT_MAX_CHARS", 10)
+    text = describe_messages(MESSAGES)
+
+    if mode == "full":
+        assert "长" * 50 in text
+        return
+    assert "user(len=54, sha=" in text
+    assert "长" * 50 not in text
+    if mode == "truncate":
+        assert "'第一行 长长长长长长'…" in text
+    else:
+        assert "第一行" not in text
+
+
+def test_truncate_mode_falls_back_to_hash_outside_sample(monkeypatch):
+    monkeypatch.setattr(settings, "LOG_PROMPT_MODE", "truncate")
+    monkeypatch.setattr(settings, "LOG_PROMPT_SAMPLE_RATE", 0.0)
+    assert "你是老师" not in describe_messages(MESSAGES)
+
+
+def test_describe_payload_hides_only_messages(monkeypatch):
+    monkeypatch.setattr(settings, "LOG_PROMPT_MODE", "hash")
+    text = describe_payload({"messages": MESSAGES, "priority": "bulk"})
+    assert "'priority': 'bulk'" in text
+    assert "你是老师" not in text
+
+
+def test_audit_writes_jsonl_through_pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "AUDIT_LOG_SAMPLE_RATE", 1.0)
+    audit_logger = logging.getLogger(AUDIT_LOGGER_NAME)
+    monkeypatch.setattr(audit_logger, "propagate", False)
+    monkeypatch.setattr(audit_logger, "level", logging.INFO)
+    path = tmp_path / "audit.jsonl"
+    file_handler = logging.FileHandler(path, encoding="utf-8")
+    file_handler.setFormatter(_AuditFormatter())
+    pipeline = _Pipeline(audit_logger, [file_handler], queue_size=10)
+    monkeypatch.setattr(logging_setup, "_pipelines", {"audit": pipeline})
+
+    pipeline.start()
+    try:
+        audit("completion", request={"messages": MESSAGES}, duration_ms=5)
+    finally:
+        pipeline.stop()
+        audit_logger.removeHandler(pipeline.queue_handler)
+        file_handler.close()
+
+    (line,) = path.read_text(encoding="utf-8").splitlines()
+    record = json.loads(line)
+    assert record["event"] == "completion"
+    assert record["request"]["messages"][1]["content"] == MESSAGES[1]["content"]
+
+
+def test_audit_is_noop_when_disabled(monkeypatch):
+    monkeypatch.setattr(logging_setup, "_pipelines", {})
+    emitted = []
+    monkeypatch.setattr(logging.getLogger(AUDIT_LOGGER_NAME), "info", lambda *a, **kw: emitted.append(a))
+    audit("completion")
+    assert emitted == []
@@ -0,0 +1,124 @@
+import asyncio
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core.config import settings
+from app.core.idempotency import IDEMPOTENCY_KEY
+from app.core.singleflight import TASK_KEY
+from conftest import NamedMockProvider
+
+LONG_REQUEST = {"messages": [{"role": "user", "content": "批改这篇作文"}], "use_reasoning_model": True}
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app, raise_server_exceptions=False)
+
+
+@pytest.fixture
+def broker_down(monkeypatch):
+    def apply_async(*args, **kwargs):
+        raise ConnectionError("broker unreachable")
+
+    monkeypatch.setattr(main.generate_ai_response_task, "apply_async", apply_async)
+
+
+def test_long_request_dispatch_reuses_identical_task(client, monkeypatch):
+    dispatched = []
+
+    def apply_async(*args, task_id, **kwargs):
+        dispatched.append(task_id)
+        return SimpleNamespace(id=task_id)
+
+    monkeypatch.setattr(main.generate_ai_response_task, "apply_async", apply_async)
+
+    first = client.post("/api/v1/chat/completions", json=LONG_REQUEST).json()
+    second = client.post("/api/v1/chat/completions", json=LONG_REQUEST).json()
+    assert first["task_id"] == second["task_id"] == dispatched[0]
+    assert len(dispatched) == 1
+
+
+def test_failed_dispatch_releases_dedup_and_idempotency_keys(client, shared_redis, broker_down):
+    response = client.post("/api/v1/chat/completions", json={**LONG_REQUEST, "idempotency_key": "sub-1"})
+
+    assert response.status_code == 500
+    assert not shared_redis.exists(IDEMPOTENCY_KEY.format(key="sub-1"))
+    assert not shared_redis.keys(TASK_KEY.format(key="*"))
+
+
+@pytest.fixture
+def stream_admission(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_LIMITS", {**settings.ADMISSION_LIMITS,
+                                                       "interactive": {"max_in_flight": 1, "retry_after": 2}})
+    monkeypatch.setattr(main.admission, "_in_flight", defaultdict(int))
+    return main.admission
+
+
+def test_stream_releases_admission_when_finished(client, stream_admission, monkeypatch):
+    monkeypatch.setattr(main.llm_router_instance, "providers", [NamedMockProvider("Mock")])
+    with client.stream("POST", "/api/v1/chat/completions/stream", json={"messages": LONG_REQUEST["messages"]}) as r:
+        body = "".join(r.iter_text())
+    assert r.status_code == 200
+    assert "event: done" in body
+    assert stream_admission._in_flight["interactive"] == 0
+
+
+def test_stream_rejected_at_limit(client, stream_admission):
+    stream_admission.acquire("interactive")
+    response = client.post("/api/v1/chat/completions/stream", json={"messages": LONG_REQUEST["messages"]})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    assert stream_admission._in_flight["interactive"] == 1
+
+
+def test_streaming_response_releases_when_client_disconnects_before_body():
+    released, started = [], []
+
+    async def content():
+        started.append(True)
+        yield "data"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        await asyncio.sleep(1)  # 客户端已断开，响应头发不出去
+
+    response = main.AdmittedStreamingResponse(content(), release=lambda: released.append(True))
+    asyncio.run(response({"type": "http", "asgi": {"spec_version": "2.0"}}, receive, send))
+    assert released == [True]
+    assert started == []
+
+
+def test_dispatch_uses_priority_lane_and_sheds_bulk_first(client, shared_redis, monkeypatch):
+    queues = []
+
+    def apply_async(*args, task_id, queue, **kwargs):
+        queues.append(queue)
+        return SimpleNamespace(id=task_id)
+
+    monkeypatch.setattr(main.generate_ai_response_task, "apply_async", apply_async)
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_DEPTH_CACHE_SECONDS", 0)
+    monkeypatch.setattr(main.admission, "_depths", {})
+    bulk_limit = int(settings.ADMISSION_LIMITS["bulk"]["max_queue_depth"])
+    shared_redis.rpush(settings.PRIORITY_QUEUES["bulk"], *range(bulk_limit))  # 批量队列已积压到上限
+
+    def post(priority, content):
+        request = {**LONG_REQUEST, "messages": [{"role": "user", "content": content}], "priority": priority}
+        return client.post("/api/v1/chat/completions", json=request)
+
+    rejected = post("bulk", "整班批改")
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == str(int(settings.ADMISSION_LIMITS["bulk"]["retry_after"]))
+    assert post("standard", "单份批改").status_code == 200
+    assert post("interactive", "课堂提问").status_code == 200
+    assert queues == [settings.PRIORITY_QUEUES["standard"], settings.PRIORITY_QUEUES["interactive"]]
+
+
+def test_every_priority_lane_is_a_declared_celery_queue():
+    declared = {q.name for q in main.generate_ai_response_task.app.conf.task_queues}
+    assert set(settings.PRIORITY_QUEUES.values()) <= declared
@@ -0,0 +1,59 @@
+import time
+
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app import main
+from app.core import metrics
+from app.core.config import settings
+from app.core.llm_router import LLMRouter
+from app.core.metrics import QueueDepthCollector, observe_task
+from conftest import NamedMockProvider, make_request
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_provider_calls_are_counted_by_outcome(monkeypatch):
+    router = LLMRouter()
+    router.providers = [NamedMockProvider("MetricsDown", failing=True), NamedMockProvider("MetricsUp")]
+    monkeypatch.setattr(router, "_select_providers", lambda name: router.providers)
+    ok = dict(provider="MetricsUp", model="mock-chat", outcome="success")
+    failed = dict(provider="MetricsDown", model="mock-chat", outcome="error")
+    before = sample("ai_llm_requests_total", **ok), sample("ai_llm_requests_total", **failed)
+    tokens_before = sample("ai_llm_tokens_total", provider="MetricsUp", model="mock-chat", kind="completion")
+
+    router.get_llm_response(make_request(cache=False, max_tokens=40))
+    assert sample("ai_llm_requests_total", **ok) == before[0] + 1
+    assert sample("ai_llm_requests_total", **failed) == before[1] + 1
+    assert sample("ai_llm_tokens_total", provider="MetricsUp", model="mock-chat", kind="completion") \
+        == tokens_before + 40
+    assert sample("ai_llm_request_duration_seconds_count", **ok) >= 1
+
+
+def test_observe_task_counts_slo_breaches(monkeypatch):
+    monkeypatch.setattr(settings, "PRIORITY_SLO_SECONDS", {"bulk": 60})
+    before = sample("ai_slo_breaches_total", priority="bulk")
+    observe_task("process_batch", "bulk", "finished", time.monotonic(), time.time() - 10)
+    assert sample("ai_slo_breaches_total", priority="bulk") == before
+    observe_task("process_batch", "bulk", "finished", time.monotonic(), time.time() - 120)
+    assert sample("ai_slo_breaches_total", priority="bulk") == before + 1
+    assert sample("ai_celery_tasks_total", task="process_batch", priority="bulk", outcome="finished") >= 2
+
+
+def test_queue_depth_collector(shared_redis, down_redis, monkeypatch):
+    shared_redis.rpush("ai_bulk_queue", "a", "b", "c")
+    (family,) = QueueDepthCollector(["ai_bulk_queue", "ai_interactive_queue"]).collect()
+    assert {s.labels["queue"]: s.value for s in family.samples} == {"ai_bulk_queue": 3, "ai_interactive_queue": 0}
+
+    monkeypatch.setattr(metrics, "get_redis", lambda url=None: down_redis)
+    (family,) = QueueDepthCollector(["ai_bulk_queue"]).collect()
+    assert family.samples == []  # 读不到 broker 时不报数，也不让抓取失败
+
+
+def test_metrics_endpoint(shared_redis):
+    shared_redis.rpush("ai_interactive_queue", "a")
+    response = TestClient(main.app).get("/metrics")
+    assert response.status_code == 200
+    assert 'ai_celery_queue_depth{queue="ai_interactive_queue"} 1.0' in response.text
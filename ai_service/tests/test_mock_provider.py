@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.llm_providers.mock_provider import MockProvider
+from conftest import make_request
+
+
+def test_plain_completion_respects_max_tokens(monkeypatch):
+    monkeypatch.setattr(settings, "MOCK_LLM_COMPLETION_TOKENS", 200)
+    response = MockProvider().generate_response(make_request(max_tokens=30))
+    assert response.error is None
+    assert len(response.content) == 60
+    assert (response.completion_tokens, response.model_used) == (30, "mock-chat")
+    assert MockProvider().generate_response(make_request(use_reasoning_model=True)).model_used == "mock-reasoner"
+
+
+def test_json_mode_returns_grading_object():
+    response = MockProvider().generate_response(make_request(response_format={"type": "json_object"}))
+    assert set(json.loads(response.content)) == {"score", "comment", "AI生成疑似度"}
+
+
+@pytest.mark.parametrize("setting, error, retry_after", [
+    ("MOCK_LLM_ERROR_RATE", "Error code: 500 - mock provider error", None),
+    ("MOCK_LLM_THROTTLE_RATE", "Error code: 429 - mock rate limit", 1.0),
+])
+def test_injected_failures(setting, error, retry_after, monkeypatch):
+    monkeypatch.setattr(settings, setting, 1.0)
+    response = MockProvider().generate_response(make_request())
+    assert (response.error, response.retry_after, response.content) == (error, retry_after, None)
+
+
+def test_seed_makes_runs_reproducible(monkeypatch):
+    monkeypatch.setattr(settings, "MOCK_LLM_SEED", 42)
+    monkeypatch.setattr(settings, "MOCK_LLM_ERROR_RATE", 0.5)
+    monkeypatch.setattr(settings, "MOCK_LLM_LATENCY_SIGMA", 0.5)
+
+    def run():
+        provider = MockProvider()
+        return [(provider._latency(make_request()), provider._outcome(make_request()).error) for _ in range(20)]
+
+    first = run()
+    assert first == run()
+    assert {error is None for _, error in first} == {True, False}
+
+
+def test_stream_yields_whole_completion_in_pieces():
+    async def collect(provider, request):
+        return [piece async for piece in provider.astream_response(request)]
+
+    request = make_request(max_tokens=50)
+    pieces = asyncio.run(collect(MockProvider(), request))
+    assert len(pieces) >= 20
+    assert "".join(pieces) == MockProvider().generate_response(request).content
+
+
+def test_stream_failure_raises_before_first_piece(monkeypatch):
+    monkeypatch.setattr(settings, "MOCK_LLM_ERROR_RATE", 1.0)
+
+    async def first_piece():
+        async for piece in MockProvider().astream_response(make_request()):
+            return piece
+
+    with pytest.raises(RuntimeError, match="mock provider error"):
+        asyncio.run(first_piece())
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.llm_router import LLMRouter
+from app.core.model_tiers import TIER_FAST, TIER_LATENCY_KEY, TIER_REASONING, ModelTierPolicy
+from app.llm_providers.base_provider import LLMResponse
+from conftest import NamedMockProvider, make_request
+
+JSON_MODE = {"type": "json_object"}
+
+
+@pytest.fixture
+def policy(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_TIER_MIN_SAMPLES", 3)
+    monkeypatch.setattr(settings, "MODEL_TIER_LATENCY_PERCENTILE", 0.9)
+    monkeypatch.setattr(settings, "HEDGE_SAMPLES_CACHE_SECONDS", 0)
+    monkeypatch.setattr(settings, "MODEL_TIER_FAST_MAX_PROMPT_TOKENS", 100)
+    monkeypatch.setattr(settings, "MODEL_TIER_ESCALATE", True)
+    return ModelTierPolicy(fake_redis)
+
+
+def test_plan_explicit_requests_are_untouched(policy):
+    request = make_request(model="deepseek-chat", model_tier="auto")
+    assert policy.plan(request) == (request, "explicit")
+    planned, reason = policy.plan(make_request(model_tier=TIER_REASONING))
+    assert planned.use_reasoning_model and reason == "explicit"
+
+
+def test_plan_auto_by_prompt_size(policy):
+    planned, reason = policy.plan(make_request("短", model_tier="auto"))
+    assert (planned.use_reasoning_model, planned.model_tier, reason) == (False, TIER_FAST, "small_prompt")
+    planned, reason = policy.plan(make_request("长" * 400, model_tier="auto"))
+    assert (planned.use_reasoning_model, reason) == (True, "prompt_size")
+    planned, reason = policy.plan(make_request("短", model_tier="auto", prompt_tokens=500))
+    assert reason == "prompt_size"
+
+
+def test_plan_respects_latency_budget(policy):
+    big = make_request("长" * 400, model_tier="auto", latency_budget=5)
+    for _ in range(3):
+        policy.record_latency(make_request(use_reasoning_model=True), 20000)
+    planned, reason = policy.plan(big)
+    assert (planned.use_reasoning_model, reason) == (False, "latency_budget")
+
+
+def test_expected_latency_uses_samples_or_default(policy, fake_redis, down_redis):
+    assert policy.expected_latency_ms(TIER_FAST) == settings.MODEL_TIER_DEFAULT_LATENCY_MS[TIER_FAST]
+    for ms in (100, 200, 300, 400):
+        policy.record_latency(make_request(), ms)
+    policy.record_latency(make_request(model="explicit-model"), 99999)  # 显式模型不计入档位
+    assert fake_redis.llen(TIER_LATENCY_KEY.format(tier=TIER_FAST)) == 4
+    assert policy.expected_latency_ms(TIER_FAST) == 400.0
+
+    local = ModelTierPolicy(down_redis)  # Redis 不可用时退回进程内样本
+    for ms in (10, 20, 30):
+        local.record_latency(make_request(), ms)
+    assert local.expected_latency_ms(TIER_FAST) == 30.0
+
+
+@pytest.mark.parametrize("content, fields, ok", [
+    ("答案", {}, True),
+    ("   ", {}, False),
+    ('{"score": 90}', {"response_format": JSON_MODE}, True),
+    ('```json\n{"score": 90}\n```', {"response_format": JSON_MODE}, True),
+    ('分析如下：{"score": 90} 以上', {"response_format": JSON_MODE}, True),
+    ("90分", {"response_format": JSON_MODE}, False),
+    ('[1, 2]', {"response_format": JSON_MODE}, False),
+    ('{"score": 90}', {"required_keys": ["score", "feedback"]}, False),
+    ('{"score": 90, "feedback": "好"}', {"required_keys": ["score", "feedback"]}, True),
+])
+def test_acceptable(content, fields, ok):
+    assert ModelTierPolicy.acceptable(make_request(**fields), LLMResponse(content=content)) is ok
+
+
+def test_escalation_only_for_failed_fast_auto_answers(policy):
+    original = make_request(model_tier="auto", response_format=JSON_MODE)
+    sent, _ = policy.plan(original)
+    started = time.monotonic()
+
+    retry = policy.escalation(original, sent, LLMResponse(content="不是 JSON"), started)
+    assert retry.use_reasoning_model and retry.model_tier == TIER_REASONING
+    assert policy.escalation(original, sent, LLMResponse(content='{"a": 1}'), started) is None
+    assert policy.escalation(original, sent, LLMResponse(error="timeout"), started) is None
+    assert policy.escalation(original, retry, LLMResponse(content="不是 JSON"), started) is None
+
+
+def test_escalation_skipped_when_budget_is_spent(policy):
+    original = make_request(model_tier="auto", response_format=JSON_MODE, latency_budget=120)
+    sent, _ = policy.plan(original)
+    invalid = LLMResponse(content="不是 JSON")
+    assert policy.escalation(original, sent, invalid, time.monotonic()) is not None
+    # 已用掉 100 秒，剩余预算不够一次推理调用（默认 60 秒）
+    assert policy.escalation(original, sent, invalid, time.monotonic() - 100) is None
+
+
+class TieredProvider(NamedMockProvider):
+    """Fast model answers in prose, reasoning model in JSON."""
+
+    def _outcome(self, request):
+        self.calls += 1
+        content = '{"score": 90}' if request.use_reasoning_model else "九十分"
+        return LLMResponse(content=content, provider_name=self.provider_name,
+                           model_used=self.get_model_name(request.use_reasoning_model))
+
+
+def test_router_escalates_invalid_fast_answer(policy):
+    router = LLMRouter()
+    router.tiers = policy
+    router.providers = [TieredProvider("Tiered")]
+
+    response = router.get_llm_response(make_request(model_tier="auto", response_format=JSON_MODE, cache=False))
+    assert response.content == '{"score": 90}'
+    assert router.providers[0].calls == 2
@@ -0,0 +1,117 @@
+import pytest
+
+from app.core import provider_health as health_module
+from app.core.config import settings
+from app.core.provider_health import (
+    PROBE_KEY, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, ProviderHealthTracker, compute_backoff,
+)
+
+
+@pytest.fixture
+def tracker(fake_redis):
+    return ProviderHealthTracker(fake_redis)
+
+
+def trip(tracker, name):
+    for _ in range(settings.ROUTER_FAILURE_THRESHOLD):
+        tracker.record_failure(name)
+
+
+def test_compute_backoff_honours_capped_retry_after(monkeypatch):
+    monkeypatch.setattr(settings, "RETRY_BACKOFF_BASE", 0.5)
+    monkeypatch.setattr(settings, "RETRY_BACKOFF_MAX", 4.0)
+    monkeypatch.setattr(settings, "RETRY_AFTER_MAX", 10.0)
+    assert all(0 <= compute_backoff(10) <= 4.0 for _ in range(50))
+    assert compute_backoff(0, retry_after=3.0) >= 3.0
+    assert compute_backoff(0, retry_after=600) == 10.0
+
+
+def test_circuit_opens_after_consecutive_failures(tracker):
+    for _ in range(settings.ROUTER_FAILURE_THRESHOLD - 1):
+        tracker.record_failure("A")
+    assert tracker.snapshot(["A"])["A"]["state"] == STATE_CLOSED
+
+    tracker.record_failure("A")
+    state = tracker.snapshot(["A"])["A"]
+    assert state["state"] == STATE_OPEN
+    assert state["opened_at"] > 0
+
+
+def test_open_circuit_is_skipped_during_cool_down(tracker):
+    trip(tracker, "A")
+    assert tracker.order_providers(["A", "B"]) == ["B"]
+    assert tracker.order_providers(["A"]) == []
+
+
+def test_half_open_lets_exactly_one_probe_through(tracker, fake_redis, monkeypatch):
+    trip(tracker, "A")
+    monkeypatch.setattr(settings, "ROUTER_OPEN_SECONDS", 0)
+
+    assert tracker.order_providers(["A"]) == ["A"]
+    assert fake_redis.exists(PROBE_KEY.format(name="A"))
+    assert fake_redis.hget("ai:router:health:A", "state") == STATE_HALF_OPEN
+    # 探测名额已被占用，其它请求（包括其它进程）在探测结束前都不会选到它
+    assert tracker.order_providers(["A"]) == []
+    assert ProviderHealthTracker(fake_redis).order_providers(["A"]) == []
+
+
+def test_successful_probe_closes_circuit(tracker, monkeypatch):
+    trip(tracker, "A")
+    monkeypatch.setattr(settings, "ROUTER_OPEN_SECONDS", 0)
+    tracker.order_providers(["A"])
+
+    tracker.record_success("A", latency_ms=120.0)
+    state = tracker.snapshot(["A"])["A"]
+    assert state["state"] == STATE_CLOSED
+    assert state["consecutive_failures"] == 0
+
+
+def test_failed_probe_reopens_and_frees_probe_slot(tracker, fake_redis, monkeypatch):
+    trip(tracker, "A")
+    monkeypatch.setattr(settings, "ROUTER_OPEN_SECONDS", 0)
+    tracker.order_providers(["A"])
+
+    tracker.record_failure("A")
+    assert tracker.snapshot(["A"])["A"]["state"] == STATE_OPEN
+    assert not fake_redis.exists(PROBE_KEY.format(name="A"))
+
+
+def test_order_prefers_fast_healthy_provider(tracker):
+    for _ in range(5):
+        tracker.record_success("Fast", latency_ms=50.0)
+        tracker.record_success("Slow", latency_ms=5000.0)
+    firsts = [tracker.order_providers(["Fast", "Slow"])[0] for _ in range(200)]
+    assert firsts.count("Fast") > 150
+
+
+def test_latency_percentile_needs_min_samples(tracker, monkeypatch):
+    monkeypatch.setattr(settings, "HEDGE_MIN_SAMPLES", 5)
+    monkeypatch.setattr(settings, "HEDGE_SAMPLES_CACHE_SECONDS", 0)
+    for ms in (10, 20, 30, 40):
+        tracker.record_success("A", latency_ms=ms)
+    assert tracker.latency_percentile("A", 0.9) is None
+
+    tracker.record_success("A", latency_ms=50)
+    assert tracker.latency_percentile("A", 0.9) == 50.0
+    assert tracker.latency_percentile("A", 0.0) == 10.0
+
+
+def test_redis_outage_falls_back_to_local_state(down_redis, caplog):
+    tracker = ProviderHealthTracker(down_redis)
+    trip(tracker, "A")
+
+    assert "process-local health" in caplog.text
+    assert tracker._local["A"]["state"] == STATE_OPEN
+    tracker._cache_at = 0.0
+    assert tracker.snapshot(["A"])["A"]["state"] == STATE_OPEN
+    assert tracker.order_providers(["A", "B"]) == ["B"]
+
+
+def test_snapshot_is_cached_between_reads(tracker, fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "ROUTER_STATE_CACHE_SECONDS", 60)
+    tracker.snapshot(["A"])
+    fake_redis.hset("ai:router:health:A", "state", STATE_OPEN)
+    assert tracker.snapshot(["A"])["A"]["state"] == STATE_CLOSED
+
+    monkeypatch.setattr(health_module.time, "monotonic", lambda: tracker._cache_at + 61)
+    assert tracker.snapshot(["A"])["A"]["state"] == STATE_OPEN
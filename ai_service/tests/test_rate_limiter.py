@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.core.rate_limiter import CONCURRENCY_KEY, ProviderRateLimiter, estimate_request_tokens
+from conftest import make_request
+
+
+@pytest.fixture
+def limiter(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_DEFAULT_RPM", 0)
+    monkeypatch.setattr(settings, "RATE_LIMIT_DEFAULT_TPM", 0)
+    monkeypatch.setattr(settings, "PROVIDER_MAX_CONCURRENCY", 0)
+    monkeypatch.setattr(settings, "RATE_LIMITS", {})
+    return ProviderRateLimiter(fake_redis)
+
+
+def acquire(limiter, request=None, name="A"):
+    with limiter.limit(name, "m", request or make_request(max_tokens=10), max_wait=0) as allowed:
+        return allowed
+
+
+def test_estimate_request_tokens(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_DEFAULT_COMPLETION_TOKENS", 500)
+    assert estimate_request_tokens(make_request("一二三四五六")) == 3 + 500
+    assert estimate_request_tokens(make_request("一二三四五六", prompt_tokens=7, max_tokens=20)) == 27
+
+
+def test_limits_for_overlays_provider_and_model(limiter, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMITS", {"A": {"rpm": 10, "concurrency": 3}, "A:m": {"rpm": 5}})
+    assert limiter.limits_for("A", "m") == {"rpm": 5, "tpm": 0, "concurrency": 3}
+    assert limiter.limits_for("A", "other") == {"rpm": 10, "tpm": 0, "concurrency": 3}
+
+
+def test_rpm_bucket_runs_out(limiter, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMITS", {"A": {"rpm": 2}})
+    assert [acquire(limiter) for _ in range(3)] == [True, True, False]
+    assert acquire(limiter, name="B")  # 各 Provider 的预算互不影响
+
+
+def test_tpm_bucket_charges_estimated_tokens(limiter, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMITS", {"A": {"tpm": 100}})
+    request = make_request("短", max_tokens=60)
+    assert acquire(limiter, request)
+    assert not acquire(limiter, request)
+    assert acquire(limiter, make_request("短", max_tokens=30))
+
+
+def test_concurrency_slot_is_held_until_exit(limiter, fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMITS", {"A": {"concurrency": 1}})
+    with limiter.limit("A", "m", make_request(), max_wait=0) as allowed:
+        assert allowed
+        assert not acquire(limiter)
+    assert fake_redis.zcard(CONCURRENCY_KEY.format(name="A")) == 0
+    assert acquire(limiter)
+
+
+def test_concurrency_slot_released_on_exception(limiter, fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMITS", {"A": {"concurrency": 1}})
+    with pytest.raises(TimeoutError):
+        with limiter.limit("A", "m", make_request(), max_wait=0):
+            raise TimeoutError
+    assert fake_redis.zcard(CONCURRENCY_KEY.format(name="A")) == 0
+
+
+def test_async_limit_releases_slot(limiter, fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMITS", {"A": {"concurrency": 1}})
+
+    async def main():
+        async with limiter.alimit("A", "m", make_request(), max_wait=0) as first:
+            async with limiter.alimit("A", "m", make_request(), max_wait=0) as second:
+                return first, second
+
+    assert asyncio.run(main()) == (True, False)
+    assert fake_redis.zcard(CONCURRENCY_KEY.format(name="A")) == 0
+
+
+def test_waits_for_refill_within_max_wait(limiter, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMITS", {"A": {"rpm": 600}})  # 每 0.1 秒补充一个
+    for _ in range(600):
+        acquire(limiter)
+    with limiter.limit("A", "m", make_request(max_tokens=10), max_wait=2) as allowed:
+        assert allowed
+
+
+def test_disabled_or_unreachable_limiter_lets_requests_through(down_redis, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMITS", {"A": {"rpm": 1, "concurrency": 1}})
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    limiter = ProviderRateLimiter(down_redis)
+    assert all(acquire(limiter) for _ in range(3))
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", False)
+    assert acquire(limiter)
@@ -0,0 +1,76 @@
+import pytest
+
+from app.core.config import settings
+from app.core.response_cache import ENTRY_KEY, ResponseCache, request_cache_key
+from app.llm_providers.base_provider import LLMResponse
+from conftest import make_request
+
+
+@pytest.fixture
+def cache(fake_redis):
+    return ResponseCache(fake_redis)
+
+
+def test_key_ignores_line_endings_and_trailing_whitespace():
+    base = request_cache_key(make_request("第一行\n第二行"))
+    assert request_cache_key(make_request("第一行  \r\n第二行\r\n")) == base
+    assert request_cache_key(make_request("第一行\n 第二行")) != base
+
+
+def test_key_covers_model_provider_and_sampling():
+    request = make_request("题目")
+    base = request_cache_key(request)
+    assert request_cache_key(request, provider_name="DeepSeek") == request_cache_key(request, "deepseek")
+    assert request_cache_key(request, provider_name="DeepSeek") != base
+    assert request_cache_key(make_request("题目", temperature=0.2)) != base
+    assert request_cache_key(make_request("题目", use_reasoning_model=True)) != base
+    assert request_cache_key(make_request("题目", response_format={"type": "json_object"})) != base
+
+
+def test_is_cacheable(monkeypatch):
+    assert ResponseCache.is_cacheable(make_request(temperature=0))
+    assert ResponseCache.is_cacheable(make_request(response_format={"type": "json_object"}))
+    assert not ResponseCache.is_cacheable(make_request(temperature=0.7))
+    assert ResponseCache.is_cacheable(make_request(temperature=0.7, cache=True))
+    assert not ResponseCache.is_cacheable(make_request(temperature=0, cache=False))
+
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", False)
+    assert not ResponseCache.is_cacheable(make_request(temperature=0, cache=True))
+
+
+def test_roundtrip_marks_response_cached(cache):
+    assert cache.get("k") is None
+    cache.set("k", LLMResponse(content="答案", provider_name="Mock", retry_after=3))
+
+    hit = cache.get("k")
+    assert hit.content == "答案" and hit.provider_name == "Mock"
+    assert hit.cached is True
+    assert hit.retry_after is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_errors_and_empty_content_are_not_stored(cache):
+    cache.set("err", LLMResponse(content="部分", error="timeout"))
+    cache.set("empty", LLMResponse(content=""))
+    assert cache.get("err") is None and cache.get("empty") is None
+
+
+def test_evicts_least_recently_used(cache, fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_MAX_ENTRIES", 2)
+    cache.set("a", LLMResponse(content="a"))
+    cache.set("b", LLMResponse(content="b"))
+    fake_redis.zadd("ai:cache:index", {"a": 9e12})  # 模拟 a 刚被读取过
+    cache.set("c", LLMResponse(content="c"))
+
+    assert not fake_redis.exists(ENTRY_KEY.format(key="b"))
+    assert cache.get("a").content == "a"
+    assert cache.get("c").content == "c"
+
+
+def test_redis_outage_is_a_miss(down_redis, caplog):
+    cache = ResponseCache(down_redis)
+    cache.set("k", LLMResponse(content="答案"))
+    assert cache.get("k") is None
+    assert "Response cache read failed" in caplog.text
+    assert "error" in cache.stats()
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core.config import settings
+from app.core.singleflight import LOCK_KEY, RESULT_KEY, TASK_KEY, SingleFlight
+from app.llm_providers.base_provider import LLMResponse
+
+
+@pytest.fixture
+def sf(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "SINGLEFLIGHT_POLL_INTERVAL", 0.01)
+    return SingleFlight(fake_redis)
+
+
+def test_concurrent_threads_share_one_call(sf, fake_redis):
+    started, proceed = threading.Event(), threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        proceed.wait(5)
+        return LLMResponse(content="答案")
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(sf.do("k", fn)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(sf.do("k", fn))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    proceed.set()
+    for t in [leader, *followers]:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert [r.content for r in results] == ["答案"] * 4
+    assert not fake_redis.exists(LOCK_KEY.format(key="k"))
+    assert fake_redis.exists(RESULT_KEY.format(key="k"))
+
+
+def test_exception_propagates_and_releases_lock(sf, fake_redis):
+    def boom():
+        raise RuntimeError("provider exploded")
+
+    with pytest.raises(RuntimeError):
+        sf.do("k", boom)
+    assert not fake_redis.exists(LOCK_KEY.format(key="k"))
+    assert sf._sync_calls == {}
+    assert sf.do("k", lambda: LLMResponse(content="ok")).content == "ok"
+
+
+def test_follower_reads_result_of_other_process(sf, fake_redis):
+    fake_redis.set(LOCK_KEY.format(key="k"), "other-worker")
+    fake_redis.set(RESULT_KEY.format(key="k"), LLMResponse(content="来自其它进程").model_dump_json())
+
+    result = sf.do("k", lambda: pytest.fail("should not call the provider"))
+    assert result.content == "来自其它进程"
+
+
+def test_follower_calls_itself_when_leader_vanishes(sf, fake_redis):
+    fake_redis.set(LOCK_KEY.format(key="k"), "other-worker", px=50)
+    assert sf.do("k", lambda: LLMResponse(content="自己调用")).content == "自己调用"
+
+
+def test_lock_of_other_owner_is_not_released(sf, fake_redis):
+    def fn():
+        fake_redis.set(LOCK_KEY.format(key="k"), "re-acquired-elsewhere")  # 模拟锁过期后被其它进程取得
+        return LLMResponse(content="ok")
+
+    sf.do("k", fn)
+    assert fake_redis.get(LOCK_KEY.format(key="k")) == "re-acquired-elsewhere"
+
+
+def test_redis_outage_calls_provider_directly(down_redis):
+    sf = SingleFlight(down_redis)
+    assert sf.do("k", lambda: LLMResponse(content="ok")).content == "ok"
+    assert sf.claim_task("k", "t1") is None
+
+
+def test_async_callers_share_one_task(sf):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return LLMResponse(content="答案")
+
+    async def main():
+        return await asyncio.gather(*(sf.ado("k", fn) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert {r.content for r in results} == {"答案"}
+    assert sf._async_calls == {}
+
+
+def test_claim_and_release_task(sf, fake_redis):
+    assert sf.claim_task("k", "t1") is None
+    assert sf.claim_task("k", "t2") == "t1"
+
+    sf.release_task("k", "t2")  # 只删除属于自己的去重键
+    assert fake_redis.get(TASK_KEY.format(key="k")) == "t1"
+    sf.release_task("k", "t1")
+    assert sf.claim_task("k", "t3") is None
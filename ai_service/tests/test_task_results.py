@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import fakeredis
+import fakeredis.aioredis
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core import redis_client
+from app.core.config import settings
+from app.core.task_results import TASK_META_KEY, fetch_task_metas, get_task_statuses, task_status_fields
+
+
+def store_meta(client, task_id, status, result, traceback=None):
+    meta = {"status": status, "result": result, "traceback": traceback, "task_id": task_id}
+    client.set(TASK_META_KEY.format(task_id=task_id), json.dumps(meta))
+
+
+def test_mget_reads_all_tasks_at_once(shared_redis):
+    store_meta(shared_redis, "ok", "SUCCESS", {"content": "88分", "provider_name": "Mock"})
+    shared_redis.set(TASK_META_KEY.format(task_id="garbled"), "{not json")
+
+    metas = asyncio.run(fetch_task_metas(["ok", "missing", "garbled"]))
+    assert metas["ok"]["result"]["content"] == "88分"
+    assert metas["missing"] is None and metas["garbled"] is None
+    assert asyncio.run(fetch_task_metas([])) == {}
+
+
+def test_status_fields_for_each_state(shared_redis):
+    store_meta(shared_redis, "ok", "SUCCESS", {"content": "88分", "provider_name": "Mock", "model_used": "m"})
+    store_meta(shared_redis, "exc", "FAILURE", {"exc_type": "ValueError", "exc_message": ["bad prompt"]},
+               traceback="Traceback ...")
+    store_meta(shared_redis, "err", "FAILURE", {"error": "All attempts failed.", "provider_name": "Mock"})
+    store_meta(shared_redis, "run", "STARTED", None)
+
+    statuses = asyncio.run(get_task_statuses(["ok", "exc", "err", "run", "missing"]))
+    assert statuses["ok"] == {"success": True, "content": "88分", "error": None, "provider_name": "Mock",
+                              "model_used": "m", "task_id": "ok"}
+    assert statuses["exc"]["error"] == "Task failed: bad prompt"
+    assert statuses["err"]["error"] == "Task failed: All attempts failed."
+    assert statuses["err"]["provider_name"] == "Mock"
+    assert statuses["run"]["content"] == "Status: STARTED"
+    assert statuses["missing"]["content"] == "Status: PENDING"
+
+
+def test_failure_without_details():
+    fields = task_status_fields("t", {"status": "REVOKED", "result": None})
+    assert fields["error"] == "Task failed: Task failed with no specific error."
+
+
+def test_batch_endpoint(shared_redis, monkeypatch):
+    store_meta(shared_redis, "ok", "SUCCESS", {"content": "88分"})
+    client = TestClient(main.app)
+
+    response = client.post("/api/v1/task_status/batch", json={"task_ids": ["ok", "ok", "missing"]})
+    assert response.status_code == 200
+    assert set(response.json()["results"]) == {"ok", "missing"}
+
+    monkeypatch.setattr(settings, "TASK_STATUS_BATCH_MAX", 1)
+    assert client.post("/api/v1/task_status/batch", json={"task_ids": ["a", "b"]}).status_code == 413
+
+
+def test_backend_outage_returns_503(monkeypatch):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(redis_client, "_async_clients",
+                        {settings.CELERY_RESULT_BACKEND: fakeredis.aioredis.FakeRedis(server=server)})
+    client = TestClient(main.app)
+
+    assert client.get("/api/v1/task_status/t1").status_code == 503
+    assert client.post("/api/v1/task_status/batch", json={"task_ids": ["t1"]}).status_code == 503
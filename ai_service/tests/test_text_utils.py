@@ -0,0 +1,37 @@
+from app.llm_providers.text_utils import HTML_TEXT_CACHE_MAX_CHARS, html_to_text
+
+
+def test_plain_text_is_returned_unchanged():
+    code = "if (a < b && b > 0) {\n    return   a;\n}"
+    assert html_to_text(code) == code
+    assert html_to_text("") == ""
+    assert html_to_text(None) == ""
+
+
+def test_blocks_and_br_become_line_breaks():
+    html = "<h1>标题</h1><p>第一段<br>换行</p><ul><li>一</li><li>二</li></ul>尾部"
+    assert html_to_text(html) == "标题\n第一段\n换行\n一\n二\n尾部"
+
+
+def test_entities_decoded_and_whitespace_collapsed():
+    html = "<p>a &lt; b &amp;&nbsp;c</p>\n\n\n<div>  多个   空格\t制表 </div>"
+    assert html_to_text(html) == "a < b &\xa0c\n多个 空格 制表"
+
+
+def test_script_style_and_head_are_dropped():
+    html = ("<html><head><title>页面</title><style>p {color: red}</style></head>"
+            "<body><script>alert(1)</script><p>正文</p></body></html>")
+    assert html_to_text(html) == "正文"
+
+
+def test_inline_tags_keep_words_together():
+    assert html_to_text("<p>答案是<b>42</b>，<i>对</i>吗</p>") == "答案是42，对吗"
+
+
+def test_malformed_html_does_not_raise():
+    assert html_to_text("<p>未闭合<div>段落</span></b>") == "未闭合\n段落"
+
+
+def test_long_content_bypasses_cache():
+    body = "<p>" + "字" * HTML_TEXT_CACHE_MAX_CHARS + "</p>"
+    assert html_to_text(body) == "字" * HTML_TEXT_CACHE_MAX_CHARS
@@ -41,6 +41,52 @@ MINIO_BUCKET = os.getenv('MINIO_BUCKET', 'edu-bucket')
 
 AI_SERVICE_URL = os.getenv('AI_SERVICE_URL', 'http://localhost:8080/api/v1/chat/completions')
 AI_SERVICE_STATUS_URL = os.getenv('AI_SERVICE_STATUS_URL', 'http://localhost:8080/api/v1/task_status/')
+AI_SERVICE_BATCH_URL = os.getenv('AI_SERVICE_BATCH_URL', 'http://localhost:8080/api/v1/chat/completions/batch')
+# AI 服务完成批改任务后回调的地址（AI 服务需能访问到），以及双方共享的回调令牌（对应 AI 服务的 CALLBACK_TOKEN）；
+# 令牌为空时不请求回调，批改结果只由兜底轮询获取
+AI_CALLBACK_URL = os.getenv('AI_CALLBACK_URL', 'http://localhost:8000/cou/api/ai-callback/grading/')
+AI_CALLBACK_TOKEN = os.getenv('AI_CALLBACK_TOKEN', '')
+# 超过该时间（秒）仍未收到回调的提交，由兜底轮询任务向 AI 服务查询
+AI_CALLBACK_GRACE_SECONDS = int(os.getenv('AI_CALLBACK_GRACE_SECONDS', '300'))
+# Prompt token 预算（utils/prompt_budget.py）：各类模型的上下文长度，以及为回复预留的 token 数（推理模型含思维链）
+AI_MODEL_TOKEN_LIMITS = {
+    'chat': {'context': 64000, 'completion': 8000},
+    'reasoning': {'context': 64000, 'completion': 32000},
+}
+# 模型的 tokenizer.json 路径（如 DeepSeek 发布的分词器，需安装 tokenizers）；未配置时按中英文字符比例估算
+AI_TOKENIZER_PATH = os.getenv('AI_TOKENIZER_PATH', '')
+# AI助教单次提问的 prompt 上限（token），出于成本考虑远小于模型上下文
+AI_TEACHER_MAX_PROMPT_TOKENS = int(os.getenv('AI_TEACHER_MAX_PROMPT_TOKENS', '6000'))
+# AI 批改使用的模型档位（AI 服务的 model_tier）：auto 由 AI 服务按 prompt 大小选择快速 / 推理模型，
+# 快速模型的回答缺少 score / comment 时自动升级到推理模型；reasoning 恢复为始终使用推理模型
+AI_GRADING_MODEL_TIER = os.getenv('AI_GRADING_MODEL_TIER', 'auto')
+# AI 批改结果 JSON 必须包含的字段
+AI_GRADING_REQUIRED_KEYS = ['score', 'comment']
+# 超出单次请求上限的长提交按块批改（course/chunked_grading.py）
+AI_CHUNK_GRADING_CHUNK_TOKENS = int(os.getenv('AI_CHUNK_GRADING_CHUNK_TOKENS', '12000'))  # 每块学生内容的 token 上限
+AI_CHUNK_GRADING_MAX_CHUNKS = int(os.getenv('AI_CHUNK_GRADING_MAX_CHUNKS', '40'))  # 分块数超过该值仍跳过 AI 批改
+AI_CHUNK_GRADING_CONCURRENCY = int(os.getenv('AI_CHUNK_GRADING_CONCURRENCY', '4'))  # 每份提交同时批改的块数
+AI_CHUNK_GRADING_POLL_SECONDS = int(os.getenv('AI_CHUNK_GRADING_POLL_SECONDS', '15'))  # 查询批次进度的间隔
+AI_CHUNK_GRADING_RETRY_MAX_SECONDS = int(os.getenv('AI_CHUNK_GRADING_RETRY_MAX_SECONDS', '600'))  # AI 服务出错时重试间隔按指数增长的上限
+# AI 批改结果兜底轮询（course.tasks.check_ai_grading_results）
+AI_POLL_MAX_PER_RUN = int(os.getenv('AI_POLL_MAX_PER_RUN', '2000'))  # 单次最多检查的提交数，按下次检查时间先后
+AI_POLL_CONCURRENCY = int(os.getenv('AI_POLL_CONCURRENCY', '4'))  # 同时进行的批量状态查询数
+AI_POLL_BACKOFF_BASE_SECONDS = int(os.getenv('AI_POLL_BACKOFF_BASE_SECONDS', '60'))  # 未完成任务的复查间隔按指数增长
+AI_POLL_BACKOFF_MAX_SECONDS = int(os.getenv('AI_POLL_BACKOFF_MAX_SECONDS', '1800'))
+AI_POLL_LEASE_SECONDS = int(os.getenv('AI_POLL_LEASE_SECONDS', '600'))  # 轮询租约，重叠的 beat 执行直接跳过
+# 整班 AI 批改（course/grading_jobs.py）：同一任务同时在途（待分发 + 批改中）的提交数上限，避免挤占学生提交的批改
+AI_GRADING_JOB_CONCURRENCY = int(os.getenv('AI_GRADING_JOB_CONCURRENCY', '20'))
+# 提交相似度检测（course/similarity.py）：字符 k-gram + MinHash 签名，作业内两两比较
+SIMILARITY_SHINGLE_SIZE = int(os.getenv('SIMILARITY_SHINGLE_SIZE', '5'))  # 片段长度（字符）
+SIMILARITY_NUM_PERM = int(os.getenv('SIMILARITY_NUM_PERM', '128'))  # 签名长度，修改后签名会全部重新计算
+SIMILARITY_THRESHOLD = float(os.getenv('SIMILARITY_THRESHOLD', '0.5'))  # 默认列出的最低相似度
+SIMILARITY_MIN_SHINGLES = int(os.getenv('SIMILARITY_MIN_SHINGLES', '50'))  # 内容过短的提交不参与比较
+# AI 批改发件箱（course/grading_outbox.py）：提交时只写入发件箱，由 relay_ai_grading_outbox 分发
+AI_OUTBOX_BATCH_SIZE = int(os.getenv('AI_OUTBOX_BATCH_SIZE', '50'))  # 每次领取的记录数
+AI_OUTBOX_LEASE_SECONDS = int(os.getenv('AI_OUTBOX_LEASE_SECONDS', '300'))  # 领取后多久未完成可被重新领取
+AI_OUTBOX_MAX_ATTEMPTS = int(os.getenv('AI_OUTBOX_MAX_ATTEMPTS', '8'))  # 超过后放弃并标记批改失败
+AI_OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('AI_OUTBOX_RETRY_BASE_SECONDS', '10'))  # 重试间隔按指数增长
+AI_OUTBOX_RETRY_MAX_SECONDS = int(os.getenv('AI_OUTBOX_RETRY_MAX_SECONDS', '600'))
 
 MINIO_ENDPOINT = f'{MINIO_HOST}:{MINIO_PORT}'
 
@@ -150,12 +196,20 @@ REST_FRAMEWORK = {
 CELERY_BEAT_SCHEDULE = {
     'check-ai-grading-results-every-5-minutes': {
         'task': 'course.tasks.check_ai_grading_results',  # 任务的完整路径
-        'schedule': timedelta(minutes=1),  # 每5分钟执行一次
+        'schedule': timedelta(minutes=1),  # 结果由回调推送，轮询仅作兜底；每条提交按 ai_next_check_at 退避，到期的才会被查询
     },
     'check-ai-teacher-messages': {
         'task': 'notifications.tasks.process_ai_teacher_message',  # 任务的完整路径
         'schedule': timedelta(minutes=1),  # 每5分钟执行一次
     },
+    'relay-ai-grading-outbox-every-minute': {
+        'task': 'course.tasks.relay_ai_grading_outbox',
+        'schedule': timedelta(minutes=1),  # 提交后会立即触发，这里兜底处理重试与触发失败的记录
+    },
+    'advance-ai-grading-jobs-every-minute': {
+        'task': 'course.tasks.advance_ai_grading_jobs',
+        'schedule': timedelta(minutes=1),  # 提交批改结束时会立即补入下一批，这里兜底
+    },
     'cleanup-old-ai-submissions-every-hour': {
         'task': 'course.tasks.cleanup_old_processing_ai_submissions',
         'schedule': timedelta(hours=1),  # 每小时执行一次
@@ -175,6 +229,8 @@ CELERY_BEAT_SCHEDULE = {
 # Celery 配置示例 (根据你的需求调整)
 CELERY_BROKER_URL = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/0"
 CELERY_RESULT_BACKEND = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/1"  # 建议为 result_backend 使用不同的数据库，如 /1
+# 定时任务租约锁（utils/redis_lock.py）使用的 Redis，默认与 broker 同库，键以 edu:lease: 为前缀
+REDIS_LOCK_URL = os.getenv('REDIS_LOCK_URL', CELERY_BROKER_URL)
 
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
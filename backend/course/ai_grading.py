@@ -0,0 +1,103 @@
+# backend/course/ai_grading.py
+# AI 批改结果的落库逻辑，供 AI 服务回调接口、兜底轮询任务和同步返回结果共用
+import hashlib
+import logging
+from typing import Optional
+
+from django.conf import settings
+
+from .models import AssignmentSubmission
+from .utils import extract_json_from_string
+
+logger = logging.getLogger(__name__)
+
+_callback_token_warned = False
+
+
+def grading_system_prompt(assignment) -> str:
+    return assignment.ai_grading_prompt or \
+        f"课程《{assignment.course_class.course.name}》的作业《{assignment.title}》，描述：{assignment.description}。满分：{assignment.max_score}。请批改。"
+
+
+def grading_input_hash(submission: AssignmentSubmission, system_prompt: Optional[str] = None) -> str:
+    """
+    批改输入的摘要：提示词、提交标题、正文和附件（对象名即内容 MD5，无需下载）。
+    批量计算同一作业的提交时可传入 system_prompt，避免逐个查询课程信息。
+    """
+    digest = hashlib.sha256()
+    parts = [system_prompt if system_prompt is not None else grading_system_prompt(submission.assignment),
+             submission.title, submission.content]
+    parts += [f"{f.file_name}:{f.original_name}" for f in sorted(submission.files.all(), key=lambda f: f.id)]
+    for part in parts:
+        digest.update((part or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def grading_callback_fields(submission_id: int) -> dict:
+    """
+    批改请求中的回调参数。未配置 AI_CALLBACK_TOKEN 时 AIGradingCallbackView 会拒绝所有回调，
+    此时不请求回调（只告警一次），结果由兜底轮询获取。
+    """
+    global _callback_token_warned
+    if not settings.AI_CALLBACK_TOKEN:
+        if not _callback_token_warned:
+            logger.warning("AI_CALLBACK_TOKEN is not set: AI grading callbacks are disabled, "
+                           "results are collected by polling only.")
+            _callback_token_warned = True
+        return {}
+    return {"callback_url": settings.AI_CALLBACK_URL, "callback_metadata": {"submission_id": submission_id}}
+
+
+def apply_ai_grading_content(submission: AssignmentSubmission, raw_ai_output: str) -> None:
+    """解析 AI 输出的 JSON（score / comment / AI生成疑似度）并写入 submission，调用方负责 save()。"""
+    parsed_json_result = extract_json_from_string(raw_ai_output)
+    assignment = submission.assignment  # 获取关联的作业以得到max_score
+
+    if parsed_json_result and "score" in parsed_json_result and "comment" in parsed_json_result:
+        submission.ai_score = parsed_json_result.get("score")
+        # 确保分数不超过满分
+        if submission.ai_score is not None and assignment.max_score is not None:
+            try:
+                ai_s = float(submission.ai_score)
+                max_s = float(assignment.max_score)
+                submission.ai_score = min(max(0, ai_s), max_s)
+            except (TypeError, ValueError):
+                logger.error(f"Invalid score format from AI for submission {submission.id}: {submission.ai_score}")
+                submission.ai_score = None  # 或标记为解析失败
+
+        submission.ai_comment = parsed_json_result.get("comment")
+        submission.ai_generated_similarity = parsed_json_result.get("AI生成疑似度")
+        submission.ai_grading_status = 'completed'
+        logger.info(f"AI grading completed for submission {submission.id}. Score: {submission.ai_score}")
+    else:
+        submission.ai_grading_status = 'failed'
+        submission.ai_comment = f"AI返回结果解析失败或缺少字段。原始输出: {raw_ai_output[:500]}"
+        logger.error(f"AI result parsing failed for submission {submission.id}. Raw: {raw_ai_output}")
+
+
+# apply_ai_grading_result 可能修改的字段，批量写入（bulk_update）时使用
+GRADING_RESULT_FIELDS = ['ai_score', 'ai_comment', 'ai_generated_similarity', 'ai_grading_status', 'update_time']
+
+
+def apply_ai_grading_result(submission: AssignmentSubmission, ai_api_response: dict, save: bool = True) -> bool:
+    """
+    把 AI 服务的任务结果（task_status 响应或回调请求体，字段相同）应用到 submission 并保存。
+    返回 True 表示任务已结束（完成或失败）；任务仍在处理中时不做修改并返回 False。
+    save=False 时只修改对象，由调用方按 GRADING_RESULT_FIELDS 批量写入。
+    """
+    if ai_api_response.get("success") and ai_api_response.get("content"):  # 任务完成且成功
+        apply_ai_grading_content(submission, ai_api_response.get("content"))
+        if save:
+            submission.save()
+        return True
+
+    error = ai_api_response.get("error")
+    if error and "Task not ready" not in error:  # 任务失败
+        submission.ai_grading_status = 'failed'
+        submission.ai_comment = f"AI批改任务失败: {error}"
+        if save:
+            submission.save(update_fields=['ai_grading_status', 'ai_comment'])
+        logger.warning(f"AI grading task {submission.ai_grading_task_id} failed for submission {submission.id}: {error}")
+        return True
+    return False
@@ -0,0 +1,217 @@
+# backend/course/chunked_grading.py
+# 超长提交的分块批改（map-reduce）：按文件 / 函数边界切块，经 AI 服务批次接口并行批改各块（map），
+# 全部完成后把各块评价交给模型汇总为最终的 score / comment / AI生成疑似度（reduce），结果仍由回调或兜底轮询落库
+import logging
+import re
+from typing import List, Optional, Tuple
+
+import httpx
+from django.conf import settings
+
+from utils.ai_service_client import PRIORITY_STANDARD
+from utils.prompt_budget import CJK_TOKENS_PER_CHAR, count_message_tokens, count_tokens
+from .ai_grading import apply_ai_grading_content, grading_callback_fields, grading_system_prompt
+from .models import AssignmentSubmission
+from .utils import extract_json_from_string
+
+logger = logging.getLogger(__name__)
+
+# AssignmentSubmissionView.create 拼接附件内容时使用的分隔行
+FILE_MARKER_RE = re.compile(r'^--- 文件: (.+?) ---$', re.M)
+# 顶层定义的起始行（Python / JS / TS / Java / C / Go / Rust 等常见写法，以及 Markdown 标题），在这些行之前切分
+BOUNDARY_RE = re.compile(
+    r'^(?=(?:async\s+def|def|class|function|export|public|private|protected|static|interface|struct|func|fn|impl)\b'
+    r'|#{1,3}\s'
+    r'|[A-Za-z_][\w<>:*&\s]*\s[*&]?[A-Za-z_]\w*\s*\([^;]*\)\s*\{?\s*$)',
+    re.M)
+
+CHUNK_OUTPUT_FORMAT = '{"score": 数字, "comment": "评语", "AI生成疑似度": 0到1之间的小数}'
+
+
+def _split_at(text: str, pattern: re.Pattern) -> List[str]:
+    starts = sorted({0, *(m.start() for m in pattern.finditer(text))})
+    return [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)]) if text[a:b].strip()]
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """函数边界切不开的超长片段：依次按空行、换行切分，仍超长的单行按字符数硬切。"""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    for separator in ('\n\n', '\n'):
+        parts = [p for p in text.split(separator) if p.strip()]
+        if len(parts) > 1:
+            return [piece for part in _pack(parts, max_tokens, separator) for piece in _split_oversized(part, max_tokens)]
+    step = max(1, int(max_tokens / CJK_TOKENS_PER_CHAR))  # 按最坏情况（全是中文）估算字符数
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+def _pack(pieces: List[str], max_tokens: int, joiner: str) -> List[str]:
+    """相邻片段贪心合并，每块不超过 max_tokens（单个超长片段原样成块，由调用方继续切分）。"""
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(joiner.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append(joiner.join(current))
+    return chunks
+
+
+def split_submission(content: str, max_tokens: int) -> List[Tuple[str, str]]:
+    """
+    把提交内容切成不超过 max_tokens 的块，返回 [(标签, 文本)]。
+    优先在文件边界切分；同一文件内的小片段合并成块，超长文件再在函数 / 类定义处切开。
+    """
+    files = []  # [(文件名, 内容)]
+    markers = list(FILE_MARKER_RE.finditer(content))
+    head = content[:markers[0].start()] if markers else content
+    if head.strip():
+        files.append(("正文", head))
+    for marker, next_marker in zip(markers, markers[1:] + [None]):
+        body = content[marker.end():next_marker.start() if next_marker else len(content)]
+        if body.strip():
+            files.append((marker.group(1), body))
+
+    chunks = []
+    for name, body in files:
+        pieces = [p for unit in _split_at(body, BOUNDARY_RE) for p in _split_oversized(unit, max_tokens)]
+        parts = _pack(pieces, max_tokens, '')
+        for index, part in enumerate(parts, start=1):
+            label = name if len(parts) == 1 else f"{name} 第{index}/{len(parts)}段"
+            chunks.append((label, part))
+    return chunks
+
+
+def build_chunk_messages(system_prompt: str, title: str, label: str, text: str, index: int, total: int,
+                         max_score) -> List[dict]:
+    instructions = (
+        f"\n\n本次提交内容较长，已按文件 / 函数拆分为 {total} 部分分别批改，你现在只看到第 {index} 部分（{label}）。"
+        f"请只依据这一部分评价：score 为按满分 {max_score} 折算的该部分得分，comment 写明该部分的优点与问题，"
+        f"并以 JSON 输出：{CHUNK_OUTPUT_FORMAT}"
+    )
+    return [
+        {"role": "system", "content": system_prompt + instructions},
+        {"role": "user", "content": f"学生作业标题：{title}\n第 {index}/{total} 部分（{label}）：\n{text}"},
+    ]
+
+
+def build_reduce_messages(system_prompt: str, title: str, chunks: List[dict], results: List[dict],
+                          max_score) -> List[dict]:
+    """chunks 为 submission.ai_grading_chunks，results 为批次中各块的结果（与 chunks 同序）。"""
+    parts = []
+    for index, (chunk, result) in enumerate(zip(chunks, results), start=1):
+        parsed = extract_json_from_string(result.get("content") or "") if result.get("status") == "completed" else None
+        header = f"### 第 {index} 部分（{chunk['label']}，约 {chunk['tokens']} tokens）"
+        if not parsed:
+            parts.append(f"{header}\n（该部分批改失败，请根据其余部分酌情评价）")
+            continue
+        parts.append(f"{header}\n得分: {parsed.get('score')}\n评语: {parsed.get('comment')}\n"
+                     f"AI生成疑似度: {parsed.get('AI生成疑似度')}")
+    instructions = (
+        f"\n\n这份提交内容较长，已分成 {len(chunks)} 部分分别批改。请综合各部分的评价（结合各部分篇幅与重要性）"
+        f"给出整份作业的最终批改：score 为满分 {max_score} 下的总分，comment 为面向学生的完整评语，"
+        f"并以 JSON 输出：{CHUNK_OUTPUT_FORMAT}"
+    )
+    return [
+        {"role": "system", "content": system_prompt + instructions},
+        {"role": "user", "content": f"学生作业标题：{title}\n各部分批改结果：\n\n" + "\n\n".join(parts)},
+    ]
+
+
+def _grading_payload(messages: List[dict], priority: str, **extra) -> dict:
+    return {
+        "messages": messages,
+        "use_reasoning_model": True,
+        "model_tier": settings.AI_GRADING_MODEL_TIER,
+        "required_keys": settings.AI_GRADING_REQUIRED_KEYS,
+        "response_format": {"type": "json_object"},
+        "priority": priority,
+        "prompt_tokens": count_message_tokens(messages),
+        **extra,
+    }
+
+
+def start_chunked_grading(submission: AssignmentSubmission, content: str,
+                          priority: str = PRIORITY_STANDARD) -> Optional[str]:
+    """
+    切块并把各块作为一个批次提交给 AI 服务。返回 None 表示已开始（submission 置为 processing），
+    否则返回未能分块批改的原因（调用方据此标记 skipped / failed）。
+    priority 随提交保存，汇总请求沿用同一队列（整班批改走批量队列）。
+    """
+    chunks = split_submission(content, settings.AI_CHUNK_GRADING_CHUNK_TOKENS)
+    if len(chunks) > settings.AI_CHUNK_GRADING_MAX_CHUNKS:
+        return f"提交内容过长（分块后共 {len(chunks)} 部分，超过上限 {settings.AI_CHUNK_GRADING_MAX_CHUNKS}）"
+
+    system_prompt = grading_system_prompt(submission.assignment)
+    max_score = submission.assignment.max_score
+    requests = [
+        _grading_payload(build_chunk_messages(system_prompt, submission.title, label, text, i, len(chunks), max_score),
+                         priority)
+        for i, (label, text) in enumerate(chunks, start=1)
+    ]
+    batch_request = {
+        "requests": requests,
+        "priority": priority,
+        "max_concurrency": settings.AI_CHUNK_GRADING_CONCURRENCY,
+    }
+    with httpx.Client(timeout=20.0) as client:  # 只是提交批次，AI 服务立即返回 batch_id
+        response = client.post(settings.AI_SERVICE_BATCH_URL, json=batch_request)
+        response.raise_for_status()
+        batch = response.json()
+
+    submission.ai_grading_status = 'processing'
+    submission.ai_grading_task_id = None
+    submission.ai_grading_batch_id = batch["batch_id"]
+    submission.ai_grading_chunks = [{"label": label, "tokens": count_tokens(text)} for label, text in chunks]
+    submission.ai_grading_chunks_total = len(chunks)
+    submission.ai_grading_chunks_done = 0
+    submission.ai_grading_priority = priority
+    submission.save(update_fields=['ai_grading_status', 'ai_grading_task_id', 'ai_grading_batch_id',
+                                   'ai_grading_chunks', 'ai_grading_chunks_total', 'ai_grading_chunks_done',
+                                   'ai_grading_priority',
+                                   'update_time'])
+    logger.info(f"Chunked AI grading batch {batch['batch_id']} started for submission {submission.id}: "
+                f"{len(chunks)} chunks")
+
+    from .tasks import advance_chunked_grading  # 延迟导入，tasks 依赖本模块
+    advance_chunked_grading.apply_async(args=[submission.id], countdown=settings.AI_CHUNK_GRADING_POLL_SECONDS)
+    return None
+
+
+def dispatch_reduce(submission: AssignmentSubmission, results: List[dict]):
+    """所有块结束后提交汇总请求；与单次批改相同，结果经 AIGradingCallbackView 回调或兜底轮询落库。"""
+    completed = sum(1 for r in results if r.get("status") == "completed")
+    if not completed:
+        errors = {r.get("error") for r in results if r.get("error")}
+        submission.ai_grading_status = 'failed'
+        submission.ai_comment = f"AI分块批改失败: {'; '.join(sorted(errors))[:500] or '全部分块均未完成'}"
+        submission.save(update_fields=['ai_grading_status', 'ai_comment', 'update_time'])
+        return
+
+    messages = build_reduce_messages(grading_system_prompt(submission.assignment), submission.title, submission.ai_grading_chunks, results,
+                                     submission.assignment.max_score)
+    payload = _grading_payload(messages, submission.ai_grading_priority or PRIORITY_STANDARD,
+                               # 同一批次的汇总请求使用固定的幂等键：提交超时后重试不会在 AI 服务中排入第二个汇总任务
+                               idempotency_key=f"reduce:{submission.id}:{submission.ai_grading_batch_id}",
+                               **grading_callback_fields(submission.id))
+    with httpx.Client(timeout=20.0) as client:
+        response = client.post(settings.AI_SERVICE_URL, json=payload)
+        response.raise_for_status()
+        ai_api_response = response.json()
+
+    if ai_api_response.get("success") and ai_api_response.get("task_id"):
+        # 与单次批改相同，只写 task_id，避免覆盖可能已先到达的回调结果
+        AssignmentSubmission.objects.filter(pk=submission.pk).update(
+            ai_grading_task_id=ai_api_response["task_id"], ai_next_check_at=None, ai_check_attempts=0)
+        logger.info(f"Chunked AI grading reduce task {ai_api_response['task_id']} dispatched for submission "
+                    f"{submission.id} ({completed}/{len(results)} chunks graded).")
+    elif ai_api_response.get("success") and ai_api_response.get("content"):
+        apply_ai_grading_content(submission, ai_api_response["content"])
+        submission.save()
+    else:
+        submission.ai_grading_status = 'failed'
+        submission.ai_comment = f"AI服务调用失败: {ai_api_response.get('error', '未知错误')}"
+        submission.save(update_fields=['ai_grading_status', 'ai_comment', 'update_time'])
@@ -0,0 +1,34 @@
+# backend/course/file_text_cache.py
+# 附件文本缓存：MinIO 对象名即文件内容 MD5，按对象名缓存解码后的文本、编码和 token 数，
+# 重新批改、重新提交以及多名学生上传的相同文件都不必再下载和检测编码
+import logging
+from typing import Dict, Iterable
+
+from utils.minio_tools import MinioClient
+from utils.prompt_budget import count_tokens
+from .models import FileTextCache
+from .utils import detect_and_decode
+
+logger = logging.getLogger(__name__)
+
+
+def get_file_texts(object_names: Iterable[str], minio: MinioClient) -> Dict[str, FileTextCache]:
+    """
+    返回 {对象名: 缓存记录}。未缓存的对象下载并解码后写入缓存；下载失败的对象不在结果中，由调用方决定是否重试。
+    """
+    names = set(object_names)
+    cached = FileTextCache.objects.in_bulk(list(names))
+    created = []
+    for name in names - cached.keys():
+        raw = minio.download_file(name)
+        if raw is None:
+            continue
+        text, encoding = detect_and_decode(raw)
+        cached[name] = FileTextCache(object_name=name, text=text, encoding=encoding,
+                                     token_count=count_tokens(text), size=len(raw))
+        created.append(cached[name])
+    if created:
+        # 并发的分发任务可能同时解码同一文件，内容相同，冲突时保留先写入的一条
+        FileTextCache.objects.bulk_create(created, ignore_conflicts=True)
+        logger.info(f"Cached extracted text for {len(created)} files ({len(names) - len(created)} already cached).")
+    return cached
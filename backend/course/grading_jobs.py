@@ -0,0 +1,123 @@
+# backend/course/grading_jobs.py
+# 教师发起的整班 AI 批改：创建任务时按输入摘要筛掉未变化和正在批改的提交，其余按 AI_GRADING_JOB_CONCURRENCY
+# 分批放入发件箱（分发、回调与兜底轮询都与学生提交共用），有提交批改结束就补入下一批，直到全部完成
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .ai_grading import grading_input_hash, grading_system_prompt
+from .grading_outbox import enqueue_ai_grading_batch
+from .models import AIGradingJob, AIGradingOutbox, Assignment, AssignmentSubmission
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT_STATUSES = ('pending', 'processing')  # 待分发、批改中
+
+
+def create_ai_grading_job(assignment: Assignment, user, submission_ids: Optional[List[int]] = None,
+                          force: bool = False) -> Tuple[AIGradingJob, bool]:
+    """
+    为作业创建整班批改任务并放入第一批提交，返回 (任务, 是否新建)。作业已有进行中的任务时直接返回该任务。
+    submission_ids 为空时选取全部已提交的作业；force=True 时不跳过输入未变化的提交。
+    """
+    with transaction.atomic():
+        Assignment.objects.select_for_update().get(pk=assignment.pk)  # 同一作业的创建请求串行执行
+        running = assignment.ai_grading_jobs.filter(status='running').first()
+        if running:
+            return running, False
+
+        submissions = AssignmentSubmission.objects.filter(assignment=assignment, submitted=True) \
+            .prefetch_related('files').order_by('id')
+        if submission_ids is not None:
+            submissions = submissions.filter(pk__in=submission_ids)
+        system_prompt = grading_system_prompt(assignment)
+        selected, unchanged, in_progress = [], 0, 0
+        for submission in submissions:
+            if submission.ai_grading_status in IN_FLIGHT_STATUSES:
+                in_progress += 1
+            elif not force and submission.ai_grading_status == 'completed' and \
+                    submission.ai_grading_input_hash == grading_input_hash(submission, system_prompt):
+                unchanged += 1
+            else:
+                selected.append(submission.id)
+
+        job = AIGradingJob.objects.create(assignment=assignment, created_by=user, submission_ids=selected,
+                                          skipped_unchanged=unchanged, skipped_in_progress=in_progress)
+        logger.info(f"AI grading job {job.id} created for assignment {assignment.id}: {len(selected)} to grade, "
+                    f"{unchanged} unchanged, {in_progress} already in progress.")
+        fill_ai_grading_job(job.id)
+    job.refresh_from_db()
+    return job, True
+
+
+def _job_submissions(job: AIGradingJob):
+    return AssignmentSubmission.objects.filter(ai_outbox__job=job)
+
+
+def fill_ai_grading_job(job_id: int) -> Optional[AIGradingJob]:
+    """
+    补入下一批提交，使任务在途（待分发 + 批改中）的提交数不超过 AI_GRADING_JOB_CONCURRENCY；
+    全部放入且都已结束时把任务标记为完成。任务不存在或已完成时返回 None。
+    """
+    with transaction.atomic():
+        job = AIGradingJob.objects.select_for_update().filter(pk=job_id, status='running').first()
+        if job is None:
+            return None
+        in_flight = _job_submissions(job).filter(ai_grading_status__in=IN_FLIGHT_STATUSES).count()
+        capacity = max(settings.AI_GRADING_JOB_CONCURRENCY - in_flight, 0)
+        batch_ids = job.submission_ids[job.enqueued:job.enqueued + capacity]
+
+        if batch_ids:
+            # 其间学生重新提交等已进入批改的提交不再重复分发，计入 skipped_in_progress
+            ids = list(AssignmentSubmission.objects.select_for_update().filter(pk__in=batch_ids)
+                       .exclude(ai_grading_status__in=IN_FLIGHT_STATUSES).values_list('id', flat=True))
+            AssignmentSubmission.objects.filter(pk__in=ids).update(
+                ai_grading_status='pending', ai_grading_task_id=None, update_time=timezone.now())
+            enqueue_ai_grading_batch(ids, job)
+            job.enqueued += len(batch_ids)
+            job.skipped_in_progress += len(batch_ids) - len(ids)
+        elif in_flight == 0 and job.enqueued >= len(job.submission_ids):
+            job.status = 'completed'
+            job.finish_time = timezone.now()
+            logger.info(f"AI grading job {job.id} for assignment {job.assignment_id} completed.")
+        job.save(update_fields=['enqueued', 'skipped_in_progress', 'status', 'finish_time'])
+    return job
+
+
+def kick_ai_grading_jobs(submission_ids: Iterable[int]):
+    """提交批改结束后触发其所属的进行中任务补入下一批（beat 每分钟也会补一次）。"""
+    from .tasks import advance_ai_grading_jobs  # 延迟导入，tasks 依赖本模块
+    job_ids = AIGradingOutbox.objects.filter(submission_id__in=list(submission_ids), job__status='running') \
+        .values_list('job_id', flat=True).distinct()
+    for job_id in job_ids:
+        try:
+            advance_ai_grading_jobs.delay(job_id)
+        except Exception as e:  # broker 不可用时由 beat 兜底
+            logger.warning(f"Could not trigger AI grading job {job_id} advance: {e}")
+
+
+def job_progress(job: AIGradingJob) -> dict:
+    counts = dict(_job_submissions(job).order_by().values('ai_grading_status')
+                  .annotate(n=Count('id')).values_list('ai_grading_status', 'n'))
+    progress = {
+        "queued": len(job.submission_ids) - job.enqueued + counts.get('pending', 0),  # 尚未放入发件箱 + 待分发
+        "processing": counts.get('processing', 0),
+        "done": counts.get('completed', 0),
+        "failed": counts.get('failed', 0),
+        "skipped": counts.get('skipped', 0),  # 附件类型不支持、内容过长等 AI 无法批改的
+        "skipped_unchanged": job.skipped_unchanged,
+        "skipped_in_progress": job.skipped_in_progress,
+    }
+    return {
+        "job_id": job.id,
+        "assignment": job.assignment_id,
+        "status": job.status,
+        "total": sum(progress.values()),  # 选中的全部提交
+        **progress,
+        "create_time": job.create_time,
+        "finish_time": job.finish_time,
+    }
@@ -0,0 +1,222 @@
+# backend/course/grading_outbox.py
+# AI 批改分发的事务性发件箱：提交接口只在同一事务中写入提交记录与一条发件箱记录（毫秒级返回），
+# 读取附件、解码、构造 prompt 和调用 AI 服务都由 relay_ai_grading_outbox 任务在请求之外批量完成；
+# AI 服务不可用时按退避重试，每条记录携带固定的幂等键，重试不会产生重复的批改任务
+import logging
+import os
+from datetime import timedelta
+from typing import Iterable, List, Optional, Tuple
+
+import httpx
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from utils.ai_service_client import PRIORITY_BULK, PRIORITY_STANDARD
+from utils.minio_tools import MinioClient
+from utils.prompt_budget import count_message_tokens, prompt_token_limit
+from .ai_grading import apply_ai_grading_content, grading_callback_fields, grading_input_hash, grading_system_prompt
+from .chunked_grading import start_chunked_grading
+from .file_text_cache import get_file_texts
+from .models import AIGradingJob, AIGradingOutbox, AssignmentSubmission
+from .utils import ALLOWED_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRetry(Exception):
+    """暂时性的分发失败（AI 服务不可达、5xx、429、附件暂时读不到），稍后重试。"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def enqueue_ai_grading(submission: AssignmentSubmission) -> AIGradingOutbox:
+    """在调用方的事务中写入发件箱记录；事务提交后立即触发一次分发，beat 定时任务兜底。"""
+    entry = AIGradingOutbox.objects.create(submission=submission)
+    transaction.on_commit(_kick_relay)
+    return entry
+
+
+def enqueue_ai_grading_batch(submission_ids: Iterable[int], job: AIGradingJob) -> List[AIGradingOutbox]:
+    """整班批改：一次写入多条属于 job 的发件箱记录，事务提交后触发一次分发。"""
+    entries = AIGradingOutbox.objects.bulk_create([AIGradingOutbox(submission_id=i, job=job) for i in submission_ids])
+    if entries:
+        transaction.on_commit(_kick_relay)
+    return entries
+
+
+def _kick_relay():
+    from .tasks import relay_ai_grading_outbox  # 延迟导入，tasks 依赖本模块
+    try:
+        relay_ai_grading_outbox.delay()
+    except Exception as e:  # broker 不可用不能影响提交接口，记录仍在发件箱中
+        logger.warning(f"Could not trigger AI grading outbox relay: {e}")
+
+
+def claim_due_entries(limit: int) -> List[AIGradingOutbox]:
+    """
+    领取到期的待分发记录：SKIP LOCKED 让并发的 relay 各取不同的记录，领取时把 next_attempt_at 推后一个租期，
+    处理中的 worker 崩溃后记录会在租期结束时被重新领取。
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(AIGradingOutbox.objects.select_for_update(skip_locked=True)
+                   .filter(status='pending', next_attempt_at__lte=now)
+                   .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        AIGradingOutbox.objects.filter(pk__in=ids).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + timedelta(seconds=settings.AI_OUTBOX_LEASE_SECONDS))
+    return list(AIGradingOutbox.objects.filter(pk__in=ids)
+                .select_related('submission__assignment__course_class__course').order_by('id'))
+
+
+def collect_submission_content(submission: AssignmentSubmission, minio: MinioClient) -> Tuple[Optional[str], List[str]]:
+    """
+    返回 (正文 + 附件文本, 附件原始文件名)。附件中有不支持 AI 分析的类型（压缩包、图片等）时正文为 None。
+    """
+    files = list(submission.files.order_by('id'))
+    names = [f.original_name for f in files]
+    if any(os.path.splitext(name)[1].lower() not in ALLOWED_EXTENSIONS for name in names):
+        return None, names
+    content = submission.content
+    texts = get_file_texts([f.file_name for f in files], minio)
+    for f in files:
+        cached = texts.get(f.file_name)
+        if cached is None:
+            raise OutboxRetry(f"附件 {f.original_name} 读取失败")
+        if cached.text:
+            content += f"\n\n--- 文件: {f.original_name} ---\n{cached.text}"
+        else:
+            logger.warning(f"Could not read content from allowed file: {f.original_name}")
+    return content, names
+
+
+def _mark_submission(submission: AssignmentSubmission, status: str, comment: Optional[str] = None):
+    submission.ai_grading_status = status
+    fields = ['ai_grading_status', 'update_time']
+    if comment is not None:
+        submission.ai_comment = comment
+        fields.append('ai_comment')
+    submission.save(update_fields=fields)
+
+
+def _raise_for_retryable(response: httpx.Response):
+    if response.status_code == 429 or response.status_code >= 500:
+        retry_after = response.headers.get('retry-after')
+        raise OutboxRetry(f"AI 服务返回 {response.status_code}",
+                          float(retry_after) if retry_after and retry_after.isdigit() else None)
+    response.raise_for_status()
+
+
+def dispatch_entry(entry: AIGradingOutbox, client: httpx.Client, minio: MinioClient):
+    """构造一条提交的批改请求并分发。暂时性失败抛出 OutboxRetry / httpx.TransportError，其余失败直接记入提交。"""
+    submission = entry.submission
+    if submission.ai_grading_status != 'pending':
+        return  # 已被重新提交或人工处理
+
+    content, file_names = collect_submission_content(submission, minio)
+    if content is None:
+        logger.info(f"AI grading skipped for submission {submission.id} due to unsupported file types.")
+        _mark_submission(submission, 'skipped',
+                         "由于提交了不支持AI分析的文件类型（如压缩包、图片等），本次未进行AI辅助批改。")
+        return
+
+    # 记录本次批改的输入，整班重新批改时据此跳过提示词和内容都未变化的提交
+    submission.ai_grading_input_hash = grading_input_hash(submission)
+    AssignmentSubmission.objects.filter(pk=submission.pk).update(ai_grading_input_hash=submission.ai_grading_input_hash)
+
+    user_content = f"学生作业标题：{submission.title}\n学生提交内容：\n{content}"
+    if file_names:
+        user_content += f"\n\n学生上传文件列表：{', '.join(file_names)}"
+    messages = [
+        {"role": "system", "content": grading_system_prompt(submission.assignment)},
+        {"role": "user", "content": user_content},
+    ]
+    priority = PRIORITY_BULK if entry.job_id else PRIORITY_STANDARD  # 学生提交与整班批量批改分开排队
+    # 按模型上下文（扣除为回复和思维链预留的部分）判断能否单次批改，超出时改为分块批改
+    prompt_tokens = count_message_tokens(messages)
+    if prompt_tokens > prompt_token_limit(use_reasoning_model=True):
+        try:
+            skip_reason = start_chunked_grading(submission, content, priority)
+        except httpx.HTTPStatusError as e:
+            _raise_for_retryable(e.response)  # 429 / 5xx 与单次批改一样按退避重试，其余为不可重试的失败
+            raise
+        if skip_reason:
+            logger.info(f"AI grading skipped for submission {submission.id}: {skip_reason}")
+            _mark_submission(submission, 'skipped', f"由于{skip_reason}，本次未进行AI辅助批改。")
+        return
+
+    payload = {
+        "messages": messages,
+        "use_reasoning_model": True,  # 作为长任务分发到 Celery，具体模型由 model_tier 决定
+        "model_tier": settings.AI_GRADING_MODEL_TIER,
+        "required_keys": settings.AI_GRADING_REQUIRED_KEYS,
+        "response_format": {"type": "json_object"},
+        "priority": priority,
+        "prompt_tokens": prompt_tokens,
+        "idempotency_key": entry.idempotency_key,
+        # 任务完成后由 AI 服务主动回调 AIGradingCallbackView，无需等待轮询
+        **grading_callback_fields(submission.id),
+    }
+    # 回调只接受 processing 状态的提交，须在分发前标记（回调可能先于分发响应到达）
+    _mark_submission(submission, 'processing')
+    try:
+        response = client.post(settings.AI_SERVICE_URL, json=payload)
+        _raise_for_retryable(response)
+    except (OutboxRetry, httpx.TransportError):
+        AssignmentSubmission.objects.filter(pk=submission.pk, ai_grading_status='processing').update(
+            ai_grading_status='pending')
+        raise
+    ai_api_response = response.json()
+
+    if ai_api_response.get("success") and ai_api_response.get("task_id"):
+        # 只写 task_id：回调可能已先到达并写入了批改结果，不能用整行 save() 覆盖
+        AssignmentSubmission.objects.filter(pk=submission.pk).update(
+            ai_grading_task_id=ai_api_response["task_id"], ai_next_check_at=None, ai_check_attempts=0)
+        logger.info(f"AI grading task {ai_api_response['task_id']} dispatched for submission {submission.id}.")
+    elif ai_api_response.get("success") and ai_api_response.get("content"):
+        apply_ai_grading_content(submission, ai_api_response["content"])
+        submission.save()
+    else:
+        logger.error(f"AI service call failed for submission {submission.id}: {ai_api_response.get('error')}")
+        _mark_submission(submission, 'failed', f"AI服务调用失败: {ai_api_response.get('error', '未知错误')}")
+
+
+def retry_delay_seconds(attempts: int, retry_after: Optional[float] = None) -> float:
+    delay = min(settings.AI_OUTBOX_RETRY_BASE_SECONDS * (2 ** (attempts - 1)), settings.AI_OUTBOX_RETRY_MAX_SECONDS)
+    return max(delay, retry_after or 0)
+
+
+def process_entry(entry: AIGradingOutbox, client: httpx.Client, minio: MinioClient):
+    """分发一条记录并更新其状态：成功或不可重试的失败结束该记录，暂时性失败按指数退避重新排期。"""
+    try:
+        dispatch_entry(entry, client, minio)
+    except (OutboxRetry, httpx.TransportError) as e:
+        retry_after = getattr(e, 'retry_after', None)
+        entry.last_error = str(e)[:1000]
+        if entry.attempts >= settings.AI_OUTBOX_MAX_ATTEMPTS:
+            logger.error(f"Giving up AI grading dispatch for submission {entry.submission_id} "
+                         f"after {entry.attempts} attempts: {e}")
+            entry.status = 'failed'
+            _mark_submission(entry.submission, 'failed', f"AI批改任务分发失败: {e}")
+        else:
+            entry.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay_seconds(entry.attempts, retry_after))
+            logger.warning(f"AI grading dispatch for submission {entry.submission_id} failed "
+                           f"(attempt {entry.attempts}), retrying at {entry.next_attempt_at}: {e}")
+        entry.save(update_fields=['status', 'last_error', 'next_attempt_at'])
+        return
+    except Exception as e:  # 4xx、响应格式错误等，重试也不会成功
+        logger.error(f"AI grading dispatch failed for submission {entry.submission_id}: {e}", exc_info=True)
+        entry.status = 'failed'
+        entry.last_error = str(e)[:1000]
+        entry.save(update_fields=['status', 'last_error'])
+        _mark_submission(entry.submission, 'failed', f"AI批改任务分发失败: {e}")
+        return
+    entry.status = 'dispatched'
+    entry.dispatched_at = timezone.now()
+    entry.save(update_fields=['status', 'dispatched_at'])
@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0012_assignmentsubmission_ai_comment_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignmentsubmission',
+            name='ai_grading_batch_id',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='AI分块批改批次ID'),
+        ),
+        migrations.AddField(
+            model_name='assignmentsubmission',
+            name='ai_grading_chunks',
+            field=models.JSONField(blank=True, null=True, verbose_name='AI分块批改分块信息'),
+        ),
+        migrations.AddField(
+            model_name='assignmentsubmission',
+            name='ai_grading_chunks_done',
+            field=models.PositiveIntegerField(default=0, verbose_name='AI分块批改已完成块数'),
+        ),
+        migrations.AddField(
+            model_name='assignmentsubmission',
+            name='ai_grading_chunks_total',
+            field=models.PositiveIntegerField(default=0, verbose_name='AI分块批改总块数'),
+        ),
+    ]
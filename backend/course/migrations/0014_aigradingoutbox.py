@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-18 14:05
+
+import course.models
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0013_assignmentsubmission_ai_grading_batch_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIGradingOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(default=course.models._idempotency_key, max_length=64, unique=True, verbose_name='幂等键')),
+                ('status', models.CharField(choices=[('pending', '待分发'), ('dispatched', '已分发'), ('failed', '分发失败')], default='pending', max_length=20, verbose_name='分发状态')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='分发次数')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='下次分发时间')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='最近一次错误')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True, verbose_name='分发时间')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_outbox', to='course.assignmentsubmission')),
+            ],
+            options={
+                'verbose_name': 'AI批改发件箱',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='ai_outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0014_aigradingoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignmentsubmission',
+            name='ai_check_attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='AI批改结果检查次数'),
+        ),
+        migrations.AddField(
+            model_name='assignmentsubmission',
+            name='ai_next_check_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='AI批改结果下次检查时间'),
+        ),
+    ]
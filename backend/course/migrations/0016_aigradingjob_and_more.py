@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('course', '0015_assignmentsubmission_ai_next_check_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignmentsubmission',
+            name='ai_grading_input_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='AI批改输入摘要'),
+        ),
+        migrations.CreateModel(
+            name='AIGradingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', '进行中'), ('completed', '已完成')], default='running', max_length=20, verbose_name='任务状态')),
+                ('submission_ids', models.JSONField(default=list, verbose_name='待批改的提交')),
+                ('enqueued', models.PositiveIntegerField(default=0, verbose_name='已放入发件箱的提交数')),
+                ('skipped_unchanged', models.PositiveIntegerField(default=0, verbose_name='输入未变化而跳过的提交数')),
+                ('skipped_in_progress', models.PositiveIntegerField(default=0, verbose_name='已在批改中而跳过的提交数')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('finish_time', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_grading_jobs', to='course.assignment')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '整班AI批改任务',
+            },
+        ),
+        migrations.AddField(
+            model_name='aigradingoutbox',
+            name='job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entries', to='course.aigradingjob', verbose_name='所属整班批改任务'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0016_aigradingjob_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileTextCache',
+            fields=[
+                ('object_name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='MinIO对象名')),
+                ('text', models.TextField(verbose_name='解码后的文本')),
+                ('encoding', models.CharField(max_length=50, verbose_name='检测到的编码')),
+                ('token_count', models.PositiveIntegerField(default=0, verbose_name='token数')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='文件字节数')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': '附件文本缓存',
+            },
+        ),
+    ]
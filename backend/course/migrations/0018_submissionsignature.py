@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 18:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0017_filetextcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_hash', models.CharField(max_length=64, verbose_name='签名输入摘要')),
+                ('signature', models.BinaryField(verbose_name='MinHash签名')),
+                ('shingle_count', models.PositiveIntegerField(default=0, verbose_name='片段数')),
+                ('update_time', models.DateTimeField(auto_now=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarity_signatures', to='course.assignment')),
+                ('submission', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='similarity_signature', to='course.assignmentsubmission')),
+            ],
+            options={
+                'verbose_name': '提交相似度签名',
+            },
+        ),
+    ]
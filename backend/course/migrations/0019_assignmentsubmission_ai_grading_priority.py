@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0018_submissionsignature'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignmentsubmission',
+            name='ai_grading_priority',
+            field=models.CharField(blank=True, max_length=20, null=True, verbose_name='AI分块批改队列优先级'),
+        ),
+    ]
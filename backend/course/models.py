@@ -1,9 +1,12 @@
 # backend/course/models.py
+import uuid
+
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.conf import settings  # 假设 settings.AUTH_USER_MODEL 作为 User 模型
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 from education.models import Class
 
@@ -95,6 +98,17 @@ class AssignmentSubmission(models.Model):
                                          ],
                                          default='pending', null=True, blank=True, verbose_name="AI批改状态")
     ai_grading_task_id = models.CharField(max_length=255, null=True, blank=True, verbose_name="AI批改任务ID")
+    # 超长提交的分块批改（course/chunked_grading.py）：各块经 AI 服务批次接口并行批改，全部完成后再汇总
+    ai_grading_batch_id = models.CharField(max_length=64, null=True, blank=True, verbose_name="AI分块批改批次ID")
+    ai_grading_chunks = models.JSONField(null=True, blank=True, verbose_name="AI分块批改分块信息")  # [{"label", "tokens"}]
+    ai_grading_chunks_total = models.PositiveIntegerField(default=0, verbose_name="AI分块批改总块数")
+    ai_grading_chunks_done = models.PositiveIntegerField(default=0, verbose_name="AI分块批改已完成块数")
+    ai_grading_priority = models.CharField(max_length=20, null=True, blank=True, verbose_name="AI分块批改队列优先级")  # 汇总请求沿用
+    # 兜底轮询（course.tasks.check_ai_grading_results）的排期：未完成的任务按指数退避复查
+    ai_next_check_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="AI批改结果下次检查时间")
+    ai_check_attempts = models.PositiveIntegerField(default=0, verbose_name="AI批改结果检查次数")
+    # 最近一次分发批改时输入（提示词 + 标题、正文、附件）的摘要，整班重新批改时跳过未变化的提交
+    ai_grading_input_hash = models.CharField(max_length=64, null=True, blank=True, verbose_name="AI批改输入摘要")
 
     create_time = models.DateTimeField(auto_now_add=True, null=True, blank=True)  # 创建时间
     update_time = models.DateTimeField(auto_now=True, null=True, blank=True)  # 更新时间
@@ -114,6 +128,97 @@ class AssignmentSubmissionFile(models.Model):
     update_time = models.DateTimeField(auto_now=True, null=True, blank=True)  # 更新时间
 
 
+# 教师发起的整班 AI 批改：选中的提交按 AI_GRADING_JOB_CONCURRENCY 分批放入发件箱（course/grading_jobs.py），
+# 进度由各发件箱记录对应提交的批改状态统计
+class AIGradingJob(models.Model):
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name="ai_grading_jobs")
+    created_by = models.ForeignKey('education.User', on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=20,
+                              choices=[
+                                  ('running', '进行中'),
+                                  ('completed', '已完成'),
+                              ],
+                              default='running', verbose_name="任务状态")
+    submission_ids = models.JSONField(default=list, verbose_name="待批改的提交")  # 按顺序分批放入发件箱
+    enqueued = models.PositiveIntegerField(default=0, verbose_name="已放入发件箱的提交数")  # submission_ids 的游标
+    skipped_unchanged = models.PositiveIntegerField(default=0, verbose_name="输入未变化而跳过的提交数")
+    skipped_in_progress = models.PositiveIntegerField(default=0, verbose_name="已在批改中而跳过的提交数")
+    create_time = models.DateTimeField(auto_now_add=True)
+    finish_time = models.DateTimeField(null=True, blank=True, verbose_name="完成时间")
+
+    class Meta:
+        verbose_name = "整班AI批改任务"
+
+    def __str__(self):
+        return f"AI grading job #{self.pk} for assignment {self.assignment_id} ({self.status})"
+
+
+# 附件文本缓存：对象名即文件内容 MD5（MinioClient.upload_file），相同内容的附件只解码一次（course/file_text_cache.py）
+class FileTextCache(models.Model):
+    object_name = models.CharField(max_length=255, primary_key=True, verbose_name="MinIO对象名")
+    text = models.TextField(verbose_name="解码后的文本")
+    encoding = models.CharField(max_length=50, verbose_name="检测到的编码")
+    token_count = models.PositiveIntegerField(default=0, verbose_name="token数")  # 按缓存时的分词器计算
+    size = models.PositiveIntegerField(default=0, verbose_name="文件字节数")
+    create_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "附件文本缓存"
+
+    def __str__(self):
+        return f"{self.object_name} ({self.encoding}, {self.token_count} tokens)"
+
+
+# 提交内容（正文 + 文本附件）的 MinHash 签名，提交时增量计算，按作业两两比较相似度（course/similarity.py）
+class SubmissionSignature(models.Model):
+    submission = models.OneToOneField(AssignmentSubmission, on_delete=models.CASCADE,
+                                      related_name="similarity_signature")
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name="similarity_signatures")
+    source_hash = models.CharField(max_length=64, verbose_name="签名输入摘要")  # 正文、附件或参数变化后重新计算
+    signature = models.BinaryField(verbose_name="MinHash签名")  # SIMILARITY_NUM_PERM 个小端 uint32
+    shingle_count = models.PositiveIntegerField(default=0, verbose_name="片段数")
+    update_time = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "提交相似度签名"
+
+    def __str__(self):
+        return f"Signature of submission {self.submission_id} ({self.shingle_count} shingles)"
+
+
+def _idempotency_key():
+    return uuid.uuid4().hex
+
+
+# AI 批改分发的事务性发件箱：与提交记录在同一事务中写入，由 course.tasks.relay_ai_grading_outbox 在请求之外
+# 读取附件、构造 prompt 并分发到 AI 服务（course/grading_outbox.py）
+class AIGradingOutbox(models.Model):
+    submission = models.ForeignKey(AssignmentSubmission, on_delete=models.CASCADE, related_name="ai_outbox")
+    job = models.ForeignKey(AIGradingJob, on_delete=models.SET_NULL, null=True, blank=True, related_name="entries",
+                            verbose_name="所属整班批改任务")  # 学生提交触发的批改为空
+    # 随每次分发发送给 AI 服务，重试时不变，AI 服务据此返回已创建的任务而不是重复批改
+    idempotency_key = models.CharField(max_length=64, unique=True, default=_idempotency_key, verbose_name="幂等键")
+    status = models.CharField(max_length=20,
+                              choices=[
+                                  ('pending', '待分发'),
+                                  ('dispatched', '已分发'),
+                                  ('failed', '分发失败'),
+                              ],
+                              default='pending', verbose_name="分发状态")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="分发次数")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="下次分发时间")
+    last_error = models.TextField(null=True, blank=True, verbose_name="最近一次错误")
+    create_time = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True, verbose_name="分发时间")
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"], name="ai_outbox_due_idx")]
+        verbose_name = "AI批改发件箱"
+
+    def __str__(self):
+        return f"AI grading outbox #{self.pk} for submission {self.submission_id} ({self.status})"
+
+
 @receiver(post_save, sender=Assignment)  # 确保 Assignment 是您课程应用中的模型
 def assignment_created_or_updated_notification(sender, instance, created, **kwargs):
     try:
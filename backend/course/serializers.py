@@ -222,14 +222,14 @@ class AssignmentSubmissionSerializer(serializers.ModelSerializer):
             'submit_time',  # 确保 submit_time 在
             # 新增AI相关字段 (如果模型已添加)
             'ai_comment', 'ai_score', 'ai_generated_similarity',
-            'ai_grading_status', 'ai_grading_task_id'
+            'ai_grading_status', 'ai_grading_task_id', 'ai_grading_chunks_total', 'ai_grading_chunks_done'
         ]
         read_only_fields = [
             'student', 'student_name', 'student_number',  # student应只读，通过perform_create设置
             'files', 'submit_time',
             # AI结果字段也应该是只读的，由系统更新
             'ai_comment', 'ai_score', 'ai_generated_similarity',
-            'ai_grading_status', 'ai_grading_task_id'
+            'ai_grading_status', 'ai_grading_task_id', 'ai_grading_chunks_total', 'ai_grading_chunks_done'
         ]
         extra_kwargs = {  # 确保 student 字段在创建时不强制要求，它将从 request.user 获取
             'student': {'required': False}
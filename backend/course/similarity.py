@@ -0,0 +1,232 @@
+# backend/course/similarity.py
+# 同一作业内提交之间的相似度检测：正文与文本附件按字符 k-gram 切片（shingle），用 NumPy 向量化计算 MinHash 签名，
+# 提交时由后台任务增量写入 SubmissionSignature；查询时对作业内全部签名两两比较（班级规模下一次矩阵比较即可），
+# 任意阈值下都不会漏掉相似对
+import hashlib
+import html
+import logging
+import os
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils.html import strip_tags
+
+from utils.minio_tools import MinioClient
+from .file_text_cache import get_file_texts
+from .models import Assignment, AssignmentSubmission, SubmissionSignature
+from .utils import ALLOWED_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_SEED = 20261018  # 哈希函数参数固定，签名才能跨进程、跨时间比较
+_SHINGLE_BASE = np.uint64(1_000_003)
+_BLOCK = 4096  # 每次参与计算的 shingle 数，限制 (num_perm × block) 中间矩阵的内存
+
+
+def normalize_text(text: str) -> str:
+    """去掉 HTML 标签与实体，统一大小写并把连续空白合并为一个空格，排版差异不影响相似度。"""
+    return _WHITESPACE_RE.sub(' ', html.unescape(strip_tags(text or ''))).strip().lower()
+
+
+def shingle_hashes(text: str, k: int) -> np.ndarray:
+    """文本中所有长度为 k 的字符片段的 32 位哈希（去重）。按码点做多项式滚动哈希，整段一次向量化计算。"""
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if not len(codes):
+        return np.empty(0, dtype=np.uint32)
+    k = min(k, len(codes))
+    n = len(codes) - k + 1
+    hashes = np.zeros(n, dtype=np.uint64)
+    for i in range(k):  # uint64 乘法溢出即按 2^64 取模
+        hashes = hashes * _SHINGLE_BASE + codes[i:i + n]
+    hashes ^= hashes >> np.uint64(32)
+    return np.unique(hashes.astype(np.uint32))
+
+
+@lru_cache(maxsize=4)
+def _hash_params(num_perm: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(_SEED)
+    a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)  # multiply-shift 要求奇数乘数
+    b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+def minhash_signature(hashes: np.ndarray, num_perm: int) -> np.ndarray:
+    """
+    shingle 哈希集合的 MinHash 签名（num_perm 个 uint32）。第 i 个哈希函数为 ((a_i·x + b_i) mod 2^64) >> 32，
+    所有哈希函数对一块 shingle 同时计算后按行取最小值。
+    """
+    signature = np.full(num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+    a, b = _hash_params(num_perm)
+    values = hashes.astype(np.uint64)
+    for start in range(0, len(values), _BLOCK):
+        block = (a * values[None, start:start + _BLOCK] + b) >> np.uint64(32)
+        np.minimum(signature, block.min(axis=1).astype(np.uint32), out=signature)
+    return signature
+
+
+def estimate_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """两个签名对应集合的 Jaccard 相似度估计：相同位置取值相等的比例。"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def similar_pairs(signatures: np.ndarray, threshold: float) -> List[Tuple[int, int, float]]:
+    """签名矩阵（每行一个签名）中估计相似度不低于 threshold 的全部行对 (i, j, 相似度)，i < j。"""
+    pairs = []
+    for i in range(len(signatures) - 1):
+        similarities = (signatures[i + 1:] == signatures[i]).mean(axis=1)
+        for offset in np.flatnonzero(similarities >= threshold):
+            pairs.append((i, i + 1 + int(offset), float(similarities[offset])))
+    return pairs
+
+
+# ---------- 签名的计算与存储 ----------
+def _text_files(submission: AssignmentSubmission) -> list:
+    return [f for f in sorted(submission.files.all(), key=lambda f: f.id)
+            if os.path.splitext(f.original_name)[1].lower() in ALLOWED_EXTENSIONS]
+
+
+def _source_hash(submission: AssignmentSubmission, files: list) -> str:
+    digest = hashlib.sha256()
+    # 作业描述中的片段会被剔除，参数变化后签名不可比，二者都计入摘要
+    parts = [f"{settings.SIMILARITY_SHINGLE_SIZE}:{settings.SIMILARITY_NUM_PERM}",
+             submission.assignment.description, submission.content, *(f.file_name for f in files)]
+    for part in parts:
+        digest.update((part or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _stale_submissions(submissions: Iterable[AssignmentSubmission]) -> List[Tuple[AssignmentSubmission, list, str]]:
+    """签名缺失或已过期（正文、附件变化）的提交：[(提交, 文本附件, 输入摘要)]。只比较摘要，不读取附件。"""
+    stale = []
+    for submission in submissions:
+        files = _text_files(submission)
+        source_hash = _source_hash(submission, files)
+        existing = getattr(submission, 'similarity_signature', None)
+        if existing is None or existing.source_hash != source_hash:
+            stale.append((submission, files, source_hash))
+    return stale
+
+
+def index_submissions(submissions: Iterable[AssignmentSubmission],
+                      minio: Optional[MinioClient] = None) -> Tuple[int, int]:
+    """
+    为签名缺失或已过期的提交计算并保存签名，返回 (计算的数量, 因附件读取失败而未计算的数量)。
+    附件文本经 FileTextCache 读取，所有提交的附件一次查询；老师在作业描述中给出的模板内容不计入相似度。
+    附件暂时读不到的提交不保存签名，否则缺了附件内容的签名会因摘要不变而不再重算。
+    """
+    stale = _stale_submissions(submissions)
+    if not stale:
+        return 0, 0
+
+    object_names = {f.file_name for _, files, _ in stale for f in files}
+    texts = get_file_texts(object_names, minio or MinioClient()) if object_names else {}
+    k, num_perm = settings.SIMILARITY_SHINGLE_SIZE, settings.SIMILARITY_NUM_PERM
+    template_hashes = {}  # assignment_id -> 作业描述的 shingle
+    computed, incomplete = 0, 0
+    for submission, files, source_hash in stale:
+        if any(f.file_name not in texts for f in files):
+            logger.warning(f"Attachments of submission {submission.id} could not be read, "
+                           f"similarity signature not computed.")
+            incomplete += 1
+            continue
+        assignment = submission.assignment
+        if assignment.id not in template_hashes:
+            template_hashes[assignment.id] = shingle_hashes(normalize_text(assignment.description), k)
+        text = normalize_text(' '.join([submission.content or '', *(texts[f.file_name].text for f in files)]))
+        hashes = np.setdiff1d(shingle_hashes(text, k), template_hashes[assignment.id], assume_unique=True)
+        SubmissionSignature.objects.update_or_create(
+            submission=submission,
+            defaults={"assignment": assignment, "source_hash": source_hash, "shingle_count": len(hashes),
+                      "signature": minhash_signature(hashes, num_perm).astype('<u4').tobytes()})
+        computed += 1
+    logger.info(f"Computed similarity signatures for {computed} submissions ({incomplete} incomplete).")
+    return computed, incomplete
+
+
+def _submissions_for_index():
+    return AssignmentSubmission.objects.select_related('assignment', 'similarity_signature', 'student') \
+        .prefetch_related('files')
+
+
+def index_submission(submission_id: int) -> Tuple[int, int]:
+    return index_submissions(_submissions_for_index().filter(pk=submission_id))
+
+
+def schedule_signature(submission_id: int):
+    """提交或修改作业的事务提交后在后台计算签名，不影响提交接口的响应时间。"""
+    def kick():
+        from .tasks import index_submission_similarity  # 延迟导入，tasks 依赖本模块
+        try:
+            index_submission_similarity.delay(submission_id)
+        except Exception as e:  # broker 不可用时由查询接口再次安排
+            logger.warning(f"Could not schedule similarity signature for submission {submission_id}: {e}")
+    transaction.on_commit(kick)
+
+
+# ---------- 查询 ----------
+def find_similar_submissions(assignment: Assignment, threshold: Optional[float] = None) -> dict:
+    """
+    返回相似度不低于 threshold 的提交对，以及由这些对连通而成的聚类。
+    签名缺失或已过期的提交（附件需从 MinIO 读取）不在请求内计算，只安排后台任务，并在 pending 中计数；
+    片段数少于 SIMILARITY_MIN_SHINGLES 的提交（如只写了“见附件”）不参与比较。
+    """
+    from .tasks import index_submission_similarity  # 延迟导入，tasks 依赖本模块
+    threshold = settings.SIMILARITY_THRESHOLD if threshold is None else threshold
+    submissions = list(_submissions_for_index().filter(assignment=assignment, submitted=True))
+    stale = {submission.id for submission, _, _ in _stale_submissions(submissions)}
+    for submission_id in stale:
+        try:
+            index_submission_similarity.delay(submission_id)
+        except Exception as e:
+            logger.warning(f"Could not schedule similarity signature for submission {submission_id}: {e}")
+
+    current = [s for s in submissions if s.id not in stale
+               and s.similarity_signature.shingle_count >= settings.SIMILARITY_MIN_SHINGLES]
+    matrix = np.array([np.frombuffer(bytes(s.similarity_signature.signature), dtype='<u4') for s in current])
+    pairs = [(current[i].id, current[j].id, similarity) for i, j, similarity in similar_pairs(matrix, threshold)]
+    pairs.sort(key=lambda p: p[2], reverse=True)
+
+    # 并查集：相似对连通的提交归为一个聚类
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b, _ in pairs:
+        parent[find(a)] = find(b)
+    clusters = defaultdict(list)
+    for submission_id in parent:
+        clusters[find(submission_id)].append(submission_id)
+    max_similarity = defaultdict(float)
+    for a, b, similarity in pairs:
+        root = find(a)
+        max_similarity[root] = max(max_similarity[root], similarity)
+
+    by_id = {s.id: s for s in submissions}
+
+    def describe(submission_id):
+        submission = by_id[submission_id]
+        return {"submission_id": submission_id, "student_id": submission.student_id,
+                "student_name": submission.student.name, "student_number": submission.student.student_number}
+
+    return {
+        "assignment": assignment.id,
+        "threshold": threshold,
+        "indexed": len(current),
+        "pending": len(stale),  # 签名尚在后台计算，稍后再查询
+        "pairs": [{"a": describe(a), "b": describe(b), "similarity": round(similarity, 3)} for a, b, similarity in pairs],
+        "clusters": sorted(
+            ({"submissions": [describe(i) for i in sorted(members)], "max_similarity": round(max_similarity[root], 3)}
+             for root, members in clusters.items()),
+            key=lambda c: (len(c["submissions"]), c["max_similarity"]), reverse=True),
+    }
@@ -1,141 +1,242 @@
 from celery import shared_task
 from django.utils import timezone
 from datetime import timedelta
+from typing import Dict, List
+import asyncio
 import httpx
 import logging
-import os
+import random
 
-from .models import AssignmentSubmission, Assignment
-# from .utils import extract_json_from_string # 确保此函数可用
-# 复制或导入 extract_json_from_string
-import re
-import json
-from typing import Optional
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
 
+from utils.minio_tools import MinioClient
+from utils.redis_lock import redis_lease
 
-def extract_json_from_string(text_containing_json: str) -> Optional[dict]:
-    try:
-        match_triple_quotes = re.search(r"```json\s*(\{.*?\})\s*```", text_containing_json, re.DOTALL)
-        if match_triple_quotes:
-            json_str = match_triple_quotes.group(1)
-        else:
-            first_brace = text_containing_json.find('{')
-            last_brace = text_containing_json.rfind('}')
-            if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
-                json_str = text_containing_json[first_brace: last_brace + 1]
-            else:
-                first_bracket = text_containing_json.find('[')
-                last_bracket = text_containing_json.rfind(']')
-                if first_bracket != -1 and last_bracket != -1 and last_bracket > first_bracket:
-                    json_str = text_containing_json[first_bracket: last_bracket + 1]
-                else:
-                    return None
-
-        json_str_cleaned = json_str.strip()
-        parsed_json = json.loads(json_str_cleaned)
-        return parsed_json
-    except Exception:
-        return None
-
+from .ai_grading import GRADING_RESULT_FIELDS, apply_ai_grading_result
+from .chunked_grading import dispatch_reduce
+from .grading_jobs import fill_ai_grading_job, kick_ai_grading_jobs
+from .grading_outbox import claim_due_entries, process_entry
+from .similarity import index_submission
+from .models import AIGradingJob, AssignmentSubmission, Assignment
 
 logger = logging.getLogger(__name__)
 
-# AI_SERVICE_STATUS_URL = "http://localhost:8080/api/v1/task_status/" # 应从settings读取
-AI_SERVICE_STATUS_URL = os.getenv('AI_SERVICE_STATUS_URL', 'http://localhost:8080/api/v1/task_status/')
+AI_STATUS_BATCH_SIZE = 200  # 单次批量查询的任务数，需不超过 AI 服务的 TASK_STATUS_BATCH_MAX
+
+
+async def _fetch_task_statuses(task_ids: List[str]) -> Dict[str, dict]:
+    """
+    分批（每批 AI_STATUS_BATCH_SIZE 个）查询任务状态，最多 AI_POLL_CONCURRENCY 个批次同时进行，共用一个连接池。
+    查询失败的批次直接略过，其中的提交按退避时间下次再查。
+    """
+    batch_url = f"{settings.AI_SERVICE_STATUS_URL.rstrip('/')}/batch"
+    semaphore = asyncio.Semaphore(settings.AI_POLL_CONCURRENCY)
+    limits = httpx.Limits(max_connections=settings.AI_POLL_CONCURRENCY)
+
+    async def fetch(client: httpx.AsyncClient, chunk: List[str]) -> Dict[str, dict]:
+        async with semaphore:
+            try:
+                response = await client.post(batch_url, json={"task_ids": chunk})
+            except httpx.TimeoutException:
+                logger.warning(f"Timeout checking AI task status for {len(chunk)} submissions.")
+                return {}
+            except httpx.RequestError as e:
+                logger.error(f"Request error checking AI task status for {len(chunk)} submissions: {e}")
+                return {}
+        if response.status_code != 200:
+            logger.error(f"Failed to get status for {len(chunk)} AI tasks. Status: {response.status_code}, "
+                         f"Body: {response.text[:200]}")
+            return {}
+        return response.json().get("results", {})
+
+    async with httpx.AsyncClient(timeout=10.0, limits=limits) as client:
+        chunks = [task_ids[i:i + AI_STATUS_BATCH_SIZE] for i in range(0, len(task_ids), AI_STATUS_BATCH_SIZE)]
+        results = {}
+        for part in await asyncio.gather(*(fetch(client, chunk) for chunk in chunks)):
+            results.update(part)
+        return results
+
+
+def next_check_delay(attempts: int) -> float:
+    """第 attempts 次检查仍未完成后的复查间隔：指数增长并加入随机抖动，避免大量任务在同一时刻复查。"""
+    delay = min(settings.AI_POLL_BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), settings.AI_POLL_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
 
 
-@shared_task(name="course.tasks.check_ai_grading_results", bind=True, default_retry_delay=5 * 60, max_retries=3)
-def check_ai_grading_results(self):
-    # 查找1小时内仍在处理中的，且有task_id的提交
-    # time_threshold = timezone.now() - timedelta(hours=1) # 避免查询过旧的任务
-    # submissions_to_check = AssignmentSubmission.objects.filter(
-    #     ai_grading_status='processing',
-    #     ai_grading_task_id__isnull=False,
-    #     update_time__gte=time_threshold # 只检查最近更新的
-    # )
+@shared_task(name="course.tasks.check_ai_grading_results")
+def check_ai_grading_results():
+    # 结果正常情况下由 AI 服务回调推送（见 course.views.AIGradingCallbackView），
+    # 这里只兜底处理回调丢失的提交：超过宽限期仍未收到结果的首次检查，之后按各自的 ai_next_check_at 退避复查
+    with redis_lease("check_ai_grading_results", settings.AI_POLL_LEASE_SECONDS) as acquired:
+        if not acquired:
+            logger.info("Another AI grading result poll is still running, skipping this one.")
+            return
+        _poll_ai_grading_results()
 
-    # 简单起见，先检查所有 processing 状态的
-    submissions_to_check = AssignmentSubmission.objects.filter(
+
+def _poll_ai_grading_results():
+    now = timezone.now()
+    # 未配置回调令牌时不会有回调（见 grading_callback_fields），无需等待宽限期
+    grace_seconds = settings.AI_CALLBACK_GRACE_SECONDS if settings.AI_CALLBACK_TOKEN else 0
+    time_threshold = now - timedelta(seconds=grace_seconds)
+    first_check = Q(ai_next_check_at__isnull=True) & (Q(update_time__lt=time_threshold) | Q(update_time__isnull=True))
+    submissions = list(AssignmentSubmission.objects.filter(
         ai_grading_status='processing',
         ai_grading_task_id__isnull=False
-    )
-
-    logger.info(f"Found {submissions_to_check.count()} submissions to check AI grading status.")
+    ).filter(first_check | Q(ai_next_check_at__lte=now)).select_related('assignment')
+        .order_by(F('ai_next_check_at').asc(nulls_first=True), 'id')[:settings.AI_POLL_MAX_PER_RUN])
+    if not submissions:
+        return
+    logger.info(f"Found {len(submissions)} submissions to check AI grading status.")
 
-    for submission in submissions_to_check:
-        if not submission.ai_grading_task_id:
-            continue
+    results = asyncio.run(_fetch_task_statuses([sub.ai_grading_task_id for sub in submissions]))
 
-        task_status_url = f"{AI_SERVICE_STATUS_URL.rstrip('/')}/{submission.ai_grading_task_id}"
+    finished, rescheduled = [], []
+    for submission in submissions:
+        ai_api_response = results.get(submission.ai_grading_task_id)
         try:
-            with httpx.Client(timeout=10.0) as client:
-                response = client.get(task_status_url)
-
-            if response.status_code == 200:
-                ai_api_response = response.json()
-                if ai_api_response.get("success") and ai_api_response.get("content"):  # 任务完成且成功
-                    raw_ai_output = ai_api_response.get("content")
-                    parsed_json_result = extract_json_from_string(raw_ai_output)
-
-                    assignment = submission.assignment  # 获取关联的作业以得到max_score
-
-                    if parsed_json_result and "score" in parsed_json_result and "comment" in parsed_json_result:
-                        submission.ai_score = parsed_json_result.get("score")
-                        # 确保分数不超过满分
-                        if submission.ai_score is not None and assignment.max_score is not None:
-                            try:
-                                ai_s = float(submission.ai_score)
-                                max_s = float(assignment.max_score)
-                                submission.ai_score = min(max(0, ai_s), max_s)
-                            except ValueError:
-                                logger.error(
-                                    f"Invalid score format from AI for submission {submission.id}: {submission.ai_score}")
-                                submission.ai_score = None  # 或标记为解析失败
-
-                        submission.ai_comment = parsed_json_result.get("comment")
-                        submission.ai_generated_similarity = parsed_json_result.get("AI生成疑似度")
-                        submission.ai_grading_status = 'completed'
-                        logger.info(
-                            f"AI grading completed for submission {submission.id}. Score: {submission.ai_score}")
-                    else:
-                        submission.ai_grading_status = 'failed'
-                        submission.ai_comment = f"AI返回结果解析失败或缺少字段。原始输出: {raw_ai_output[:500]}"
-                        logger.error(f"AI result parsing failed for submission {submission.id}. Raw: {raw_ai_output}")
-                    submission.save()
-                elif ai_api_response.get("error") and "Task not ready" not in ai_api_response.get("error"):  # 任务失败
-                    submission.ai_grading_status = 'failed'
-                    submission.ai_comment = f"AI批改任务失败: {ai_api_response.get('error')}"
-                    submission.save(update_fields=['ai_grading_status', 'ai_comment'])
-                    logger.warning(
-                        f"AI grading task {submission.ai_grading_task_id} failed for submission {submission.id}: {ai_api_response.get('error')}")
-                # else: 任务仍在处理中或AI服务返回了非预期的成功格式
-
-            elif response.status_code == 404:  # Task ID 在AI服务侧可能不存在了
-                submission.ai_grading_status = 'failed'
-                submission.ai_comment = f"AI批改任务ID {submission.ai_grading_task_id} 在AI服务中未找到。"
-                submission.save(update_fields=['ai_grading_status', 'ai_comment'])
-                logger.error(
-                    f"AI Task ID {submission.ai_grading_task_id} not found on AI service for submission {submission.id}.")
-            else:
-                logger.error(
-                    f"Failed to get status for task {submission.ai_grading_task_id} (submission {submission.id}). Status: {response.status_code}, Body: {response.text[:200]}")
-                # 可以考虑重试此特定提交的检查
-
-        except httpx.TimeoutException:
-            logger.warning(
-                f"Timeout checking AI task status for submission {submission.id}, task {submission.ai_grading_task_id}.")
-            # 任务可能会在下次检查时成功
-        except httpx.RequestError as e:
-            logger.error(
-                f"Request error checking AI task status for submission {submission.id}, task {submission.ai_grading_task_id}: {e}")
+            done = bool(ai_api_response) and apply_ai_grading_result(submission, ai_api_response, save=False)
         except Exception as e:
             logger.error(f"Unexpected error checking AI task status for sub {submission.id}: {e}", exc_info=True)
-            try:  # 尝试将 submission 标记为失败，避免无限重试
-                submission.ai_grading_status = 'failed'
-                submission.ai_comment = f"检查AI批改结果时发生内部错误: {str(e)[:100]}"
-                submission.save(update_fields=['ai_grading_status', 'ai_comment'])
-            except Exception as save_err:
-                logger.error(f"Failed to save error status for submission {submission.id}: {save_err}")
+            # 将 submission 标记为失败，避免无限重试
+            submission.ai_grading_status = 'failed'
+            submission.ai_comment = f"检查AI批改结果时发生内部错误: {str(e)[:100]}"
+            done = True
+        if done:
+            submission.update_time = now  # bulk_update 不会自动刷新 auto_now 字段
+            finished.append(submission)
+        else:
+            # 只推后下次检查时间，不刷新 update_time，长时间无结果的仍由 cleanup_old_processing_ai_submissions 清理
+            submission.ai_check_attempts += 1
+            submission.ai_next_check_at = now + timedelta(seconds=next_check_delay(submission.ai_check_attempts))
+            rescheduled.append(submission)
+
+    # 查询期间提交可能已由回调写入结果，或被重新提交、重新分发（task_id 已变化）：
+    # 锁定后重新读取，只写入仍在等待同一任务的提交，且只写入轮询涉及的字段
+    with transaction.atomic():
+        current = set(AssignmentSubmission.objects.select_for_update().filter(
+            pk__in=[sub.pk for sub in submissions], ai_grading_status='processing'
+        ).values_list('pk', 'ai_grading_task_id'))
+        finished = [sub for sub in finished if (sub.pk, sub.ai_grading_task_id) in current]
+        rescheduled = [sub for sub in rescheduled if (sub.pk, sub.ai_grading_task_id) in current]
+        AssignmentSubmission.objects.bulk_update(finished, GRADING_RESULT_FIELDS, batch_size=500)
+        AssignmentSubmission.objects.bulk_update(rescheduled, ['ai_next_check_at', 'ai_check_attempts'], batch_size=500)
+    skipped = len(submissions) - len(finished) - len(rescheduled)
+    logger.info(f"AI grading result poll: {len(finished)} finished, {len(rescheduled)} still running, "
+                f"{skipped} changed during the check.")
+    if finished:  # 整班批改任务据此立即补入下一批，不必等 beat
+        kick_ai_grading_jobs(submission.id for submission in finished)
+
+
+@shared_task(name="course.tasks.relay_ai_grading_outbox")
+def relay_ai_grading_outbox():
+    """
+    把发件箱中到期的 AI 批改请求分发到 AI 服务。每次领取一批，共用一个 HTTP 连接池依次分发；
+    领满一批说明仍有积压，再排一次自身继续处理。提交事务提交后会立即触发，beat 每分钟兜底一次。
+    """
+    entries = claim_due_entries(settings.AI_OUTBOX_BATCH_SIZE)
+    if not entries:
+        return
+    minio = MinioClient()
+    with httpx.Client(timeout=20.0) as client:  # 只是分发任务，AI 服务立即返回 task_id
+        for entry in entries:
+            process_entry(entry, client, minio)
+    logger.info(f"AI grading outbox relay processed {len(entries)} entries.")
+    if len(entries) >= settings.AI_OUTBOX_BATCH_SIZE:
+        relay_ai_grading_outbox.delay()
+
+
+@shared_task(name="course.tasks.advance_ai_grading_jobs")
+def advance_ai_grading_jobs(job_id=None):
+    """
+    为整班批改任务补入下一批提交。提交批改结束时按 job_id 触发，beat 每分钟对全部进行中的任务兜底一次。
+    """
+    job_ids = [job_id] if job_id else AIGradingJob.objects.filter(status='running').values_list('id', flat=True)
+    for running_id in job_ids:
+        fill_ai_grading_job(running_id)
+
+
+@shared_task(name="course.tasks.index_submission_similarity", bind=True, max_retries=5, default_retry_delay=60)
+def index_submission_similarity(self, submission_id):
+    """提交或修改作业后计算其相似度签名（course/similarity.py）；附件暂时读不到时稍后重试。"""
+    _, incomplete = index_submission(submission_id)
+    if incomplete:
+        raise self.retry(countdown=60 * 2 ** self.request.retries)
+
+
+def _is_retryable(e: httpx.HTTPError) -> bool:
+    """网络错误、429 与 5xx 是暂时性的，其余 4xx 重试也不会成功。"""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return True
+
+
+def _fail_chunked_grading(submission: AssignmentSubmission, comment: str):
+    submission.ai_grading_status = 'failed'
+    submission.ai_comment = comment
+    submission.save(update_fields=['ai_grading_status', 'ai_comment', 'update_time'])
+
+
+def _retry_chunked_grading(task, submission: AssignmentSubmission, e: httpx.HTTPError, step: str):
+    """按指数退避重试；不可重试或重试次数用尽时把提交标记为失败，而不是停在没有 task_id 的 processing 状态。"""
+    logger.warning(f"{step} for chunked AI grading of submission {submission.id} failed "
+                   f"(retry {task.request.retries}/{task.max_retries}): {e}")
+    if not _is_retryable(e) or task.request.retries >= task.max_retries:
+        _fail_chunked_grading(submission, f"AI分块批改失败: {str(e)[:200]}")
+        return
+    countdown = min(settings.AI_CHUNK_GRADING_POLL_SECONDS * 2 ** task.request.retries,
+                    settings.AI_CHUNK_GRADING_RETRY_MAX_SECONDS)
+    raise task.retry(exc=e, countdown=countdown)
+
+
+@shared_task(name="course.tasks.advance_chunked_grading", bind=True, max_retries=8)
+def advance_chunked_grading(self, submission_id: int):
+    """
+    跟进一份分块批改：查询 AI 服务批次进度并写入 ai_grading_chunks_done，
+    未完成时稍后再次执行；全部分块结束后提交汇总（reduce）请求。
+    """
+    submission = AssignmentSubmission.objects.select_related('assignment__course_class__course').filter(
+        pk=submission_id).first()
+    if (submission is None or submission.ai_grading_status != 'processing'
+            or not submission.ai_grading_batch_id or submission.ai_grading_task_id):
+        return  # 已完成、已被重新提交覆盖，或汇总请求已提交
+
+    batch_url = f"{settings.AI_SERVICE_BATCH_URL.rstrip('/')}/{submission.ai_grading_batch_id}"
+    try:
+        with httpx.Client(timeout=10.0) as client:
+            response = client.get(batch_url, params={"include_results": "false"})
+            response.raise_for_status()
+            batch = response.json()
+            finished = batch["pending"] == 0 or batch["status"] in ("finished", "cancelled")
+            if finished:
+                response = client.get(batch_url, params={"include_results": "true"})
+                response.raise_for_status()
+                batch = response.json()
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:  # 批次已过期
+            _fail_chunked_grading(submission, "AI分块批改批次已失效，请重新提交。")
+            return
+        return _retry_chunked_grading(self, submission, e, "Checking batch")
+    except httpx.HTTPError as e:
+        return _retry_chunked_grading(self, submission, e, "Checking batch")
+
+    done = batch["total"] - batch["pending"]
+    if done != submission.ai_grading_chunks_done:
+        # 只在有进展时更新（update_time 随之刷新），卡住的批次仍会被 cleanup_old_processing_ai_submissions 清理
+        submission.ai_grading_chunks_done = done
+        submission.save(update_fields=['ai_grading_chunks_done', 'update_time'])
+
+    if not finished:
+        advance_chunked_grading.apply_async(args=[submission_id], countdown=settings.AI_CHUNK_GRADING_POLL_SECONDS)
+        return
+    logger.info(f"Chunked AI grading batch {submission.ai_grading_batch_id} finished for submission {submission_id}: "
+                f"{batch['completed']} completed, {batch['failed']} failed")
+    try:
+        dispatch_reduce(submission, batch.get("results") or [])
+    except httpx.HTTPError as e:
+        return _retry_chunked_grading(self, submission, e, "Dispatching reduce")
 
 
 @shared_task(name="course.tasks.cleanup_old_processing_ai_submissions")
@@ -1,3 +1,603 @@
-from django.test import TestCase
+import asyncio
+import codecs
+import json
+import random
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import numpy as np
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from education.models import Class, User
+from utils import prompt_budget
+from utils.ai_service_client import PRIORITY_STANDARD
+from utils.prompt_budget import (PromptTooLong, Section, TRUNCATION_MARK, count_tokens, pack_sections,
+                                 truncate_to_tokens)
+from .ai_grading import grading_input_hash
+from .chunked_grading import split_submission, start_chunked_grading
+from .grading_jobs import create_ai_grading_job, fill_ai_grading_job, job_progress, kick_ai_grading_jobs
+from .grading_outbox import claim_due_entries, process_entry, retry_delay_seconds
+from .models import AIGradingJob, AIGradingOutbox, Assignment, AssignmentSubmission, Course, TeacherCourseClass
+from .similarity import estimate_similarity, minhash_signature, normalize_text, shingle_hashes, similar_pairs
+from .tasks import _fetch_task_statuses, _poll_ai_grading_results, next_check_delay
+from .utils import decode_file_bytes, detect_and_decode
+
+
+@override_settings(AI_TOKENIZER_PATH='')  # 使用字符估算，结果不依赖本地 tokenizer 文件
+class PromptBudgetTests(SimpleTestCase):
+    def setUp(self):
+        prompt_budget._tokenizer.cache_clear()
+        self.addCleanup(prompt_budget._tokenizer.cache_clear)
+
+    def test_truncate_keeps_short_text(self):
+        self.assertEqual(truncate_to_tokens('短文本', 100), '短文本')
+
+    def test_truncate_keeps_prefix_within_budget(self):
+        text = '批改作业' * 200 + 'x' * 300
+        result = truncate_to_tokens(text, 50)
+        self.assertTrue(result.endswith(TRUNCATION_MARK))
+        self.assertTrue(text.startswith(result[:-len(TRUNCATION_MARK)]))
+        self.assertLessEqual(count_tokens(result), 50)
+        # 最长前缀：再多一个字符就会超出预算
+        kept = len(result) - len(TRUNCATION_MARK)
+        self.assertGreater(count_tokens(text[:kept + 1]), 50 - count_tokens(TRUNCATION_MARK))
+
+    def test_truncate_budget_smaller_than_mark(self):
+        self.assertEqual(truncate_to_tokens('a' * 1000, 1), '')
+
+    def _sections(self):
+        return [
+            Section('system', '系统提示' * 10, required=True),
+            Section('history', '历史记录：', lines=[f'第{i}条 ' + '记录' * 20 for i in range(10)], priority=0),
+            Section('attachment', '附件内容' * 100, priority=1),
+            Section('question', '学生的问题' * 5, required=True),
+        ]
+
+    def test_fits_without_trimming(self):
+        sections = self._sections()
+        packed = pack_sections(sections, 10_000)
+        self.assertEqual(packed.trimmed, [])
+        self.assertEqual(packed.text, '\n'.join(s.render() for s in sections))
+        self.assertEqual(packed.tokens, count_tokens(packed.text))
+
+    def test_lowest_priority_trimmed_first_from_oldest_line(self):
+        sections = self._sections()
+        full = count_tokens('\n'.join(s.render() for s in sections))
+        packed = pack_sections(sections, full - 30)
+
+        self.assertEqual(packed.trimmed, ['history'])
+        self.assertLessEqual(packed.tokens, full - 30)
+        self.assertIn('附件内容' * 100, packed.text)  # 优先级更高的段落未被裁剪
+        self.assertNotIn('第0条', packed.text)
+        self.assertIn('第9条', packed.text)
+        self.assertIn('历史记录：', packed.text)  # 标题保留
+        self.assertEqual(len(sections[1].lines), 10)  # 不修改调用方传入的段落
+
+    def test_next_priority_truncated_after_lines_exhausted(self):
+        sections = self._sections()
+        budget = count_tokens('\n'.join([sections[0].text, sections[1].text, sections[3].text])) + 100
+        packed = pack_sections(sections, budget)
+
+        self.assertEqual(packed.trimmed, ['history', 'attachment'])
+        self.assertLessEqual(packed.tokens, budget)
+        self.assertNotIn('第9条', packed.text)
+        self.assertIn(TRUNCATION_MARK, packed.text)
+        self.assertTrue(packed.text.startswith(sections[0].text))
+        self.assertTrue(packed.text.endswith(sections[3].text))
+
+    def test_rounding_does_not_reject_prompt_that_fits(self):
+        # 每段单独估算 token 时向上取整，截断多段后误差会累积，不应因此抛出 PromptTooLong
+        rng = random.Random(1)
+        for _ in range(3000):
+            sections = [Section('system', 'a' * rng.randint(1, 30), required=True)]
+            sections += [Section(f'part{i}', ''.join(rng.choice('ab中文 ') for _ in range(rng.randint(5, 200))),
+                                 priority=i) for i in range(rng.randint(1, 4))]
+            required = count_tokens('\n'.join([sections[0].text] + [''] * (len(sections) - 1)))
+            full = count_tokens('\n'.join(s.text for s in sections))
+            if full <= required + 1:
+                continue
+            budget = rng.randint(required + 1, full - 1)
+            self.assertLessEqual(pack_sections(sections, budget).tokens, budget)
+
+    def test_required_sections_over_budget(self):
+        sections = self._sections()
+        required = count_tokens('\n'.join([sections[0].text, sections[1].text, '', sections[3].text]))
+        with self.assertRaises(PromptTooLong) as ctx:
+            pack_sections(sections, required - 5)
+        self.assertEqual(ctx.exception.budget, required - 5)
+        self.assertGreater(ctx.exception.tokens, ctx.exception.budget)
+
+
+@override_settings(AI_TOKENIZER_PATH='')
+class SplitSubmissionTests(SimpleTestCase):
+    def setUp(self):
+        prompt_budget._tokenizer.cache_clear()
+        self.addCleanup(prompt_budget._tokenizer.cache_clear)
+
+    def test_small_files_one_chunk_each(self):
+        content = ("作业说明\n"
+                   "--- 文件: a.py ---\nprint('a')\n"
+                   "--- 文件: b.py ---\nprint('b')\n")
+        chunks = split_submission(content, 1000)
+        self.assertEqual([label for label, _ in chunks], ['正文', 'a.py', 'b.py'])
+        self.assertEqual(chunks[1][1], "\nprint('a')\n")
+
+    def test_empty_files_skipped(self):
+        content = "--- 文件: empty.py ---\n\n--- 文件: b.py ---\nx = 1\n"
+        self.assertEqual([label for label, _ in split_submission(content, 1000)], ['b.py'])
+
+    def test_large_file_split_at_function_boundaries(self):
+        functions = [f"def f{i}():\n" + f"    return {i}\n" * 40 for i in range(6)]
+        body = ''.join(functions)
+        max_tokens = count_tokens(functions[0]) * 2
+        chunks = split_submission("--- 文件: main.py ---\n" + body, max_tokens)
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual([label for label, _ in chunks], [f'main.py 第{i}/3段' for i in (1, 2, 3)])
+        for _, text in chunks:
+            self.assertLessEqual(count_tokens(text), max_tokens)
+            self.assertTrue(text.lstrip('\n').startswith('def f'))  # 只在定义处切开
+        self.assertEqual(''.join(text for _, text in chunks).strip(), body.strip())
+
+    def test_oversized_line_hard_split(self):
+        line = '中' * 5000
+        chunks = split_submission(line, 100)
+        self.assertGreater(len(chunks), 1)
+        for _, text in chunks:
+            self.assertLessEqual(count_tokens(text), 100)
+        self.assertEqual(''.join(text for _, text in chunks), line)
+
+    @override_settings(AI_CHUNK_GRADING_CHUNK_TOKENS=100, AI_CHUNK_GRADING_MAX_CHUNKS=3)
+    def test_chunk_count_cap(self):
+        content = ''.join(f"--- 文件: f{i}.py ---\nx = {i}\n" for i in range(4))
+        # 超过上限时在访问作业、请求 AI 服务之前返回原因
+        reason = start_chunked_grading(AssignmentSubmission(), content)
+        self.assertIn('4', reason)
+        self.assertIn('3', reason)
+
+
+class DetectAndDecodeTests(SimpleTestCase):
+    def test_utf8_bom_stripped(self):
+        self.assertEqual(detect_and_decode(codecs.BOM_UTF8 + '作业 abc'.encode('utf-8')), ('作业 abc', 'utf-8-sig'))
+
+    def test_plain_utf8(self):
+        self.assertEqual(detect_and_decode('print("你好")\n'.encode('utf-8')), ('print("你好")\n', 'utf-8'))
+        self.assertEqual(detect_and_decode(b''), ('', 'utf-8'))
+
+    def test_gbk_fallback(self):
+        text = '# 计算两个数的和\ndef add(a, b):\n    """返回 a 与 b 的和，用于课程作业第一题。"""\n    return a + b\n' * 5
+        decoded, encoding = detect_and_decode(text.encode('gbk'))
+        self.assertEqual(decoded, text)
+        self.assertIn(encoding.lower(), ('gbk', 'gb2312', 'gb18030'))
+        self.assertEqual(decode_file_bytes(text.encode('gbk')), text)
+
+
+class MinHashTests(SimpleTestCase):
+    NUM_PERM = 256
+
+    def _jaccard(self, a, b):
+        a, b = set(a.tolist()), set(b.tolist())
+        return len(a & b) / len(a | b)
+
+    def _texts(self, shared_words):
+        rng = random.Random(7)
+        vocabulary = [f'word{i}' for i in range(5000)]
+        common = ' '.join(rng.choice(vocabulary) for _ in range(shared_words))
+        return (common + ' ' + ' '.join(rng.choice(vocabulary) for _ in range(300)),
+                common + ' ' + ' '.join(rng.choice(vocabulary) for _ in range(300)))
+
+    def test_estimate_close_to_exact_jaccard(self):
+        for shared_words in (100, 600, 3000):
+            a, b = (shingle_hashes(normalize_text(t), 5) for t in self._texts(shared_words))
+            exact = self._jaccard(a, b)
+            estimate = estimate_similarity(minhash_signature(a, self.NUM_PERM), minhash_signature(b, self.NUM_PERM))
+            self.assertAlmostEqual(estimate, exact, delta=0.1, msg=f"shared_words={shared_words}")
+
+    def test_identical_and_disjoint(self):
+        a = shingle_hashes(normalize_text('<p>Hello   World</p> ' * 20 + 'abcdefghij'), 5)
+        b = shingle_hashes(normalize_text('hello world ' * 20 + 'ABCDEFGHIJ'), 5)
+        self.assertEqual(estimate_similarity(minhash_signature(a, 128), minhash_signature(b, 128)), 1.0)
+        c = shingle_hashes('0123456789' * 10, 5)
+        self.assertLess(estimate_similarity(minhash_signature(a, 128), minhash_signature(c, 128)), 0.05)
+
+    def test_similar_pairs_matches_pairwise_estimate(self):
+        texts = [*self._texts(3000), *self._texts(100)]
+        signatures = np.array([minhash_signature(shingle_hashes(normalize_text(t), 5), self.NUM_PERM) for t in texts])
+        pairs = similar_pairs(signatures, 0.5)
+        expected = [(i, j, estimate_similarity(signatures[i], signatures[j]))
+                    for i in range(len(texts)) for j in range(i + 1, len(texts))
+                    if estimate_similarity(signatures[i], signatures[j]) >= 0.5]
+        self.assertEqual(pairs, expected)
+        self.assertIn((0, 1), [(i, j) for i, j, _ in pairs])
+
+
+class GradingFixtureMixin:
+    """AI 批改相关用例共用的教学班、作业与提交。"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(username='teacher', role='teacher')
+        class_obj = Class.objects.create(name='软件工程1班')
+        course = Course.objects.create(name='软件工程', credit=2, hours=32, code='SE101')
+        course_class = TeacherCourseClass.objects.create(course=course, class_obj=class_obj, teacher=cls.teacher)
+        cls.assignment = Assignment.objects.create(course_class=course_class, title='作业一', description='实现加法',
+                                                   due_date=timezone.now() + timedelta(days=7), deployer=cls.teacher,
+                                                   ai_grading_enabled=True)
+
+    def _submission(self, **fields):
+        index = AssignmentSubmission.objects.count()
+        student = User.objects.create(username=f'student{index}', role='student')
+        fields.setdefault('ai_grading_status', 'pending')
+        return AssignmentSubmission.objects.create(assignment=self.assignment, student=student, title=f'提交{index}',
+                                                   content='def add(a, b):\n    return a + b\n', **fields)
+
+
+@override_settings(AI_SERVICE_URL='http://ai/api/v1/chat/completions', AI_CALLBACK_TOKEN='secret',
+                   AI_OUTBOX_MAX_ATTEMPTS=3, AI_OUTBOX_RETRY_BASE_SECONDS=10, AI_OUTBOX_RETRY_MAX_SECONDS=600)
+class GradingOutboxTests(GradingFixtureMixin, TestCase):
+    def _process(self, entry, handler):
+        requests = []
+
+        def record(request):
+            requests.append(json.loads(request.content))
+            return handler(request)
+
+        entry = claim_due_entries(10)[0] if entry.attempts == 0 else entry
+        with httpx.Client(transport=httpx.MockTransport(record)) as client:
+            process_entry(entry, client, mock.Mock())
+        entry.refresh_from_db()
+        entry.submission.refresh_from_db()
+        return entry, requests
+
+    def test_claim_due_entries(self):
+        due = AIGradingOutbox.objects.create(submission=self._submission())
+        AIGradingOutbox.objects.create(submission=self._submission(), next_attempt_at=timezone.now() + timedelta(hours=1))
+        AIGradingOutbox.objects.create(submission=self._submission(), status='dispatched')
+
+        claimed = claim_due_entries(10)
+        self.assertEqual([e.id for e in claimed], [due.id])
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertGreater(claimed[0].next_attempt_at, timezone.now())  # 租期内不会被再次领取
+        self.assertEqual(claim_due_entries(10), [])
+
+    def test_dispatch_success(self):
+        entry = AIGradingOutbox.objects.create(submission=self._submission())
+        entry, requests = self._process(entry, lambda r: httpx.Response(200, json={"success": True, "task_id": "t1"}))
+
+        self.assertEqual(entry.status, 'dispatched')
+        self.assertEqual(entry.submission.ai_grading_status, 'processing')
+        self.assertEqual(entry.submission.ai_grading_task_id, 't1')
+        self.assertEqual(requests[0]["idempotency_key"], entry.idempotency_key)
+        self.assertEqual(requests[0]["callback_metadata"], {"submission_id": entry.submission_id})
+        self.assertEqual(requests[0]["priority"], PRIORITY_STANDARD)
+
+    @override_settings(AI_CALLBACK_TOKEN='')
+    def test_no_callback_without_token(self):
+        entry = AIGradingOutbox.objects.create(submission=self._submission())
+        _, requests = self._process(entry, lambda r: httpx.Response(200, json={"success": True, "task_id": "t1"}))
+        self.assertNotIn("callback_url", requests[0])
+
+    def test_retryable_failure_backs_off(self):
+        entry = AIGradingOutbox.objects.create(submission=self._submission())
+        before = timezone.now()
+        entry, _ = self._process(entry, lambda r: httpx.Response(503, headers={"retry-after": "30"}))
+
+        self.assertEqual(entry.status, 'pending')
+        self.assertIn('503', entry.last_error)
+        self.assertGreaterEqual(entry.next_attempt_at, before + timedelta(seconds=30))  # Retry-After 作为下限
+        self.assertEqual(entry.submission.ai_grading_status, 'pending')  # 下次重试时仍会分发
+
+    def test_transport_error_retried_with_backoff(self):
+        entry = AIGradingOutbox.objects.create(submission=self._submission(), attempts=2)
+
+        def refuse(request):
+            raise httpx.ConnectError("connection refused", request=request)
+
+        before = timezone.now()
+        entry, _ = self._process(entry, refuse)
+        self.assertEqual(entry.status, 'pending')
+        self.assertGreaterEqual(entry.next_attempt_at, before + timedelta(seconds=20))
+        self.assertEqual(retry_delay_seconds(2), 20)
+        self.assertEqual(retry_delay_seconds(20), 600)  # 不超过上限
+        self.assertEqual(retry_delay_seconds(1, retry_after=45), 45)
+
+    def test_gives_up_after_max_attempts(self):
+        entry = AIGradingOutbox.objects.create(submission=self._submission(), attempts=3)
+        entry, _ = self._process(entry, lambda r: httpx.Response(429))
+
+        self.assertEqual(entry.status, 'failed')
+        self.assertEqual(entry.submission.ai_grading_status, 'failed')
+        self.assertIn('429', entry.submission.ai_comment)
+
+    def test_client_error_not_retried(self):
+        entry = AIGradingOutbox.objects.create(submission=self._submission())
+        entry, requests = self._process(entry, lambda r: httpx.Response(422, json={"detail": "bad request"}))
+
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(entry.status, 'failed')
+        self.assertEqual(entry.submission.ai_grading_status, 'failed')
+
+    def test_submission_no_longer_pending_is_skipped(self):
+        entry = AIGradingOutbox.objects.create(submission=self._submission(ai_grading_status='completed'))
+        entry, requests = self._process(entry, lambda r: httpx.Response(200, json={"success": True, "task_id": "t1"}))
+
+        self.assertEqual(requests, [])
+        self.assertEqual(entry.status, 'dispatched')
+        self.assertEqual(entry.submission.ai_grading_status, 'completed')
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class GradingOutboxClaimConcurrencyTests(GradingFixtureMixin, TransactionTestCase):
+    def test_locked_entries_skipped(self):
+        self.setUpTestData()
+        locked = AIGradingOutbox.objects.create(submission=self._submission())
+        free = AIGradingOutbox.objects.create(submission=self._submission())
+        claimed = []
+
+        def claim():
+            try:
+                claimed.extend(claim_due_entries(10))
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            AIGradingOutbox.objects.select_for_update().get(pk=locked.pk)  # 另一个 relay 正在处理
+            worker = threading.Thread(target=claim)
+            worker.start()
+            worker.join(timeout=10)
+        self.assertEqual([e.id for e in claimed], [free.id])
+
+
+GRADED = {"status": "SUCCESS", "success": True, "content": '{"score": 88, "comment": "思路清晰", "AI生成疑似度": 0.1}'}
+
+
+@override_settings(AI_CALLBACK_TOKEN='secret')
+class AIGradingCallbackTests(GradingFixtureMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        patcher = mock.patch('course.views.kick_ai_grading_jobs')
+        self.kick = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _callback(self, submission, task_id, token='secret', body=GRADED):
+        payload = {**body, "task_id": task_id, "metadata": {"submission_id": submission.id}}
+        headers = {'HTTP_X_AI_CALLBACK_TOKEN': token} if token is not None else {}
+        response = self.client.post(reverse('ai-grading-callback'), payload, format='json', **headers)
+        submission.refresh_from_db()
+        return response
+
+    def test_result_applied(self):
+        submission = self._submission(ai_grading_status='processing', ai_grading_task_id='t1')
+        response = self._callback(submission, 't1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(submission.ai_grading_status, 'completed')
+        self.assertEqual(submission.ai_score, 88)
+        self.assertEqual(submission.ai_comment, '思路清晰')
+        self.kick.assert_called_once_with([submission.id])
+
+    def test_callback_before_task_id_recorded(self):
+        submission = self._submission(ai_grading_status='processing')
+        self._callback(submission, 't1')
+        self.assertEqual(submission.ai_grading_status, 'completed')
+        self.assertEqual(submission.ai_grading_task_id, 't1')
+
+    def test_invalid_token_rejected(self):
+        submission = self._submission(ai_grading_status='processing', ai_grading_task_id='t1')
+        for token in ('wrong', None):
+            self.assertEqual(self._callback(submission, 't1', token=token).status_code, 403)
+        self.assertEqual(submission.ai_grading_status, 'processing')
+
+    @override_settings(AI_CALLBACK_TOKEN='')
+    def test_rejected_when_token_not_configured(self):
+        submission = self._submission(ai_grading_status='processing', ai_grading_task_id='t1')
+        self.assertEqual(self._callback(submission, 't1', token='').status_code, 403)
+        self.assertEqual(submission.ai_grading_status, 'processing')
+
+    def test_stale_task_ignored(self):
+        submission = self._submission(ai_grading_status='processing', ai_grading_task_id='t2')
+        response = self._callback(submission, 't1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(submission.ai_grading_status, 'processing')
+        self.assertIsNone(submission.ai_score)
+        self.kick.assert_not_called()
+
+    def test_not_processing_ignored(self):
+        for status in ('completed', 'pending', 'failed'):
+            submission = self._submission(ai_grading_status=status, ai_grading_task_id='t1', ai_comment='原评语')
+            self.assertEqual(self._callback(submission, 't1').status_code, 200)
+            self.assertEqual(submission.ai_grading_status, status)
+            self.assertEqual(submission.ai_comment, '原评语')
+        self.kick.assert_not_called()
+
+    def test_failed_task(self):
+        submission = self._submission(ai_grading_status='processing', ai_grading_task_id='t1')
+        self._callback(submission, 't1', body={"status": "FAILURE", "success": False, "error": "provider down"})
+        self.assertEqual(submission.ai_grading_status, 'failed')
+        self.assertIn('provider down', submission.ai_comment)
+
+
+@override_settings(AI_SERVICE_STATUS_URL='http://ai/api/v1/task_status/', AI_POLL_CONCURRENCY=2,
+                   AI_CALLBACK_TOKEN='secret', AI_CALLBACK_GRACE_SECONDS=300,
+                   AI_POLL_BACKOFF_BASE_SECONDS=60, AI_POLL_BACKOFF_MAX_SECONDS=1800)
+class AIGradingPollTests(GradingFixtureMixin, TestCase):
+    def test_fetch_statuses_in_concurrent_batches(self):
+        requests = []
+
+        def handler(request):
+            task_ids = json.loads(request.content)["task_ids"]
+            requests.append((request.url.path, len(task_ids)))
+            if task_ids[0] == 't200':  # 第二批查询失败，其中的任务下次再查
+                return httpx.Response(500, text='boom')
+            return httpx.Response(200, json={"results": {i: GRADED for i in task_ids}})
+
+        real_client = httpx.AsyncClient
+        with mock.patch('course.tasks.httpx.AsyncClient',
+                        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs)):
+            results = asyncio.run(_fetch_task_statuses([f't{i}' for i in range(450)]))
+
+        self.assertEqual(sorted(requests), [('/api/v1/task_status/batch', 50)] + [('/api/v1/task_status/batch', 200)] * 2)
+        self.assertEqual(len(results), 250)
+        self.assertNotIn('t200', results)
+
+    def test_next_check_delay(self):
+        for attempts, base in ((1, 60), (3, 240), (20, 1800)):
+            delay = next_check_delay(attempts)
+            self.assertGreaterEqual(delay, base * 0.8)
+            self.assertLessEqual(delay, base * 1.2)
+
+    def _poll(self, results, during_fetch=lambda: None):
+        """执行一次轮询；批量查询返回 results，查询期间执行 during_fetch。返回 (被查询的任务, kick_ai_grading_jobs)。"""
+        def fake_run(_):
+            during_fetch()
+            return results
+
+        with mock.patch('course.tasks._fetch_task_statuses') as fetch, \
+                mock.patch('course.tasks.asyncio.run', fake_run), \
+                mock.patch('course.tasks.kick_ai_grading_jobs') as kick:
+            _poll_ai_grading_results()
+        return (fetch.call_args.args[0] if fetch.called else []), kick
+
+    def _processing(self, task_id, **fields):
+        submission = self._submission(ai_grading_status='processing', ai_grading_task_id=task_id, **fields)
+        AssignmentSubmission.objects.filter(pk=submission.pk).update(update_time=timezone.now() - timedelta(hours=1))
+        return submission
+
+    def test_poll_writes_results_and_reschedules(self):
+        finished = self._processing('t1')
+        running = self._processing('t2')
+        recent = self._submission(ai_grading_status='processing', ai_grading_task_id='t3')  # 仍在回调宽限期内
+        later = self._processing('t4', ai_next_check_at=timezone.now() + timedelta(minutes=5))
+
+        polled, kick = self._poll({'t1': GRADED, 't2': {"success": False, "error": "Task not ready"}})
+
+        self.assertEqual(sorted(polled), ['t1', 't2'])
+        for submission in (finished, running, recent, later):
+            submission.refresh_from_db()
+        self.assertEqual(finished.ai_grading_status, 'completed')
+        self.assertEqual(finished.ai_score, 88)
+        self.assertEqual(running.ai_grading_status, 'processing')
+        self.assertEqual(running.ai_check_attempts, 1)
+        self.assertGreater(running.ai_next_check_at, timezone.now())
+        self.assertEqual(recent.ai_check_attempts, 0)
+        kick.assert_called_once()
+        self.assertEqual(list(kick.call_args.args[0]), [finished.id])
+
+    @override_settings(AI_CALLBACK_TOKEN='')
+    def test_no_grace_period_without_callbacks(self):
+        self._submission(ai_grading_status='processing', ai_grading_task_id='t1')
+        polled, _ = self._poll({})
+        self.assertEqual(polled, ['t1'])
+
+    def test_rows_changed_during_fetch_untouched(self):
+        redispatched = self._processing('t1')
+        reset = self._processing('t2')
+        unchanged = self._processing('t3')
+
+        def change_rows():
+            AssignmentSubmission.objects.filter(pk=redispatched.pk).update(ai_grading_task_id='t9')
+            AssignmentSubmission.objects.filter(pk=reset.pk).update(ai_grading_status='pending', ai_grading_task_id=None)
+
+        self._poll({'t1': GRADED, 't2': GRADED, 't3': GRADED}, during_fetch=change_rows)
+
+        for submission in (redispatched, reset, unchanged):
+            submission.refresh_from_db()
+        self.assertEqual((redispatched.ai_grading_status, redispatched.ai_grading_task_id, redispatched.ai_score),
+                         ('processing', 't9', None))
+        self.assertEqual((reset.ai_grading_status, reset.ai_score), ('pending', None))
+        self.assertEqual(unchanged.ai_grading_status, 'completed')
+
+
+@override_settings(AI_GRADING_JOB_CONCURRENCY=2)
+class AIGradingJobTests(GradingFixtureMixin, TestCase):
+    def setUp(self):
+        self.assignment = Assignment.objects.get(pk=self.assignment.pk)  # 与接口一致，从数据库读取作业
+        graded = self._submission(ai_grading_status='completed')
+        graded.ai_grading_input_hash = grading_input_hash(AssignmentSubmission.objects.get(pk=graded.pk))
+        graded.save(update_fields=['ai_grading_input_hash'])
+        self.graded = graded
+        self.in_progress = self._submission(ai_grading_status='processing', ai_grading_task_id='t0')
+        self.to_grade = [self._submission(ai_grading_status='skipped') for _ in range(3)]
+
+    def _finish_in_flight(self, job):
+        AssignmentSubmission.objects.filter(ai_outbox__job=job, ai_grading_status__in=['pending', 'processing']) \
+            .update(ai_grading_status='completed')
+
+    def test_job_runs_in_windows_until_completed(self):
+        job, created = create_ai_grading_job(self.assignment, self.teacher)
+
+        self.assertTrue(created)
+        self.assertEqual(job.submission_ids, [s.id for s in self.to_grade])
+        self.assertEqual(AIGradingOutbox.objects.filter(job=job).count(), 2)
+        progress = job_progress(job)
+        self.assertEqual((progress["total"], progress["queued"], progress["done"]), (5, 3, 0))
+        self.assertEqual((progress["skipped_unchanged"], progress["skipped_in_progress"]), (1, 1))
+
+        fill_ai_grading_job(job.id)  # 在途已满，不再补入
+        self.assertEqual(AIGradingOutbox.objects.filter(job=job).count(), 2)
+
+        self._finish_in_flight(job)
+        job = fill_ai_grading_job(job.id)
+        self.assertEqual(job.enqueued, 3)
+        self.assertEqual(job_progress(job)["done"], 2)
+
+        self._finish_in_flight(job)
+        job = fill_ai_grading_job(job.id)
+        self.assertEqual(job.status, 'completed')
+        self.assertIsNotNone(job.finish_time)
+        self.assertEqual(job_progress(job)["done"], 3)
+
+    def test_force_regrades_unchanged(self):
+        job, _ = create_ai_grading_job(self.assignment, self.teacher, force=True)
+        self.assertIn(self.graded.id, job.submission_ids)
+        self.assertEqual(job.skipped_unchanged, 0)
+
+    def test_prompt_change_regrades(self):
+        self.assignment.ai_grading_prompt = '按新的评分标准批改'
+        self.assignment.save()
+        job, _ = create_ai_grading_job(self.assignment, self.teacher)
+        self.assertIn(self.graded.id, job.submission_ids)
+
+    def test_kick_only_running_jobs(self):
+        job, _ = create_ai_grading_job(self.assignment, self.teacher)
+        with mock.patch('course.tasks.advance_ai_grading_jobs.delay') as delay:
+            kick_ai_grading_jobs(job.submission_ids[:2])
+            delay.assert_called_once_with(job.id)
+            AIGradingJob.objects.filter(pk=job.pk).update(status='completed')
+            kick_ai_grading_jobs(job.submission_ids[:2])
+            delay.assert_called_once()
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        url = reverse('homework-ai-grade-all', args=[self.assignment.id])
+
+        self.assertEqual(client.get(url).status_code, 404)
+        response = client.post(url, {}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["total"], 5)
+
+        conflict = client.post(url, {"force": True}, format='json')
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict.data["job_id"], response.data["job_id"])
+        self.assertEqual(AIGradingJob.objects.count(), 1)
+
+        progress = client.get(url)
+        self.assertEqual(progress.status_code, 200)
+        self.assertEqual(progress.data["job_id"], response.data["job_id"])
+        self.assertEqual(client.post(url, {"submission_ids": "all"}, format='json').status_code, 400)
+
+    def test_api_requires_ai_grading_enabled(self):
+        Assignment.objects.filter(pk=self.assignment.pk).update(ai_grading_enabled=False)
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        response = client.post(reverse('homework-ai-grade-all', args=[self.assignment.id]), {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(AIGradingJob.objects.exists())
@@ -9,6 +9,8 @@ from .views import (
     # 学生接口
     CourseListView, StudentCourseViewSet, StudentAssignmentViewSet,
     StudentFileUploadView, StudentDashboardView, AssignmentSubmissionView,
+    # AI 服务回调
+    AIGradingCallbackView,
 )
 
 # ---------- 教师 / 管理员通用接口 ----------
@@ -27,6 +29,7 @@ urlpatterns = [
     # ========== 教师 / 管理员 ==========
     path('api/', include(router.urls)),
     path('api/available-courses/', available_courses, name='available-courses'),
+    path('api/ai-callback/grading/', AIGradingCallbackView.as_view(), name='ai-grading-callback'),
 
     # ========== 学生 ==========
     path('student/', include(student_router.urls)),                              # 统一学生前缀
@@ -1,12 +1,12 @@
 # backend/course/utils.py (如果创建此文件) 或 backend/course/views.py 顶部
+import codecs
 import re
 import json
-from typing import Optional
+from typing import Optional, Tuple
 
 import chardet  # 用于检测文件编码, pip install chardet
 
 ALLOWED_EXTENSIONS = ['.txt', '.vue', '.py', '.html', '.js', '.sh', '.bash', '.json', '.c', '.cpp', '.java', '.md']
-MAX_CONTENT_LENGTH = 15000  # 总字数限制
 
 
 def extract_json_from_string(text_containing_json: str) -> Optional[dict]:
@@ -49,18 +49,39 @@ def extract_json_from_string(text_containing_json: str) -> Optional[dict]:
         return None
 
 
+def detect_and_decode(raw_data: bytes) -> Tuple[str, str]:
+    """
+    Decodes an uploaded text file of unknown encoding, returning (text, encoding).
+    Most uploads are UTF-8 (or plain ASCII), so a strict UTF-8 decode is tried first;
+    chardet's statistical detection over the whole content only runs when that fails.
+    """
+    if raw_data.startswith(codecs.BOM_UTF8):
+        return raw_data[len(codecs.BOM_UTF8):].decode('utf-8', errors='replace'), 'utf-8-sig'
+    try:
+        return raw_data.decode('utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    # Detect encoding
+    detected_encoding = chardet.detect(raw_data)['encoding']
+    if detected_encoding:
+        try:
+            return raw_data.decode(detected_encoding, errors='replace'), detected_encoding
+        except LookupError:
+            pass
+    # Fallback if chardet fails (less likely for text files)
+    return raw_data.decode('utf-8', errors='replace'), 'utf-8'
+
+
+def decode_file_bytes(raw_data: bytes) -> str:
+    """Decodes an uploaded text file of unknown encoding."""
+    return detect_and_decode(raw_data)[0]
+
+
 def read_uploaded_file_content(uploaded_file) -> Optional[str]:
     """Reads content from an InMemoryUploadedFile or TemporaryUploadedFile."""
     try:
         uploaded_file.seek(0)  # Ensure reading from the beginning
-        raw_data = uploaded_file.read()
-        # Detect encoding
-        detected_encoding = chardet.detect(raw_data)['encoding']
-        if detected_encoding:
-            return raw_data.decode(detected_encoding, errors='replace')
-        else:
-            # Fallback if chardet fails (less likely for text files)
-            return raw_data.decode('utf-8', errors='replace')
+        return decode_file_bytes(uploaded_file.read())
     except Exception as e:
         print(f"Error reading file {uploaded_file.name}: {e}")
         return None
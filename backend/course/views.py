@@ -1,9 +1,10 @@
 # backend/course/views.py
+import hmac
 import logging
-import os
 from io import BytesIO
 
-import httpx
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Q, Count, Avg
 from django.utils import timezone
 from rest_framework import generics, status, permissions, viewsets
@@ -23,7 +24,10 @@ from .serializers import CourseInfoSerializer, AssignmentSubmissionSerializer, \
     StudentDashboardSerializer, StudentCourseCardSerializer, StudentCourseDetailSerializer
 from .serializers import CourseSerializer, CourseBriefSerializer, TeacherCourseClassSerializer, MaterialSerializer, \
     HomeworkSerializer
-from .utils import ALLOWED_EXTENSIONS, read_uploaded_file_content, MAX_CONTENT_LENGTH, extract_json_from_string
+from .ai_grading import apply_ai_grading_result
+from .grading_jobs import create_ai_grading_job, job_progress, kick_ai_grading_jobs
+from .grading_outbox import enqueue_ai_grading
+from .similarity import find_similar_submissions, schedule_signature
 
 logger = logging.getLogger(__name__)
 
@@ -611,6 +615,61 @@ class HomeworkViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
 
+    # --------- 整班 AI 批改 ----------
+    @action(detail=True, methods=['get', 'post'], url_path='ai-grade-all')
+    def ai_grade_all(self, request, pk=None):
+        """
+        POST /cou/api/homeworks/<id>/ai-grade-all/
+        body: { "submission_ids": [1, 2], "force": false }  # submission_ids 省略时批改全部已提交的作业
+        跳过提示词和内容都未变化的已批改提交（force=true 时不跳过），返回任务进度；已有进行中的任务时返回 409。
+        GET 返回该作业最近一次整班批改任务的进度（queued / processing / done / failed 等）。
+        """
+        assignment = self.get_object()
+        if assignment.deployer != request.user and assignment.course_class.teacher != request.user:
+            if request.user.role not in ['admin', 'superadmin']:  # 管理员豁免
+                return Response({"detail": "无权限批改此作业"}, status=status.HTTP_403_FORBIDDEN)
+
+        if request.method == 'GET':
+            job = assignment.ai_grading_jobs.order_by('-id').first()
+            if job is None:
+                return Response({"detail": "该作业没有整班批改任务"}, status=status.HTTP_404_NOT_FOUND)
+            return Response(job_progress(job))
+
+        if not assignment.ai_grading_enabled:
+            return Response({"detail": "请先启用AI辅助批改"}, status=status.HTTP_400_BAD_REQUEST)
+        submission_ids = request.data.get('submission_ids')
+        if submission_ids is not None and not (
+                isinstance(submission_ids, list) and all(isinstance(i, int) for i in submission_ids)):
+            return Response({"detail": "'submission_ids' 须为提交ID列表"}, status=status.HTTP_400_BAD_REQUEST)
+
+        job, created = create_ai_grading_job(assignment, request.user, submission_ids,
+                                             force=request.data.get('force') is True)
+        if not created:
+            return Response({"detail": "该作业已有进行中的整班批改任务", **job_progress(job)},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(job_progress(job), status=status.HTTP_202_ACCEPTED)
+
+    # --------- 提交相似度 ----------
+    @action(detail=True, methods=['get'], url_path='similarity')
+    def similarity(self, request, pk=None):
+        """
+        GET /cou/api/homeworks/<id>/similarity/?threshold=0.5
+        学生提交之间（正文 + 文本附件）的相似度检测：返回相似度不低于 threshold 的提交对及其连通聚类
+        """
+        assignment = self.get_object()
+        if assignment.deployer != request.user and assignment.course_class.teacher != request.user:
+            if request.user.role not in ['admin', 'superadmin']:  # 管理员豁免
+                return Response({"detail": "无权限查看此作业"}, status=status.HTTP_403_FORBIDDEN)
+        threshold = request.query_params.get('threshold')
+        if threshold is not None:
+            try:
+                threshold = float(threshold)
+            except ValueError:
+                threshold = -1
+            if not 0 < threshold <= 1:
+                return Response({"detail": "'threshold' 须为 0 到 1 之间的小数"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(find_similar_submissions(assignment, threshold))
+
     # 支持删除操作
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -1007,6 +1066,7 @@ class StudentAssignmentViewSet(viewsets.ModelViewSet):
         submission.title = request.data.get('title', submission.title)
         submission.content = request.data.get('content', submission.content)
         submission.save()
+        schedule_signature(submission.id)
 
         return Response(self.get_serializer(submission).data)
 
@@ -1113,184 +1173,38 @@ class AssignmentSubmissionView(viewsets.ModelViewSet):
         }
         submission_serializer = self.get_serializer(data=serializer_data)
         submission_serializer.is_valid(raise_exception=True)
-        submission = submission_serializer.save(student=request.user)  # 保存，确保 student 被设置
 
-        # 处理文件上传
-        uploaded_files_content = []
-        uploaded_file_names = []
+        # 先把附件上传到 MinIO（对象名为内容 MD5，失败时留下的对象可被后续同内容上传复用），
+        # 提交记录、附件记录与 AI 批改发件箱记录再在同一事务中写入
         files_to_process = request.FILES.getlist('files') or request.FILES.getlist('upload_files') or []
-
-        can_ai_grade_files = True
-        minio_client = MinioClient()
-
+        minio_client = MinioClient() if files_to_process else None
+        uploaded_files = []  # [(MinIO 对象名, 原始文件名)]
         for uploaded_file in files_to_process:
-            original_name = uploaded_file.name
-            file_ext = os.path.splitext(original_name)[1].lower()
-
-            # MinIO上传逻辑保持不变
             try:
-                file_data_bytes = uploaded_file.read()  # 读取文件数据以供上传
-                uploaded_file.seek(0)  # 重置文件指针，以便后续可能的读取
-                object_name_in_minio = minio_client.upload_file(file_data=file_data_bytes)
-                AssignmentSubmissionFile.objects.create(
-                    submission=submission,
-                    file_name=object_name_in_minio,
-                    original_name=original_name
-                )
-                uploaded_file_names.append(original_name)
+                uploaded_files.append((minio_client.upload_file(file_data=uploaded_file.read()), uploaded_file.name))
             except Exception as e:
-                logger.error(f"MinIO upload failed for {original_name}: {e}")
-                # 可以选择是否因此中断整个提交过程
-                submission.delete()  # 如果上传失败，回滚提交
-                return Response({"detail": f"文件 {original_name} 上传失败: {e}"},
+                logger.error(f"MinIO upload failed for {uploaded_file.name}: {e}")
+                return Response({"detail": f"文件 {uploaded_file.name} 上传失败: {e}"},
                                 status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            if file_ext not in ALLOWED_EXTENSIONS:
-                logger.info(
-                    f"File {original_name} has unsupported extension {file_ext}, skipping AI grading for files.")
-                can_ai_grade_files = False  # 一旦有不支持的文件，就不再尝试读取文件内容给AI
-                # 不再读取这个文件，但其他允许的文件仍然可以尝试读取（如果策略如此）
-                # 但当前策略是：只要有一个文件类型不支持，就不把任何文件内容给AI
-                break  # 如果一个文件类型不合规，直接判定文件部分不适合AI
-
-            if can_ai_grade_files:  # 只有在所有文件类型都符合的情况下才读取
-                content = read_uploaded_file_content(uploaded_file)
-                if content:
-                    uploaded_files_content.append(f"\n\n--- 文件: {original_name} ---\n{content}")
-                else:
-                    logger.warning(f"Could not read content from allowed file: {original_name}")
-
-        # --- AI 自动批改逻辑 ---
-        if assignment.ai_grading_enabled:
-            submission.ai_grading_status = 'pending'  # 先标记为待处理
-            final_student_content = submission.content
-
-            if not can_ai_grade_files:  # 如果文件类型不允许，则标记跳过
-                logger.info(f"AI grading skipped for submission {submission.id} due to unsupported file types.")
+        with transaction.atomic():
+            submission = submission_serializer.save(student=request.user)  # 保存，确保 student 被设置
+            AssignmentSubmissionFile.objects.bulk_create([
+                AssignmentSubmissionFile(submission=submission, file_name=object_name, original_name=original_name)
+                for object_name, original_name in uploaded_files
+            ])
+            # --- AI 自动批改：读取附件、构造 prompt、调用 AI 服务都由发件箱 relay 任务在请求之外完成 ---
+            if assignment.ai_grading_enabled:
+                submission.ai_grading_status = 'pending'
+                submission.save(update_fields=['ai_grading_status'])
+                enqueue_ai_grading(submission)
+            else:  # AI批改未启用
                 submission.ai_grading_status = 'skipped'
-                submission.ai_comment = "由于提交了不支持AI分析的文件类型（如压缩包、图片等），本次未进行AI辅助批改。"
-                submission.save(update_fields=['ai_grading_status', 'ai_comment'])
-            else:
-                for file_c in uploaded_files_content:
-                    final_student_content += file_c
-
-                if len(final_student_content) > MAX_CONTENT_LENGTH:
-                    logger.info(
-                        f"AI grading skipped for submission {submission.id} due to content length > {MAX_CONTENT_LENGTH}.")
-                    submission.ai_grading_status = 'skipped'
-                    submission.ai_comment = f"由于提交内容总字数超过{MAX_CONTENT_LENGTH}字，本次未进行AI辅助批改。"
-                    submission.save(update_fields=['ai_grading_status', 'ai_comment'])
-                else:
-                    submission.ai_grading_status = 'processing'  # 标记为处理中
-                    submission.save(update_fields=['ai_grading_status'])
-
-                    ai_system_prompt = assignment.ai_grading_prompt or \
-                                       f"课程《{assignment.course_class.course.name}》的作业《{assignment.title}》，描述：{assignment.description}。满分：{assignment.max_score}。请批改。"
-
-                    user_content_for_ai = f"学生作业标题：{submission.title}\n学生提交内容：\n{final_student_content}"
-                    if uploaded_file_names:  # 仅当有成功上传的文件时才添加这部分
-                        user_content_for_ai += f"\n\n学生上传文件列表：{', '.join(uploaded_file_names)}"
-
-                    messages_for_ai = [
-                        {"role": "system", "content": ai_system_prompt},
-                        {"role": "user", "content": user_content_for_ai}
-                    ]
-
-                    ai_request_payload = {
-                        "messages": messages_for_ai,
-                        "use_reasoning_model": True,  # 通常批改需要更好的模型
-                        "model": None,  # 让AI服务自行选择
-                        "provider": None,  # 让AI服务自行选择
-                        "response_format": {"type": "json_object"}  # 明确要求JSON输出
-                    }
-
-                    logger.info(f"Sending request to AI service for submission {submission.id}")
-                    try:
-                        # 直接调用AI服务 (如果AI服务与Django在同一网络或可访问)
-                        # 注意: 这里的AI_SERVICE_URL需要配置在Django settings或者.env
-                        # from django.conf import settings
-                        # ai_service_url = getattr(settings, 'AI_SERVICE_URL', 'http://localhost:8080/api/v1/chat/completions')
-                        # 此处硬编码仅为示例，实际应从配置读取
-                        ai_service_url = os.getenv('AI_SERVICE_URL', 'http://localhost:8080/api/v1/chat/completions')
-
-                        # 使用 httpx 进行异步调用 (如果是在异步视图中) 或同步调用
-                        # 当前视图是同步的，所以使用同步调用
-                        # 对于可能耗时长的AI批改，最佳实践是通过Celery任务异步调用
-                        # 这里简化为直接同步调用，并设置超时
-                        # 后续应改为通过Celery任务调用AI服务的异步接口
-
-                        task_payload = {
-                            "request_data": ai_request_payload,  # AIRequest 字典
-                            "submission_id": submission.id  # 传递 submission_id 以便回调更新
-                        }
-                        # 假设您的Celery任务名为 'ai_service.tasks.trigger_ai_grading_for_submission'
-                        # from ai_service.celery_app import celery_app # 需要能访问到celery_app
-                        # ai_task = celery_app.send_task('ai_service.tasks.trigger_ai_grading_for_submission', args=[task_payload])
-
-                        # 暂时先不通过celery，直接调用 ai_service 的celery task分发接口
-                        # 这个接口会返回 task_id
-                        with httpx.Client(timeout=20.0) as client:  # 短超时，因为只是分发任务
-                            response = client.post(ai_service_url, json=ai_request_payload)
-                            response.raise_for_status()  # 如果HTTP状态码是4xx或5xx，则引发异常
-                            ai_api_response = response.json()
-
-                        if ai_api_response.get("success") and ai_api_response.get("task_id"):
-                            submission.ai_grading_task_id = ai_api_response["task_id"]
-                            submission.ai_grading_status = 'processing'  # 已发送给AI服务处理
-                            logger.info(
-                                f"AI grading task {submission.ai_grading_task_id} dispatched for submission {submission.id}.")
-                        elif ai_api_response.get("success") and ai_api_response.get("content"):  # 如果AI服务同步返回了结果
-                            logger.info(f"AI service returned synchronous result for submission {submission.id}")
-                            raw_ai_output = ai_api_response.get("content")
-                            parsed_json_result = extract_json_from_string(raw_ai_output)
-                            if parsed_json_result and "score" in parsed_json_result and "comment" in parsed_json_result:
-                                submission.ai_score = parsed_json_result.get("score")
-                                # 确保分数不超过满分
-                                if submission.ai_score is not None and assignment.max_score is not None:
-                                    submission.ai_score = min(max(0, float(submission.ai_score)),
-                                                              float(assignment.max_score))
-
-                                submission.ai_comment = parsed_json_result.get("comment")
-                                submission.ai_generated_similarity = parsed_json_result.get("AI生成疑似度")
-                                submission.ai_grading_status = 'completed'
-                                logger.info(
-                                    f"AI grading completed for submission {submission.id}. Score: {submission.ai_score}")
-                            else:
-                                submission.ai_grading_status = 'failed'
-                                submission.ai_comment = f"AI返回格式错误或缺少必要字段。原始输出: {raw_ai_output[:500]}"  # 只记录部分原始输出
-                                logger.error(
-                                    f"AI result parsing failed for submission {submission.id}. Raw: {raw_ai_output}")
-                        else:  # AI API 调用失败或未返回 task_id
-                            submission.ai_grading_status = 'failed'
-                            submission.ai_comment = f"AI服务调用失败: {ai_api_response.get('error', '未知错误')}"
-                            logger.error(
-                                f"AI service call failed for submission {submission.id}: {ai_api_response.get('error')}")
-
-                        submission.save()
-
-                    except httpx.TimeoutException:
-                        logger.error(f"AI service request timed out for submission {submission.id} (dispatching task).")
-                        submission.ai_grading_status = 'failed'
-                        submission.ai_comment = "AI服务请求超时（分发任务阶段）。"
-                        submission.save(update_fields=['ai_grading_status', 'ai_comment'])
-                    except httpx.RequestError as e:
-                        logger.error(f"AI service request error for submission {submission.id}: {e}")
-                        submission.ai_grading_status = 'failed'
-                        submission.ai_comment = f"AI服务请求错误: {e}"
-                        submission.save(update_fields=['ai_grading_status', 'ai_comment'])
-                    except Exception as e:  # 其他未知错误
-                        logger.error(f"Unexpected error during AI grading dispatch for submission {submission.id}: {e}",
-                                     exc_info=True)
-                        submission.ai_grading_status = 'failed'
-                        submission.ai_comment = f"AI批改过程中发生未知错误: {e}"
-                        submission.save(update_fields=['ai_grading_status', 'ai_comment'])
-        else:  # AI批改未启用
-            submission.ai_grading_status = 'skipped'
-            submission.save(update_fields=['ai_grading_status'])
+                submission.save(update_fields=['ai_grading_status'])
+            schedule_signature(submission.id)
 
         # 返回创建的提交记录数据
-        # 注意：此时的 submission 对象可能已经包含了 AI 批改的初步状态或 task_id
-        # 但完整的AI结果是异步的，需要教师后续查看或系统轮询更新
+        # 注意：此时 AI 批改尚未分发（状态为 pending），结果由回调或兜底轮询异步写入
         final_response_serializer = self.get_serializer(submission)
         return Response(final_response_serializer.data, status=status.HTTP_201_CREATED)
 
@@ -1366,3 +1280,42 @@ class StudentDashboardView(APIView):
         student = request.user
         serializer = StudentDashboardSerializer(student)
         return Response(serializer.data)
+
+
+class AIGradingCallbackView(APIView):
+    """
+    AI 服务批改任务完成后的回调：POST /cou/api/ai-callback/grading/
+    请求体与 AI 服务 task_status 响应字段相同，另带 metadata.submission_id；
+    以请求头 X-AI-Callback-Token 与 settings.AI_CALLBACK_TOKEN 校验来源。
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        expected_token = settings.AI_CALLBACK_TOKEN
+        if not expected_token or not hmac.compare_digest(
+                request.headers.get('X-AI-Callback-Token', ''), expected_token):
+            return Response({"detail": "回调令牌无效"}, status=status.HTTP_403_FORBIDDEN)
+
+        payload = request.data
+        submission_id = (payload.get('metadata') or {}).get('submission_id')
+        task_id = payload.get('task_id')
+        submission = AssignmentSubmission.objects.select_related('assignment').filter(pk=submission_id).first()
+        if submission is None:
+            return Response({"detail": "提交记录不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+        # 提交接口可能尚未写入 task_id（回调先于分发响应到达），此时按 submission_id 接受
+        if submission.ai_grading_task_id and submission.ai_grading_task_id != task_id:
+            logger.warning(f"Ignoring stale AI callback for submission {submission.id}: task {task_id}, "
+                           f"current task {submission.ai_grading_task_id}")
+            return Response({"detail": "任务已过期"}, status=status.HTTP_200_OK)
+        if submission.ai_grading_status != 'processing':
+            # 重复回调或兜底轮询已处理
+            return Response({"detail": "已处理"}, status=status.HTTP_200_OK)
+
+        if not submission.ai_grading_task_id:
+            submission.ai_grading_task_id = task_id
+        if apply_ai_grading_result(submission, payload):
+            kick_ai_grading_jobs([submission.id])
+        logger.info(f"AI grading callback applied for submission {submission.id} (task {task_id}).")
+        return Response({"detail": "ok"}, status=status.HTTP_200_OK)
@@ -1,12 +1,11 @@
 # backend/forum/tasks.py
 from io import BytesIO
 
-import httpx
 import logging
 from celery import shared_task
-from django.conf import settings
 from django.contrib.auth import get_user_model
 
+from utils.ai_service_client import request_ai_completion, PRIORITY_INTERACTIVE
 from utils.minio_tools import MinioClient
 from .models import Post, Comment, PostFile
 
@@ -98,21 +97,18 @@ def trigger_ai_comment(self, post_id):
     )
 
     # 3. 使用 httpx 直接调用 AI 服务 (与 notifications/tasks.py 逻辑相同)
-    ai_service_url = settings.AI_SERVICE_URL
     payload = {
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt_for_ai}
         ],
         "use_reasoning_model": False,  # 论坛评论通常不需要最强模型
+        "priority": PRIORITY_INTERACTIVE,
     }
 
     ai_content = ""
     try:
-        with httpx.Client(timeout=120.0) as client:
-            response = client.post(ai_service_url, json=payload)
-            response.raise_for_status()
-            ai_response_data = response.json()
+        ai_response_data = request_ai_completion(payload, timeout=120.0)
 
         if ai_response_data.get("success") and ai_response_data.get("content"):
             ai_content = ai_response_data["content"]
@@ -1,23 +1,24 @@
-import os
 from django.utils import timezone
 
-import httpx
 import logging
 from celery import shared_task
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db.models import Avg, Q
 
 from course.models import Assignment, AssignmentSubmission, TeacherCourseClass
 from notifications.models import Notification
+from utils.ai_service_client import request_ai_completion, PRIORITY_INTERACTIVE
+from utils.prompt_budget import Section, count_message_tokens, count_tokens, pack_sections, prompt_token_limit
 
 User = get_user_model()
 
 logger = logging.getLogger(__name__)
 AI_TEACHER_USERNAMES = ['teacherDeepseek', 'teacherDeepseekR']
-MAX_CONTEXT_CHARS = 8000  # 上下文最大字符数，用于估算Token
+HISTORY_MESSAGE_LIMIT = 20  # 最多取最近多少条交流记录，超出 token 预算的部分再按从旧到新丢弃
 
 
-def get_sender_context(user: User) -> str:
+def get_sender_profile(user: User) -> str:
     """根据用户角色，抓取并格式化其个人背景信息。"""
     context_parts = [
         f"## 提问者信息\n- **身份**: {user.get_role_display()}\n- **用户名**: {user.username}\n- **姓名**: {user.name or '未设置'}"]
@@ -80,36 +81,23 @@ def get_sender_context(user: User) -> str:
         else:
             context_parts.append("- **教授课程与班级**: 暂无")
 
-    # 抓取历史交流信息，并控制长度
-    context_parts.append("\n### 历史交流记录 (最近)")
-    history_chars_so_far = sum(len(p) for p in context_parts)
+    return "\n".join(context_parts)
+
 
+def get_recent_history_lines(user: User) -> list:
+    """与 AI 助教的最近交流记录，按时间从旧到新，每条一行。"""
     ai_teachers = User.objects.filter(username__in=AI_TEACHER_USERNAMES)
     recent_messages = Notification.objects.filter(
         (Q(sender=user, recipient__in=ai_teachers) | Q(sender__in=ai_teachers, recipient=user))
-    ).order_by('-timestamp')[:10]
+    ).select_related('sender').order_by('-timestamp')[:HISTORY_MESSAGE_LIMIT]
 
+    role_map = {'student': '学生', 'teacher': '教师'}
     history_log = []
-    current_history_chars = 0
     for msg in reversed(recent_messages):
-        role_map = {'student': '学生', 'teacher': '教师'}
         sender_role_display = "AI助教" if msg.sender.username in AI_TEACHER_USERNAMES else role_map.get(msg.sender.role,
                                                                                                         '用户')
-        line = f"- **[{sender_role_display}]**: {msg.content}"
-
-        # 估算Token，避免上下文过长
-        if (history_chars_so_far + current_history_chars + len(line)) > MAX_CONTEXT_CHARS:
-            break
-
-        history_log.append(line)
-        current_history_chars += len(line)
-
-    if history_log:
-        context_parts.extend(history_log)
-    else:
-        context_parts.append("- 暂无交流历史")
-
-    return "\n".join(context_parts)
+        history_log.append(f"- **[{sender_role_display}]**: {msg.content}")
+    return history_log
 
 
 def find_all_messages_for_ai_teacher():
@@ -132,36 +120,40 @@ def process_ai_teacher_message(self):
         ai_teacher_user = user_message.recipient
         original_title = user_message.title
 
-        # 1. 收集上下文并构建Prompt
-        context = get_sender_context(sender)
+        # 1. 判断使用哪个模型
+        use_reasoning_model = (ai_teacher_user.username == 'teacherDeepseekR')
+
+        # 2. 收集上下文并按 token 预算构建Prompt：超出时先丢弃最旧的交流记录，再截断背景信息，最后才截断问题本身
         system_prompt = (
             f"你是一位资深、有耐心、善于启发学生的AI助教老师。你的名字是 {ai_teacher_user.name or ai_teacher_user.username}。"
             "你的目标是根据用户提供的背景信息和历史交流，以富有人情味和启发性的方式引导学生思考，如果有必要，可以给出最终答案。"
             "请总是尝试引导用户自己思考。请直接回复内容，不要进行额外确认。"
             "回复的格式应为Markdown格式，确保内容清晰、简洁、易读。\n\n"
         )
-        user_prompt_for_ai = f"{context}\n\n## 本次问题\n**标题**: {original_title}\n**内容**: {user_message.content}"
-
-        # 2. 估算Token并截断
-        if len(system_prompt) + len(user_prompt_for_ai) > 10000:
-            logger.warning(f"AI prompt for user {sender.username} exceeds token limit estimation. Truncating.")
-            user_prompt_for_ai = user_prompt_for_ai[:10000 - len(system_prompt)]
-
-        # 3. 判断使用哪个模型
-        use_reasoning_model = (ai_teacher_user.username == 'teacherDeepseekR')
-
-        # 4. 调用AI服务
-        ai_service_url = os.getenv('AI_SERVICE_URL', 'http://localhost:8080/api/v1/chat/completions')
+        history_lines = get_recent_history_lines(sender)
+        sections = [
+            Section('profile', get_sender_profile(sender), priority=1),
+            Section('history', "\n### 历史交流记录 (最近)", lines=history_lines or ["- 暂无交流历史"], priority=0),
+            Section('question', f"\n## 本次问题\n**标题**: {original_title}\n**内容**: {user_message.content}",
+                    priority=2),
+        ]
+        budget = min(prompt_token_limit(use_reasoning_model), settings.AI_TEACHER_MAX_PROMPT_TOKENS)
+        packed = pack_sections(sections, budget - count_tokens(system_prompt))
+        if packed.trimmed:
+            logger.warning(f"AI prompt for user {sender.username} trimmed to fit {budget} tokens: {packed.trimmed}")
+        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": packed.text}]
+
+        # 3. 调用AI服务
         payload = {
-            "messages": [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt_for_ai}],
+            "messages": messages,
             "use_reasoning_model": use_reasoning_model,
+            "priority": PRIORITY_INTERACTIVE,  # 用户在等待回复，走交互队列，不排在批量批改之后
+            "prompt_tokens": count_message_tokens(messages),
         }
 
         try:
-            with httpx.Client(timeout=180.0) as client:
-                response = client.post(ai_service_url, json=payload)
-                response.raise_for_status()
-                ai_response_data = response.json()
+            # 推理模型请求会被分发到 AI 服务的 Celery 交互队列，这里等待其完成
+            ai_response_data = request_ai_completion(payload, timeout=180.0)
 
             if ai_response_data.get("success") and ai_response_data.get("content"):
                 ai_content = ai_response_data["content"]
@@ -174,7 +166,7 @@ def process_ai_teacher_message(self):
             # 如果调用失败，自动重试
             raise self.retry(exc=e)
 
-        # 5. 将AI的回复作为新消息存入数据库
+        # 4. 将AI的回复作为新消息存入数据库
         Notification.objects.create(
             recipient=sender,
             sender=ai_teacher_user,
@@ -186,7 +178,7 @@ def process_ai_teacher_message(self):
             can_recipient_reply=True,
         )
 
-        # 6. 标记原消息为已读
+        # 5. 标记原消息为已读
         user_message.is_read = True
         user_message.read_at = timezone.now()
         user_message.save()
@@ -0,0 +1,39 @@
+# backend/utils/ai_service_client.py
+import logging
+import time
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 'interactive'  # 用户正在等待回复（AI助教私信、论坛评论）
+PRIORITY_STANDARD = 'standard'  # 学生提交作业触发的批改
+PRIORITY_BULK = 'bulk'  # 教师发起的整班批改等批量任务
+
+
+def request_ai_completion(payload: dict, timeout: float, poll_interval: float = 1.0) -> dict:
+    """
+    调用 AI 服务 /api/v1/chat/completions 并返回最终结果（AIResponse 字典）。
+    长任务（推理模型等）会被 AI 服务分发到 Celery 并只返回 task_id，此时在 timeout 内轮询任务状态直到完成，
+    调用方无需区分同步返回与异步分发两种情况。超时抛出 httpx.TimeoutException。
+    """
+    deadline = time.monotonic() + timeout
+    with httpx.Client(timeout=timeout) as client:
+        response = client.post(settings.AI_SERVICE_URL, json=payload)
+        response.raise_for_status()
+        data = response.json()
+        task_id = data.get("task_id")
+        if not (data.get("success") and task_id):
+            return data
+
+        status_url = f"{settings.AI_SERVICE_STATUS_URL.rstrip('/')}/{task_id}"
+        while time.monotonic() < deadline:
+            time.sleep(min(poll_interval, max(deadline - time.monotonic(), 0)))
+            status_response = client.get(status_url)
+            status_response.raise_for_status()
+            data = status_response.json()
+            if data.get("success") or "Task not ready" not in (data.get("error") or ""):
+                return data
+            poll_interval = min(poll_interval * 1.5, 5.0)
+    raise httpx.TimeoutException(f"AI task {task_id} did not finish within {timeout:.0f}s")
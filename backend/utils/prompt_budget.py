@@ -0,0 +1,146 @@
+# backend/utils/prompt_budget.py
+# 构建发给 AI 服务的 prompt 时统一做 token 预算：计数、按模型取上限、按优先级裁剪各段上下文
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# CJK 统一表意文字、扩展 A、兼容表意文字及全角标点
+CJK_RE = re.compile('[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+# DeepSeek 官方给出的换算：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+MESSAGE_OVERHEAD_TOKENS = 4  # 每条消息的角色标记等固定开销
+TRUNCATION_MARK = '…（已截断）'
+
+
+class PromptTooLong(Exception):
+    """必须保留的部分已超出预算，无法通过裁剪放进模型上下文。"""
+
+    def __init__(self, tokens: int, budget: int):
+        super().__init__(f"Prompt needs {tokens} tokens, budget is {budget}")
+        self.tokens = tokens
+        self.budget = budget
+
+
+@lru_cache(maxsize=1)
+def _tokenizer():
+    """settings.AI_TOKENIZER_PATH 指向的 HuggingFace tokenizer.json（需安装 tokenizers），未配置或加载失败时为 None。"""
+    path = getattr(settings, 'AI_TOKENIZER_PATH', '')
+    if not path:
+        return None
+    try:
+        from tokenizers import Tokenizer
+        return Tokenizer.from_file(path)
+    except Exception as e:
+        logger.warning(f"Failed to load tokenizer from {path}, falling back to character estimate: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    tokenizer = _tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    cjk = len(CJK_RE.findall(text))
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) * OTHER_TOKENS_PER_CHAR)
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(m.get('content') or '') + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def prompt_token_limit(use_reasoning_model: bool) -> int:
+    """模型上下文长度减去为回复（推理模型还包括思维链）预留的 token 数。"""
+    limits = settings.AI_MODEL_TOKEN_LIMITS['reasoning' if use_reasoning_model else 'chat']
+    return limits['context'] - limits['completion']
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截断到不超过 max_tokens 个 token（含截断标记），保留开头部分。"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens - count_tokens(TRUNCATION_MARK)
+    if budget <= 0:
+        return ''
+    tokenizer = _tokenizer()
+    if tokenizer is not None:
+        offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+        return text[:offsets[budget - 1][1]] + TRUNCATION_MARK
+    # 估算模式下 token 数随前缀长度单调不减，二分查找最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + TRUNCATION_MARK
+
+
+@dataclass
+class Section:
+    """
+    prompt 中的一段上下文。priority 越小越先被裁剪；required 的段落不会被裁剪。
+    带 lines 的段落（如历史记录，按时间从旧到新）从最旧的一行开始整行丢弃，text 作为标题保留；
+    其余段落从尾部截断 text。
+    """
+    name: str
+    text: str = ''
+    lines: Optional[List[str]] = None
+    priority: int = 0
+    required: bool = False
+
+    def render(self) -> str:
+        if self.lines is None:
+            return self.text
+        return '\n'.join([self.text, *self.lines]) if self.text else '\n'.join(self.lines)
+
+
+@dataclass
+class PackedPrompt:
+    text: str
+    tokens: int
+    trimmed: List[str] = field(default_factory=list)  # 被裁剪过的段落名
+
+
+def pack_sections(sections: List[Section], budget_tokens: int, separator: str = '\n') -> PackedPrompt:
+    """
+    按原顺序拼接各段，超出 budget_tokens 时按 priority 从低到高裁剪，直到放得下。
+    只剩 required 段落仍超出预算时抛出 PromptTooLong。
+    """
+    sections = [Section(s.name, s.text, list(s.lines) if s.lines is not None else None, s.priority, s.required)
+                for s in sections]
+
+    def total_tokens() -> int:
+        return count_tokens(separator.join(s.render() for s in sections))
+
+    total = total_tokens()
+    trimmed = []
+    for section in sorted((s for s in sections if not s.required), key=lambda s: s.priority):
+        if total <= budget_tokens:
+            break
+        if section.lines is not None:
+            while section.lines and total > budget_tokens:
+                section.lines.pop(0)
+                total = total_tokens()
+        else:
+            # 各段单独估算时的取整误差会累积，截断后按拼接结果复核，仍超出则继续截短同一段
+            while section.text and total > budget_tokens:
+                allowance = count_tokens(section.text) - (total - budget_tokens)
+                section.text = truncate_to_tokens(section.text, max(allowance, 0))
+                total = total_tokens()
+        trimmed.append(section.name)
+
+    if total > budget_tokens:
+        raise PromptTooLong(total, budget_tokens)
+    if trimmed:
+        logger.info(f"Prompt trimmed to {total}/{budget_tokens} tokens (sections: {', '.join(trimmed)})")
+    return PackedPrompt(text=separator.join(s.render() for s in sections), tokens=total, trimmed=trimmed)
@@ -0,0 +1,53 @@
+# backend/utils/redis_lock.py
+# 基于 Redis 的租约锁：同一时间只允许一个进程执行某段逻辑（如 beat 定时任务重叠执行时只处理一次）
+import logging
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LEASE_KEY = "edu:lease:{name}"
+
+# 仅当租约仍属于自己时才删除，避免误删租约过期后被其他进程重新获取的租约
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_LOCK_URL, socket_timeout=2.0, socket_connect_timeout=2.0)
+    return _client
+
+
+@contextmanager
+def redis_lease(name: str, ttl: int) -> Iterator[bool]:
+    """
+    尝试获取名为 name 的租约，产出是否获取成功；持有者异常退出时租约在 ttl 秒后自动失效。
+    Redis 不可用时视为获取成功（与不加锁时行为一致），不因锁服务故障停掉定时任务。
+    """
+    key, token = LEASE_KEY.format(name=name), uuid.uuid4().hex
+    try:
+        acquired = bool(get_redis().set(key, token, nx=True, ex=ttl))
+    except redis.RedisError as e:
+        logger.warning(f"Lease {name} unavailable, running without it: {e}")
+        yield True
+        return
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                get_redis().eval(_RELEASE_SCRIPT, 1, key, token)
+            except redis.RedisError as e:
+                logger.warning(f"Failed to release lease {name}: {e}")